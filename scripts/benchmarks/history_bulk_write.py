@@ -0,0 +1,151 @@
+"""
+Benchmark del guardado de predicciones en el historial (upload_predictions).
+
+Compara, con la base de datos configurada en config.py, filas por segundo de:
+
+- per_row: el bucle anterior de /predict (add_prediction_to_upload por
+           predicción: un db.add y un commit por fila)
+- bulk:    UploadHistoryService.add_predictions_to_upload (sentencias de
+           HISTORY_BULK_BATCH_ROWS filas, COPY en PostgreSQL, un solo commit)
+
+Las predicciones son sintéticas, con la forma que devuelve /predict. Se guardan
+en una carga de historial creada para el benchmark, que se borra al terminar
+junto con sus predicciones.
+
+per_row tarda minutos con cientos de miles de filas: por encima de
+--per-row-max filas no se mide (se muestra "-").
+
+Uso (desde la raíz del repositorio):
+    python scripts/benchmarks/history_bulk_write.py --rows 1000 30000 300000 --repeat 3
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src"))
+sys.path.insert(0, SRC_DIR)
+
+import numpy as np
+
+from config import SessionLocal, engine
+from models.upload_history import UploadHistory, UploadPrediction
+from services.upload_history_service import UploadHistoryService
+
+FEATURES = ["nota_normalizada", "asistencia_normalizada", "inasistencia_normalizada", "conducta_encoded"]
+
+
+def synthetic_predictions(n_rows: int, seed: int = 0):
+    """Predicciones con la forma que devuelve /predict"""
+    rng = np.random.default_rng(seed)
+    probabilidades = rng.uniform(0, 1, n_rows).round(4)
+    inasistencia = rng.uniform(0, 60, n_rows).round(1)
+    contribuciones = rng.normal(0, 0.05, (n_rows, len(FEATURES))).round(4)
+    inicio = datetime.date(2025, 3, 1)
+    predictions = []
+    for i in range(n_rows):
+        riesgo = "Alto" if probabilidades[i] >= 0.7 else "Medio" if probabilidades[i] >= 0.4 else "Bajo"
+        predictions.append({
+            "id_estudiante": i + 1,
+            "nombre": f"Estudiante {i + 1}",
+            "nota_final": float(rng.integers(0, 21)),
+            "asistencia": float(100 - inasistencia[i]),
+            "inasistencia": float(inasistencia[i]),
+            "conducta": "Regular",
+            "fecha": (inicio + datetime.timedelta(days=i % 200)).isoformat(),
+            "tiempo_prediccion": 0.01,
+            "resultado_prediccion": "1" if probabilidades[i] >= 0.5 else "0",
+            "riesgo_desercion": riesgo,
+            "probabilidad_desercion": float(probabilidades[i]),
+            "model_version": "bench",
+            "feature_hash": f"{i:032x}",
+            "contributions": dict(zip(FEATURES, contribuciones[i].tolist())),
+            "risk_factors": ["Inasistencia alta"] if riesgo == "Alto" else []
+        })
+    return predictions
+
+
+def write_per_row(db, upload_id: int, predictions) -> None:
+    for pred in predictions:
+        risk_factors = pred.get("risk_factors")
+        UploadHistoryService.add_prediction_to_upload(
+            db=db,
+            upload_id=upload_id,
+            estudiante_id=pred.get("id_estudiante", 0),
+            nombre=pred.get("nombre", "Sin nombre"),
+            nota_final=pred.get("nota_final", 0),
+            conducta=pred.get("conducta", ""),
+            asistencia=pred.get("asistencia", 0),
+            inasistencia=pred.get("inasistencia", 0),
+            fecha=datetime.date.fromisoformat(pred["fecha"]) if pred.get("fecha") else None,
+            resultado_prediccion=pred.get("resultado_prediccion", "0"),
+            riesgo_desercion=pred.get("riesgo_desercion", "Bajo"),
+            probabilidad_desercion=pred.get("probabilidad_desercion", 0.0),
+            tiempo_prediccion=pred.get("tiempo_prediccion", 0.0),
+            risk_factors={"factors": risk_factors} if risk_factors else None,
+            model_version=pred.get("model_version"),
+            feature_hash=pred.get("feature_hash"),
+            contributions=pred.get("contributions")
+        )
+
+
+def write_bulk(db, upload_id: int, predictions) -> None:
+    UploadHistoryService.add_predictions_to_upload(db, upload_id, predictions)
+
+
+def measure(writer, upload_id: int, predictions, repeat: int) -> float:
+    """Mejor tiempo (segundos) de guardar todas las predicciones de la carga"""
+    best = float("inf")
+    for _ in range(repeat):
+        db = SessionLocal()
+        try:
+            UploadHistoryService.clear_upload_predictions(db, upload_id)
+            start = time.perf_counter()
+            writer(db, upload_id, predictions)
+            best = min(best, time.perf_counter() - start)
+            stored = db.query(UploadPrediction).filter(UploadPrediction.upload_history_id == upload_id).count()
+            if stored != len(predictions):
+                raise RuntimeError(f"{writer.__name__} guardó {stored} de {len(predictions)} predicciones")
+        finally:
+            db.close()
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 30_000, 300_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--per-row-max", type=int, default=30_000)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    upload = UploadHistoryService.create_upload_record(
+        db=db, filename="benchmark", original_filename="benchmark", file_path="benchmark", user_id=None
+    )
+    upload_id = upload.id
+    db.close()
+    try:
+        print(f"Motor: {engine.dialect.name}\n")
+        print(f"{'filas':>8} {'per_row (s)':>12} {'bulk (s)':>10} {'bulk filas/s':>14} {'mejora':>8}")
+        for n_rows in args.rows:
+            predictions = synthetic_predictions(n_rows)
+            bulk = measure(write_bulk, upload_id, predictions, args.repeat)
+            if n_rows <= args.per_row_max:
+                per_row = measure(write_per_row, upload_id, predictions, args.repeat)
+                per_row_text, speedup = f"{per_row:.2f}", f"{per_row / bulk:.0f}x"
+            else:
+                per_row_text, speedup = "-", "-"
+            print(f"{n_rows:>8} {per_row_text:>12} {bulk:>10.2f} {n_rows / bulk:>14,.0f} {speedup:>8}")
+    finally:
+        db = SessionLocal()
+        try:
+            UploadHistoryService.clear_upload_predictions(db, upload_id)
+            db.query(UploadHistory).filter(UploadHistory.id == upload_id).delete()
+            db.commit()
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
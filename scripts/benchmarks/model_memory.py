@@ -0,0 +1,113 @@
+"""
+Benchmark de memoria por worker al cargar el modelo de predicción.
+
+Lanza N procesos independientes (como los workers de uvicorn) con cada modo
+de carga (MODEL_LOAD_MODE=pickle y MODEL_LOAD_MODE=mmap), espera a que todos
+tengan el modelo cargado y haya predicho una vez, y reporta por worker:
+
+- RSS: memoria residente (cuenta las páginas compartidas completas)
+- PSS: memoria proporcional (las páginas compartidas se reparten entre procesos)
+- Private: páginas exclusivas del proceso
+
+Uso (desde la raíz del repositorio, Linux):
+    python scripts/benchmarks/model_memory.py --workers 4
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src"))
+
+
+def memory_stats():
+    """RSS, PSS y memoria privada del proceso actual en MB (/proc/self/smaps_rollup)"""
+    stats = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:", "Private_Clean:", "Private_Dirty:"):
+                stats[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss": stats["Rss"],
+        "pss": stats["Pss"],
+        "private": stats["Private_Clean"] + stats["Private_Dirty"]
+    }
+
+
+def run_worker():
+    """Carga el modelo, predice una vez y reporta su memoria cuando el padre lo pide"""
+    sys.path.insert(0, SRC_DIR)
+    import numpy as np
+    from models.model_registry import registry
+
+    bundle = registry.current()
+    n_features = len(bundle.config["feature_columns"])
+    X = np.random.default_rng(0).normal(size=(1000, n_features))
+    bundle.predict(X)
+
+    print("ready", flush=True)
+    sys.stdin.readline()
+    stats = memory_stats()
+    print(f"{stats['rss']:.1f} {stats['pss']:.1f} {stats['private']:.1f}", flush=True)
+
+
+def measure(mode, n_workers):
+    """Arranca n_workers procesos con el modo indicado y devuelve sus mediciones"""
+    env = dict(os.environ, MODEL_LOAD_MODE=mode)
+
+    if mode == "mmap":
+        # Igual que start.sh: exportar una vez antes de levantar los workers
+        subprocess.run(
+            [sys.executable, "-m", "models.model_registry", "export"],
+            cwd=SRC_DIR, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
+    workers = [
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--worker"],
+            env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        )
+        for _ in range(n_workers)
+    ]
+    for worker in workers:
+        if worker.stdout.readline().strip() != "ready":
+            raise RuntimeError(f"Un worker en modo {mode} no pudo cargar el modelo")
+
+    # Se mide con todos los workers vivos para que PSS refleje las páginas compartidas
+    results = []
+    for worker in workers:
+        worker.stdin.write("measure\n")
+        worker.stdin.flush()
+        rss, pss, private = (float(v) for v in worker.stdout.readline().split())
+        results.append({"rss": rss, "pss": pss, "private": private})
+    for worker in workers:
+        worker.stdin.close()
+        worker.wait()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker()
+        return
+
+    print(f"Workers por modo: {args.workers}\n")
+    print(f"{'modo':<8} {'RSS/worker':>12} {'PSS/worker':>12} {'Privada/worker':>15} {'PSS total':>11}")
+    for mode in ("pickle", "mmap"):
+        results = measure(mode, args.workers)
+        avg = {key: sum(r[key] for r in results) / len(results) for key in ("rss", "pss", "private")}
+        total_pss = sum(r["pss"] for r in results)
+        print(
+            f"{mode:<8} {avg['rss']:>9.1f} MB {avg['pss']:>9.1f} MB "
+            f"{avg['private']:>12.1f} MB {total_pss:>8.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
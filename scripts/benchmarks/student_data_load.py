@@ -0,0 +1,120 @@
+"""
+Benchmark de carga de estudiantes en student_data.
+
+Compara, con la base de datos configurada en config.py, filas por segundo de:
+
+- orm:  el bucle anterior de load_student_data (un StudentData + session.add por fila)
+- bulk: services.bulk_loader.bulk_insert (COPY FROM STDIN en PostgreSQL,
+        INSERT executemany en otros motores)
+
+Se usa una tabla temporal con la misma definición que student_data
+(student_data_bench), que se borra al terminar; los datos reales no se tocan.
+
+Uso (desde la raíz del repositorio):
+    python scripts/benchmarks/student_data_load.py --rows 100000 --repeat 3
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src"))
+sys.path.insert(0, SRC_DIR)
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import MetaData
+from sqlalchemy.orm import declarative_base
+
+from config import SessionLocal, engine
+from models import StudentData
+from services.bulk_loader import bulk_insert
+
+BENCH_TABLE = "student_data_bench"
+
+bench_table = StudentData.__table__.to_metadata(MetaData(), name=BENCH_TABLE)
+
+
+class StudentDataBench(declarative_base()):
+    __table__ = bench_table
+    id_estudiante = bench_table.c.estudiante_id
+
+
+def synthetic_students(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """Filas con la forma que arma load_student_data (nombres de columna de la BD)"""
+    rng = np.random.default_rng(seed)
+    inasistencia = rng.uniform(0, 60, n_rows).round(1)
+    return pd.DataFrame({
+        "estudiante_id": np.arange(1, n_rows + 1),
+        "nombre": [f"Estudiante {i}" for i in range(1, n_rows + 1)],
+        "nota_final": rng.integers(0, 21, n_rows).astype(float),
+        "conducta": rng.choice(["positivo", "neutral", "agresivo"], n_rows).astype(object),
+        "asistencia": (100 - inasistencia).round(1),
+        "inasistencia": inasistencia,
+        "fecha": np.full(n_rows, datetime.date(2025, 1, 1), dtype=object),
+        "created_at": datetime.datetime.utcnow()
+    })
+
+
+def load_orm(session, frame: pd.DataFrame) -> None:
+    for row in frame.itertuples(index=False):
+        session.add(StudentDataBench(
+            id_estudiante=row.estudiante_id,
+            nombre=row.nombre,
+            nota_final=row.nota_final,
+            conducta=row.conducta,
+            asistencia=row.asistencia,
+            inasistencia=row.inasistencia,
+            fecha=row.fecha,
+            created_at=row.created_at
+        ))
+
+
+def load_bulk(session, frame: pd.DataFrame) -> None:
+    bulk_insert(session, bench_table, frame)
+
+
+def measure(loader, frame: pd.DataFrame, repeat: int) -> float:
+    """Mejor tiempo (segundos) de cargar y confirmar todas las filas"""
+    best = float("inf")
+    for _ in range(repeat):
+        session = SessionLocal()
+        try:
+            session.execute(bench_table.delete())
+            session.commit()
+            start = time.perf_counter()
+            loader(session, frame)
+            session.commit()
+            best = min(best, time.perf_counter() - start)
+            if session.query(StudentDataBench).count() != len(frame):
+                raise RuntimeError(f"{loader.__name__} no cargó todas las filas")
+        finally:
+            session.close()
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    frame = synthetic_students(args.rows)
+    bench_table.drop(engine, checkfirst=True)
+    bench_table.create(engine)
+    try:
+        print(f"Motor: {engine.dialect.name}, filas: {args.rows}\n")
+        print(f"{'modo':<6} {'segundos':>10} {'filas/s':>12}")
+        results = {}
+        for name, loader in (("orm", load_orm), ("bulk", load_bulk)):
+            seconds = measure(loader, frame, args.repeat)
+            results[name] = seconds
+            print(f"{name:<6} {seconds:>10.2f} {args.rows / seconds:>12,.0f}")
+        print(f"\nbulk es {results['orm'] / results['bulk']:.1f}x más rápido")
+    finally:
+        bench_table.drop(engine, checkfirst=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark de lectura de cargas XLSX grandes.
+
+Genera un libro con --rows filas (con la estructura de las cargas reales, más
+una hoja de portada antes de la de datos) y mide, cada modo en un proceso
+aparte para que la memoria de uno no afecte al otro:
+
+- read_excel: pd.read_excel, la lectura anterior (todo el libro en memoria)
+- streaming:  services.ingestion_service.read_excel_file (openpyxl en modo
+              solo lectura, en bloques de XLSX_BATCH_ROWS filas)
+
+Se reportan el tiempo de lectura y el pico de memoria residente (ru_maxrss)
+por encima de la memoria del proceso antes de leer.
+
+Uso (desde la raíz del repositorio, Linux):
+    python scripts/benchmarks/xlsx_ingest.py --rows 200000 --repeat 3
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src"))
+
+SHEET = "Notas"
+MODES = ("read_excel", "streaming")
+
+
+def build_workbook(path, rows):
+    """Libro de prueba escrito en modo write_only (no queda entero en memoria)"""
+    import datetime
+    import numpy as np
+    from openpyxl import Workbook
+
+    rng = np.random.default_rng(0)
+    notas = rng.uniform(0, 20, rows).round(1)
+    asistencias = rng.uniform(40, 100, rows).round(1)
+    inasistencias = rng.uniform(0, 60, rows).round(1)
+    conductas = rng.choice(["Buena", "Regular", "Mala"], rows)
+    inicio = datetime.date(2024, 3, 1)
+
+    workbook = Workbook(write_only=True)
+    portada = workbook.create_sheet("Portada")
+    portada.append(["Reporte de notas"])
+    hoja = workbook.create_sheet(SHEET)
+    hoja.append(["estudiante_id", "nombre", "fecha", "nota_final", "asistencia", "inasistencia", "conducta"])
+    for i in range(rows):
+        hoja.append([
+            i + 1, f"Estudiante {i + 1}", inicio + datetime.timedelta(days=i % 200),
+            float(notas[i]), float(asistencias[i]), float(inasistencias[i]), str(conductas[i])
+        ])
+    workbook.save(path)
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_worker(mode, path):
+    """Lee el libro con el modo indicado e imprime 'segundos filas pico_mb'"""
+    sys.path.insert(0, SRC_DIR)
+    import pandas as pd
+    from services.ingestion_service import read_excel_file
+
+    base = max_rss_mb()
+    start = time.perf_counter()
+    if mode == "read_excel":
+        df = pd.read_excel(path, sheet_name=SHEET)
+    else:
+        df = read_excel_file(path, SHEET)
+    elapsed = time.perf_counter() - start
+    print(f"{elapsed:.3f} {len(df)} {max_rss_mb() - base:.1f}", flush=True)
+
+
+def measure(mode, path):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", mode, path],
+        check=True, capture_output=True, text=True
+    ).stdout.split()
+    return float(output[0]), int(output[1]), float(output[2])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--worker", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(*args.worker)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.xlsx")
+        start = time.perf_counter()
+        build_workbook(path, args.rows)
+        print(f"Libro de {args.rows} filas generado en {time.perf_counter() - start:.1f}s "
+              f"({os.path.getsize(path) / (1024 * 1024):.1f} MB)\n")
+
+        print(f"{'modo':<12}{'tiempo (s)':>12}{'filas/s':>12}{'pico MB':>10}")
+        for mode in MODES:
+            runs = [measure(mode, path) for _ in range(args.repeat)]
+            elapsed = min(run[0] for run in runs)
+            peak = min(run[2] for run in runs)
+            rows = runs[0][1]
+            print(f"{mode:<12}{elapsed:>12.2f}{rows / elapsed:>12.0f}{peak:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 # src/api/routes/dashboard_behavior.py
 
 from fastapi import APIRouter, Depends
-from src.services.behavior_service import BehaviorService
+from services.behavior_service import BehaviorService
 from pydantic import BaseModel
 import matplotlib.pyplot as plt
 from io import BytesIO
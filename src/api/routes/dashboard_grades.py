@@ -1,7 +1,7 @@
 # src/api/routes/dashboard_grades.py
 
 from fastapi import APIRouter, Depends
-from src.services.grades_service import GradesService
+from services.grades_service import GradesService
 from pydantic import BaseModel
 import matplotlib.pyplot as plt
 from io import BytesIO
@@ -0,0 +1,88 @@
+"""
+Rutas para consultar los trabajos en segundo plano de /upload y /predict
+(background=true). El id del trabajo es aleatorio; si el trabajo pertenece a un
+usuario, solo ese usuario o un administrador pueden verlo.
+"""
+
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from config import SessionLocal
+from services.executor_service import run_blocking
+from services.job_service import JobService, job_state_event
+from services.progress_service import progress_broker, event_stream, job_key
+from models.user import Usuario, RolEnum
+from utils.dependencies import get_db, get_current_user_optional
+
+router = APIRouter(prefix="/jobs", tags=["Trabajos en segundo plano"])
+
+
+def _get_visible_job(db: Session, job_id: str, current_user: Optional[Usuario]):
+    job = JobService.get_job(db, job_id)
+    if job and job.user_id is not None:
+        is_owner = current_user is not None and current_user.id == job.user_id
+        is_admin = current_user is not None and current_user.rol == RolEnum.ADMINISTRADOR
+        if not (is_owner or is_admin):
+            job = None
+    if not job:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job
+
+
+@router.get("/{job_id}")
+def get_job_status(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: Optional[Usuario] = Depends(get_current_user_optional)
+):
+    """
+    Estado completo del trabajo: etapa, avance, intentos y, al terminar, su
+    resultado o el error
+    """
+    return _get_visible_job(db, job_id, current_user).to_dict()
+
+
+@router.get("/{job_id}/progress")
+def get_job_progress(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: Optional[Usuario] = Depends(get_current_user_optional)
+):
+    """
+    Avance del trabajo (para consultar seguido): estado, etapa
+    (parse, predict, persist) y filas procesadas de la etapa
+    """
+    return _get_visible_job(db, job_id, current_user).progress_dict()
+
+
+def _read_job_state(job_id: str):
+    db = SessionLocal()
+    try:
+        return job_state_event(db, JobService.get_job(db, job_id))
+    finally:
+        db.close()
+
+
+@router.get("/{job_id}/events")
+async def stream_job_events(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: Optional[Usuario] = Depends(get_current_user_optional)
+):
+    """
+    Server-Sent Events del trabajo: 'status' con el estado al conectarse,
+    'stage' en cada cambio de etapa (parse, predict, persist), 'progress' con
+    las filas procesadas y al final 'complete' (resultado y estadísticas de la
+    carga) o 'error'. Los eventos los publica el propio flujo de predicción.
+    """
+    # La consulta va al pool de hilos: el handler es async (devuelve el stream)
+    await run_blocking(_get_visible_job, db, job_id, current_user)
+    subscription = progress_broker.subscribe(job_key(job_id))
+    return StreamingResponse(
+        event_stream(subscription, lambda: _read_job_state(job_id)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,58 @@
+"""
+Rutas para consultar y activar versiones del modelo de predicción
+Activar una versión la aplica en caliente, sin reiniciar los workers
+"""
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from models.model_registry import registry, RELOAD_CHECK_SECONDS
+from models.prediction_cache import prediction_cache, get_prediction_cache_stats
+from services.executor_service import PREDICTION_PROCESS_WORKERS, run_cpu_bound
+from models.user import Usuario
+from utils.dependencies import get_current_user, require_admin
+
+router = APIRouter(prefix="/models", tags=["Versiones del Modelo"])
+
+
+@router.get("")
+async def list_model_versions(current_user: Usuario = Depends(get_current_user)):
+    """
+    Lista las versiones registradas y la versión activa en este worker
+    """
+    return {
+        "active_version": registry.current().version,
+        "versions": registry.list_versions()
+    }
+
+
+@router.get("/cache")
+async def prediction_cache_stats(current_user: Usuario = Depends(get_current_user)):
+    """
+    Aciertos y fallos del caché de predicciones. /predict calcula en el pool de
+    procesos y el modo streaming en el propio worker: cada uno tiene su caché.
+    """
+    return {
+        "worker": prediction_cache.stats(),
+        "prediction_process": await run_cpu_bound(get_prediction_cache_stats) if PREDICTION_PROCESS_WORKERS > 0 else None
+    }
+
+
+@router.post("/{version}/activate")
+async def activate_model_version(version: str, current_user: Usuario = Depends(require_admin)):
+    """
+    Activa una versión del modelo. Este worker cambia de inmediato; los demás
+    la toman en su próxima revisión del puntero ACTIVE.
+    """
+    try:
+        bundle = registry.activate(version)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al cargar la versión {version}: {str(e)}")
+
+    return {
+        "message": f"Versión {bundle.version} activada",
+        "active_version": bundle.version,
+        "metadata": bundle.metadata,
+        "workers_sync_seconds": RELOAD_CHECK_SECONDS
+    }
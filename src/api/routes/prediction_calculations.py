@@ -1,22 +1,29 @@
 # src/api/routes/prediction_calculations.py
 
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from src.services.prediction_service import predict_dropout
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+
+from models.user import Usuario
+from services.prediction_service import prediction_batcher
+from utils.dependencies import get_current_user
 
 router = APIRouter()
 
-# Definimos el modelo de datos para la entrada
-class StudentData(BaseModel):
-    calificacion: float
-    asistencia: float
-    conducta: str
+# Definimos el modelo de datos para la entrada (mismas columnas que el CSV de /predict)
+class StudentPredictionRequest(BaseModel):
+    estudiante_id: Optional[int] = None
+    nombre: Optional[str] = None
+    nota_final: float = Field(..., ge=0, le=20)
+    asistencia: float = Field(..., ge=0, le=100)
+    inasistencia: float = Field(..., ge=0, le=100)
+    conducta: str = Field("neutral", description="positivo, neutral o agresivo")
 
-# Endpoint para realizar la predicción de deserción
+# Endpoint para realizar la predicción de deserción de un estudiante en tiempo real
 @router.post("/predict_dropout")
-async def predict_dropout_api(student: StudentData):
+async def predict_dropout_api(student: StudentPredictionRequest, current_user: Usuario = Depends(get_current_user)):
     try:
-        result = predict_dropout(student.calificacion, student.asistencia, student.conducta)
-        return result
+        return await prediction_batcher.predict(student.model_dump())
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al realizar la predicción: {e}")
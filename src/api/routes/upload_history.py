@@ -1,11 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Body
+from fastapi import APIRouter, Depends, HTTPException, Query, Body, Request
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
 from pydantic import BaseModel
 
+from fastapi.responses import StreamingResponse
+
+from config import SessionLocal
 from utils.dependencies import get_db, get_current_user
 from services.upload_history_service import UploadHistoryService
+from services.progress_service import progress_broker, event_stream, upload_key
+from services.upload_storage import is_compressed, iter_stored, resolve_stored_path, source_extension
 from models.user import Usuario, RolEnum
 
 router = APIRouter()
@@ -33,6 +38,10 @@ class UploadHistoryResponse(BaseModel):
     error_message: Optional[str]
     notes: Optional[str]
     processing_time: Optional[float]
+    model_version: Optional[str] = None
+    content_hash: Optional[str] = None
+    sheet_name: Optional[str] = None
+    batch_id: Optional[int] = None
 
 
 class PredictionResponse(BaseModel):
@@ -44,12 +53,15 @@ class PredictionResponse(BaseModel):
     conducta: Optional[str]
     asistencia: float
     inasistencia: Optional[float]
+    fecha: Optional[str] = None
     resultado_prediccion: str
     riesgo_desercion: Optional[str]
     probabilidad_desercion: Optional[float]
     risk_factors: Optional[str]
+    contributions: Optional[str] = None
     tiempo_prediccion: float
     fecha_prediccion: Optional[str]
+    model_version: Optional[str] = None
 
 
 class UpdateNotesRequest(BaseModel):
@@ -91,6 +103,30 @@ async def get_upload_history(
     return [upload.to_dict() for upload in uploads]
 
 
+@router.get("/history/batches/{batch_id}")
+async def get_batch_detail(
+    batch_id: int,
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """
+    Obtener una carga por lotes con los totales y la carga de cada archivo
+    """
+    is_admin = current_user.rol == RolEnum.ADMINISTRADOR
+
+    batch = UploadHistoryService.get_batch_by_id(
+        db=db,
+        batch_id=batch_id,
+        user_id=current_user.id,
+        is_admin=is_admin
+    )
+
+    if not batch:
+        raise HTTPException(status_code=404, detail="Lote no encontrado")
+
+    return {**batch.to_dict(), "files": [upload.to_dict() for upload in batch.uploads]}
+
+
 @router.get("/history/{upload_id}", response_model=UploadHistoryResponse)
 async def get_upload_detail(
     upload_id: int,
@@ -115,6 +151,50 @@ async def get_upload_detail(
     return upload.to_dict()
 
 
+def _read_upload_state(upload_id: int):
+    """Estado guardado de la carga como evento SSE ('status' mientras sigue en 'processing')"""
+    db = SessionLocal()
+    try:
+        upload = UploadHistoryService.get_upload_by_id(db, upload_id, is_admin=True)
+        if upload is None:
+            return "error", {"upload_id": upload_id, "error_message": "Carga no encontrada"}
+        data = upload.to_dict()
+        if upload.status == 'processing':
+            return "status", data
+        return ("error" if upload.status == 'error' else "complete"), data
+    finally:
+        db.close()
+
+
+@router.get("/history/{upload_id}/events")
+async def stream_upload_events(
+    upload_id: int,
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """
+    Server-Sent Events de la carga mientras se procesa: 'stage' en cada cambio
+    de etapa (parse, predict, persist), 'progress' con las filas procesadas y
+    al final 'complete' o 'error' con las estadísticas de la carga
+    """
+    is_admin = current_user.rol == RolEnum.ADMINISTRADOR
+    upload = UploadHistoryService.get_upload_by_id(
+        db=db,
+        upload_id=upload_id,
+        user_id=current_user.id,
+        is_admin=is_admin
+    )
+    if not upload:
+        raise HTTPException(status_code=404, detail="Carga no encontrada")
+
+    subscription = progress_broker.subscribe(upload_key(upload_id))
+    return StreamingResponse(
+        event_stream(subscription, lambda: _read_upload_state(upload_id)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/history/{upload_id}/predictions", response_model=List[PredictionResponse])
 async def get_upload_predictions(
     upload_id: int,
@@ -240,17 +320,29 @@ async def compare_uploads(
     return comparison
 
 
+# Tipo de contenido de la descarga según el formato original
+DOWNLOAD_MEDIA_TYPES = {
+    '.csv': 'text/csv',
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
+
+
 @router.get("/history/{upload_id}/download")
 async def download_original_csv(
     upload_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: Usuario = Depends(get_current_user)
 ):
     """
-    Descargar el archivo CSV original
+    Descargar el archivo original.
+
+    Si está guardado comprimido y el cliente acepta gzip, se envían los bytes
+    guardados con Content-Encoding: gzip (el navegador los descomprime); si no,
+    se descomprime al vuelo.
     """
     from fastapi.responses import FileResponse
-    import os
+    from urllib.parse import quote
 
     is_admin = current_user.rol == RolEnum.ADMINISTRADOR
 
@@ -264,14 +356,22 @@ async def download_original_csv(
     if not upload:
         raise HTTPException(status_code=404, detail="Carga no encontrada")
 
-    if not os.path.exists(upload.file_path):
+    file_path = resolve_stored_path(upload.file_path)
+    if not file_path:
         raise HTTPException(status_code=404, detail="Archivo no encontrado en el servidor")
 
-    return FileResponse(
-        path=upload.file_path,
-        filename=upload.original_filename,
-        media_type='text/csv'
-    )
+    media_type = DOWNLOAD_MEDIA_TYPES.get(source_extension(file_path), 'application/octet-stream')
+    if not is_compressed(file_path):
+        return FileResponse(path=file_path, filename=upload.original_filename, media_type=media_type)
+
+    headers = {
+        'Content-Disposition': f"attachment; filename*=utf-8''{quote(upload.original_filename)}",
+        'Vary': 'Accept-Encoding'
+    }
+    if 'gzip' in request.headers.get('accept-encoding', '').lower():
+        headers['Content-Encoding'] = 'gzip'
+        return FileResponse(path=file_path, media_type=media_type, headers=headers)
+    return StreamingResponse(iter_stored(file_path), media_type=media_type, headers=headers)
 
 
 @router.get("/history/{upload_id}/export")
@@ -313,8 +413,7 @@ async def export_predictions(
     df = pd.DataFrame(data)
 
     # Eliminar campos innecesarios
-    if 'risk_factors' in df.columns:
-        df = df.drop('risk_factors', axis=1)
+    df = df.drop(columns=[col for col in ('risk_factors', 'contributions') if col in df.columns])
 
     # Exportar según formato
     if format == "excel":
@@ -1,21 +1,36 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from upload import save_uploaded_file, clear_previous_data
-from models.predictor import predict_desertion
+from upload import (
+    save_uploaded_file, load_student_data, clear_previous_data, extract_batch_members,
+    UploadTooLargeError, InvalidBatchError, MAX_BATCH_UPLOAD_BYTES
+)
+from models.predictor import (
+    predict_desertion, predict_desertion_stream, score_upload_file, store_stored_results, STREAM_CHUNK_SIZE
+)
+from models.model_registry import registry
 from services.risk_service import update_latest_predictions, clear_latest_predictions
 from services.attendance_service import update_attendance_data, clear_latest_csv_data
 from services.upload_history_service import UploadHistoryService
-from fastapi.responses import JSONResponse
+from services.executor_service import run_blocking, run_cpu_bound, run_cpu_bound_many, shutdown_executors
+from services.ingestion_service import count_upload_rows, ensure_ingested, source_sheet, SheetNotFoundError
+from services.upload_schema import MalformedUploadError
+from services.upload_storage import resolve_stored_path
+from services.job_service import JobService, job_pool
+from services.progress_service import progress_broker, upload_key
+from fastapi.responses import JSONResponse, StreamingResponse
 import pandas as pd
 import os
 import time
-from api.routes import dashboard_attendance, dashboard_risk, auth, users, admin_panel, upload_history, db_admin
+import json
+from typing import Optional
+from api.routes import dashboard_attendance, dashboard_risk, auth, users, admin_panel, upload_history, db_admin, model_versions, prediction_calculations, jobs
 from config import Base, engine, SessionLocal
 
 # IMPORTANTE: Importar TODOS los modelos ANTES de crear las tablas
 from models.user import Usuario
 from models.upload_history import UploadHistory, UploadPrediction
 from models import ResultadoPrediccion, StudentData
+from services.prediction_run_service import current_results, clear_current_run
 
 from utils.dependencies import get_current_user_optional
 
@@ -46,12 +61,29 @@ print("🔄 Servidor iniciado - Variables globales limpiadas")
 
 app = FastAPI(title="Eduforge API", version="1.0.0")
 
+# Espera máxima al apagar por los trabajos en curso (los que no terminen se reencolan al volver)
+JOB_SHUTDOWN_TIMEOUT = float(os.getenv("JOB_SHUTDOWN_TIMEOUT", "10"))
+
+@app.on_event("startup")
+def start_job_workers():
+    """Inicia el pool de trabajos en segundo plano (recupera antes los interrumpidos)"""
+    job_pool.start()
+
+@app.on_event("shutdown")
+def close_executors():
+    """Detiene el pool de trabajos y cierra los pools de procesos e hilos de la capa de ejecución"""
+    job_pool.stop(timeout=JOB_SHUTDOWN_TIMEOUT)
+    shutdown_executors()
+
 # Incluir routers para los dashboards
 app.include_router(auth.router, prefix="/auth", tags=["Autenticación"])
 app.include_router(admin_panel.router, tags=["Panel de Administración"])
 app.include_router(users.router, prefix="/api", tags=["Gestión de Usuarios"])
 app.include_router(upload_history.router, prefix="/api", tags=["Historial de Cargas"])
 app.include_router(db_admin.router, prefix="/api", tags=["Administración de Base de Datos"])
+app.include_router(model_versions.router, prefix="/api", tags=["Versiones del Modelo"])
+app.include_router(prediction_calculations.router, prefix="/api", tags=["Predicción Individual"])
+app.include_router(jobs.router, prefix="/api", tags=["Trabajos en segundo plano"])
 app.include_router(dashboard_attendance.router, prefix="/dashboard_attendance")
 app.include_router(dashboard_risk.router, prefix="/dashboard_risk")
 
@@ -80,7 +112,7 @@ async def root():
     }
 
 @app.get("/api/diagnostico-bd")
-async def diagnostico_bd():
+def diagnostico_bd():
     """
     Endpoint de diagnóstico para verificar el estado de la base de datos
     SOLO para debugging - ELIMINAR en producción final
@@ -131,42 +163,589 @@ async def diagnostico_bd():
         }
 
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...), current_user: Usuario = Depends(get_current_user_optional)):
+async def upload_file(file: UploadFile = File(...), sheet: Optional[str] = None, background: bool = False,
+                      current_user: Usuario = Depends(get_current_user_optional)):
+    """
+    Guarda el archivo subido y carga sus estudiantes.
+
+    Con background=true, después de guardar el archivo la carga de estudiantes
+    queda como trabajo en segundo plano y la respuesta (202) trae su job_id.
+
+    El archivo se guarda con el hash de su contenido como nombre: "filename"
+    en la respuesta es ese nombre guardado (el que recibe /predict) y
+    "original_filename" el nombre subido.
+
+    En archivos XLSX, sheet elige la hoja a leer (por defecto la primera); la
+    hoja queda registrada en la carga y /predict la usa con su upload_id.
+    """
     try:
-        # Limpiar datos anteriores antes de cargar el nuevo archivo
-        clear_previous_data()
+        # Copiar el archivo a disco por bloques (con límite de tamaño y hash)
+        saved = await save_uploaded_file(file)
+        file_path = saved.path
+        stored_filename = os.path.basename(file_path)
+        sheet = source_sheet(file_path, sheet)
 
-        file_path = await save_uploaded_file(file)
+        if background:
+            job = await run_blocking(enqueue_parse_job, file.filename, saved, current_user.id if current_user else None,
+                                     sheet)
+            job_pool.notify()
+            print(f"📥 Archivo guardado en: {file_path}, carga en segundo plano (trabajo {job.id})")
+            return job_accepted_response(
+                job,
+                filename=stored_filename,
+                original_filename=file.filename,
+                filepath=file_path,
+                size=saved.size,
+                sha256=saved.sha256,
+                already_stored=saved.existing,
+                sheet=sheet
+            )
 
-        # Guardar en historial si hay usuario autenticado
+        # Validar e ingerir el archivo antes de tocar el dashboard: uno mal
+        # formado se rechaza (400) sin borrar las predicciones que se muestran
+        await run_blocking(ensure_ingested, file_path, sheet)
+
+        # Guardar en historial si hay usuario autenticado; los estudiantes se cargan con su upload_id
         upload_id = None
         if current_user:
-            db = SessionLocal()
-            upload_record = UploadHistoryService.create_upload_record(
-                db=db,
-                filename=file.filename,
-                original_filename=file.filename,
-                file_path=file_path,
-                user_id=current_user.id
-            )
-            upload_id = upload_record.id
-            db.close()
+            upload_id = await run_blocking(create_upload_history, file.filename, saved, current_user.id, sheet)
+
+        # Limpiar datos anteriores solo cuando el nuevo archivo ya fue aceptado
+        # (load_student_data lee el archivo de la caché recién creada)
+        try:
+            await run_blocking(clear_previous_data)
+            await run_blocking(load_student_data, file_path, sheet, upload_id)
+        except Exception:
+            # Una carga que no se pudo ingerir no queda en el historial
+            if upload_id:
+                await run_blocking(discard_upload_history, upload_id)
+            raise
 
-        print(f"✅ Archivo guardado en: {file_path}")
+        print(f"✅ Archivo guardado en: {file_path}{' (contenido ya guardado)' if saved.existing else ''}")
         return {
             "success": True,
             "message": f"Archivo '{file.filename}' guardado correctamente",
-            "filename": file.filename,
+            "filename": stored_filename,
+            "original_filename": file.filename,
             "filepath": file_path,
             "upload_id": upload_id,
+            "size": saved.size,
+            "sha256": saved.sha256,
+            "already_stored": saved.existing,
+            "sheet": sheet,
             "dashboard_reset": True
         }
+    except UploadTooLargeError as e:
+        print(f"❌ Archivo rechazado: {str(e)}")
+        raise HTTPException(status_code=413, detail=str(e))
+    except (SheetNotFoundError, MalformedUploadError) as e:
+        print(f"❌ Archivo rechazado: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"❌ Error en upload: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error al subir archivo: {str(e)}")
 
+def job_accepted_response(job, **extra) -> JSONResponse:
+    """Respuesta 202 de un trabajo encolado (o del que ya estaba en curso)"""
+    content = {
+        "success": True,
+        "job_id": job.id,
+        "status": job.status,
+        "upload_id": job.upload_history_id,
+        "status_url": f"/api/jobs/{job.id}",
+        "progress_url": f"/api/jobs/{job.id}/progress"
+    }
+    content.update(extra)
+    return JSONResponse(status_code=202, content=content)
+
+def enqueue_parse_job(filename: str, saved, user_id: int = None, sheet: Optional[str] = None):
+    """Encola la carga de estudiantes de un archivo ya guardado; un reintento recibe el trabajo en curso"""
+    dedupe_key = f"parse:{saved.sha256}:{filename}:{sheet or ''}"
+    db = SessionLocal()
+    try:
+        existing = JobService.find_active(db, dedupe_key)
+        if existing:
+            return existing
+
+        upload_id = None
+        if user_id:
+            upload_id = UploadHistoryService.create_upload_record(
+                db=db,
+                filename=os.path.basename(saved.path),
+                original_filename=filename,
+                file_path=saved.path,
+                user_id=user_id,
+                content_hash=saved.sha256,
+                sheet_name=sheet
+            ).id
+        job, _ = JobService.enqueue(
+            db, 'parse', {"file_path": saved.path, "filename": os.path.basename(saved.path), "sheet": sheet},
+            user_id=user_id, upload_id=upload_id, dedupe_key=dedupe_key
+        )
+        return job
+    finally:
+        db.close()
+
+def run_parse_job(job, params, progress):
+    """Trabajo 'parse': limpia el dashboard y carga los estudiantes del archivo"""
+    progress('parse')
+    file_path = resolve_stored_path(params['file_path']) or params['file_path']
+    # Validar e ingerir antes de limpiar el dashboard (un archivo mal formado no lo borra)
+    ensure_ingested(file_path, params.get('sheet'))
+    clear_previous_data()
+    load_student_data(file_path, params.get('sheet'), job.upload_history_id)
+    total_rows, _ = count_upload_rows(file_path, params.get('sheet'))
+    progress('parse', total_rows, total_rows)
+    print(f"✅ Archivo cargado en segundo plano: {file_path}")
+    return {
+        "filename": os.path.basename(file_path),
+        "filepath": file_path,
+        "upload_id": job.upload_history_id,
+        "total_students": total_rows,
+        "sheet": params.get('sheet'),
+        "dashboard_reset": True
+    }
+
+def create_upload_history(original_filename: str, saved, user_id: int, sheet: Optional[str] = None) -> int:
+    """Registra la carga (con el hash de su contenido) en el historial y devuelve su id"""
+    db = SessionLocal()
+    try:
+        upload_record = UploadHistoryService.create_upload_record(
+            db=db,
+            filename=os.path.basename(saved.path),
+            original_filename=original_filename,
+            file_path=saved.path,
+            user_id=user_id,
+            content_hash=saved.sha256,
+            sheet_name=sheet
+        )
+        return upload_record.id
+    finally:
+        db.close()
+
+def discard_upload_history(upload_id: int) -> None:
+    """Elimina del historial una carga que falló al ingerirse (con sus estudiantes)"""
+    db = SessionLocal()
+    try:
+        UploadHistoryService.delete_upload(db, upload_id, is_admin=True)
+    finally:
+        db.close()
+
+@app.post("/upload/batch")
+async def upload_batch(file: UploadFile = File(...), current_user: Usuario = Depends(get_current_user_optional)):
+    """
+    Carga por lotes: un zip con varios CSV/XLSX (de la primera hoja).
+
+    Cada archivo queda como una carga propia en el historial (con sus
+    predicciones y estadísticas) y todas cuelgan de un registro del lote con
+    los totales. Los archivos se puntúan en paralelo, uno por proceso del pool
+    de lotes; uno que falla queda con error sin detener a los demás, y uno con
+    el mismo contenido que una carga ya puntuada reutiliza sus predicciones.
+
+    Los dashboards quedan con los estudiantes y predicciones de todos los
+    archivos del lote. La respuesta trae el resumen del lote y de cada archivo
+    (las predicciones se consultan en el historial de cada carga).
+    """
+    start_time = time.time()
+    try:
+        saved = await save_uploaded_file(file, MAX_BATCH_UPLOAD_BYTES)
+        members = await run_blocking(extract_batch_members, saved.path)
+    except UploadTooLargeError as e:
+        print(f"❌ Lote rechazado: {str(e)}")
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidBatchError as e:
+        print(f"❌ Lote rechazado: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        batch_id, upload_ids = await run_blocking(
+            create_batch_history, file.filename, saved, members, current_user.id if current_user else None
+        )
+        print(f"📦 Lote {batch_id}: {len(members)} archivos en {saved.path}")
+
+        # Archivos ya puntuados con el mismo contenido: se copian sus predicciones
+        results = await run_blocking(copy_batch_duplicates, upload_ids, start_time)
+
+        # El resto se puntúa en paralelo, una vez por contenido distinto
+        pending = list(dict.fromkeys(
+            member.saved.path for member, upload_id in zip(members, upload_ids) if upload_id not in results
+        ))
+        scored = dict(zip(pending, await run_cpu_bound_many(score_upload_file, [(path,) for path in pending])))
+
+        for member, upload_id in zip(members, upload_ids):
+            if upload_id in results:
+                continue
+            predictions = scored[member.saved.path]
+            if isinstance(predictions, Exception):
+                print(f"❌ {member.original_filename}: {predictions}")
+                await run_blocking(record_upload_error, upload_id, start_time, str(predictions))
+            else:
+                await run_blocking(record_upload_results, upload_id, predictions, len(predictions), start_time)
+                results[upload_id] = predictions
+
+        loaded_uploads = [
+            (member.saved.path, upload_id) for member, upload_id in zip(members, upload_ids) if upload_id in results
+        ]
+        all_predictions = [pred for upload_id in upload_ids for pred in results.get(upload_id, [])]
+        if all_predictions:
+            await run_blocking(load_batch_dashboards, batch_id, loaded_uploads, all_predictions)
+
+        batch, uploads = await run_blocking(finish_batch_history, batch_id, upload_ids, time.time() - start_time)
+        print(f"✅ Lote {batch_id}: {batch['processed_files']}/{batch['total_files']} archivos, "
+              f"{batch['processed_students']} predicciones")
+        return {
+            "success": batch['status'] != 'error',
+            "message": f"Lote '{file.filename}' procesado: {batch['processed_files']} de {batch['total_files']} archivos",
+            "batch_id": batch_id,
+            "batch": batch,
+            "files": uploads,
+            "dashboard_reset": bool(all_predictions)
+        }
+    except Exception as e:
+        print(f"❌ Error en upload por lotes: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error al procesar el lote: {str(e)}")
+
+def create_batch_history(original_filename: str, saved, members, user_id: Optional[int]):
+    """Registra el lote y una carga por archivo; devuelve (id del lote, ids de las cargas en el orden de members)"""
+    db = SessionLocal()
+    try:
+        batch = UploadHistoryService.create_batch_record(
+            db=db,
+            filename=os.path.basename(saved.path),
+            original_filename=original_filename,
+            file_path=saved.path,
+            user_id=user_id,
+            content_hash=saved.sha256
+        )
+        upload_ids = [
+            UploadHistoryService.create_upload_record(
+                db=db,
+                filename=os.path.basename(member.saved.path),
+                original_filename=member.original_filename,
+                file_path=member.saved.path,
+                user_id=user_id,
+                content_hash=member.saved.sha256,
+                batch_id=batch.id
+            ).id
+            for member in members
+        ]
+        return batch.id, upload_ids
+    finally:
+        db.close()
+
+def copy_batch_duplicates(upload_ids, start_time: float):
+    """Copia las predicciones de los archivos del lote ya puntuados antes; devuelve {upload_id: predicciones}"""
+    db = SessionLocal()
+    try:
+        results = {}
+        for upload_id in upload_ids:
+            copied = copy_scored_duplicate(db, upload_id, start_time)
+            if copied:
+                _, upload, results[upload_id] = copied
+                publish_upload_finished(upload)
+        return results
+    finally:
+        db.close()
+
+def load_batch_dashboards(batch_id: int, loaded_uploads, predictions):
+    """
+    Carga en student_data los estudiantes de cada archivo del lote (con su
+    upload_id) y deja resultados_prediccion y los dashboards con todos ellos
+    """
+    clear_previous_data()
+    for file_path, upload_id in loaded_uploads:
+        load_student_data(file_path, upload_id=upload_id)
+    store_stored_results(predictions, batch_id=batch_id)
+    update_latest_predictions(predictions)
+    update_attendance_data(predictions)
+
+def finish_batch_history(batch_id: int, upload_ids, processing_time: float):
+    """Totales del lote a partir de sus cargas; devuelve (lote, cargas) como diccionarios"""
+    db = SessionLocal()
+    try:
+        batch = UploadHistoryService.update_batch_stats(db, batch_id, processing_time)
+        uploads = [UploadHistoryService.get_upload_by_id(db, upload_id, is_admin=True) for upload_id in upload_ids]
+        return batch.to_dict(), [upload.to_dict() for upload in uploads]
+    finally:
+        db.close()
+
+# Filas que el modo streaming conserva en memoria para los dashboards;
+# el resultado completo queda en la base de datos
+STREAM_DASHBOARD_ROWS = int(os.getenv("STREAM_DASHBOARD_ROWS", "50000"))
+
+def save_predictions_to_history(db, upload_id: int, predictions):
+    """Guarda las predicciones de una carga en el historial (en bloque, una sola transacción)"""
+    UploadHistoryService.add_predictions_to_upload(db, upload_id, predictions)
+
+def load_previous_predictions(upload_id: int):
+    """Predicciones de la carga anterior del mismo usuario (modo incremental)"""
+    db = SessionLocal()
+    try:
+        return UploadHistoryService.get_previous_predictions(db, upload_id)
+    finally:
+        db.close()
+
+def resolve_sheet(file_path: str, upload_id: int = None, sheet: Optional[str] = None) -> Optional[str]:
+    """Hoja a predecir: la pedida o, si no se indica, la elegida al subir la carga"""
+    if sheet is None and upload_id:
+        db = SessionLocal()
+        try:
+            upload = UploadHistoryService.get_upload_by_id(db, upload_id, is_admin=True)
+            sheet = upload.sheet_name if upload else None
+        finally:
+            db.close()
+    return source_sheet(file_path, sheet)
+
+def copy_scored_duplicate(db, upload_id: int, start_time: float, sheet: Optional[str] = None):
+    """
+    Si otra carga con el mismo contenido ya fue puntuada por la versión actual
+    del modelo, copia sus predicciones y estadísticas a esta carga en el
+    historial. Devuelve (id de la carga original, carga actualizada,
+    predicciones) o None si no hay una carga reutilizable.
+    """
+    upload = UploadHistoryService.get_upload_by_id(db, upload_id, is_admin=True)
+    if upload is None or upload.sheet_name != sheet:
+        return None
+    source = UploadHistoryService.find_scored_duplicate(
+        db, upload.content_hash, registry.current().version, exclude_upload_id=upload_id, sheet_name=sheet
+    )
+    if source is None:
+        return None
+
+    # Un reintento no duplica lo que alcanzó a guardar
+    UploadHistoryService.clear_upload_predictions(db, upload_id)
+    publish_upload_progress(upload_id, 'persist', 0, source.processed_students)
+    UploadHistoryService.copy_upload_predictions(db, source.id, upload_id)
+    predictions = UploadHistoryService.get_stored_results(db, upload_id)
+
+    upload = UploadHistoryService.update_upload_stats(
+        db=db,
+        upload_id=upload_id,
+        total_students=source.total_students,
+        processed_students=source.processed_students,
+        failed_students=source.failed_students,
+        high_risk=source.high_risk_count,
+        medium_risk=source.medium_risk_count,
+        low_risk=source.low_risk_count,
+        processing_time=time.time() - start_time,
+        status='success',
+        model_version=source.model_version
+    )
+    print(f"♻️ Carga {upload_id}: mismo contenido que la carga {source.id}, {len(predictions)} predicciones reutilizadas")
+    return source.id, upload, predictions
+
+def reuse_scored_upload(upload_id: int, start_time: float, sheet: Optional[str] = None):
+    """
+    Como copy_scored_duplicate, y además deja los dashboards y
+    resultados_prediccion como si se hubiera predicho. Devuelve (id de la
+    carga original, predicciones) o None si no hay una carga reutilizable.
+    """
+    db = SessionLocal()
+    try:
+        copied = copy_scored_duplicate(db, upload_id, start_time, sheet)
+        if copied is None:
+            return None
+        source_upload_id, upload, predictions = copied
+
+        store_stored_results(predictions, upload_id=upload_id)
+        update_latest_predictions(predictions)
+        update_attendance_data(predictions)
+
+        publish_upload_finished(upload)
+        return source_upload_id, predictions
+    finally:
+        db.close()
+
+def deduplicated_summary(upload_id: int, source_upload_id: int, predictions, start_time: float, incremental: bool):
+    """Resumen (como el de record_prediction_chunks) de una carga deduplicada"""
+    counts = {'Alto': 0, 'Medio': 0, 'Bajo': 0}
+    for pred in predictions:
+        counts[pred['riesgo_desercion']] += 1
+    summary = {
+        "model_version": predictions[0].get('model_version') if predictions else None,
+        "processed_students": len(predictions),
+        "high_risk": counts['Alto'],
+        "medium_risk": counts['Medio'],
+        "low_risk": counts['Bajo'],
+        "processing_time": time.time() - start_time,
+        "deduplicated": {"source_upload_id": source_upload_id}
+    }
+    if incremental:
+        summary["incremental"] = {
+            "previous_upload_id": source_upload_id,
+            "reused": len(predictions),
+            "rescored": 0
+        }
+    return summary
+
+def count_reused(predictions, previous) -> int:
+    """Cuántas predicciones se tomaron de la carga anterior sin recalcular"""
+    return sum(
+        1 for pred in predictions
+        if previous.get(pred.get('id_estudiante'), {}).get('feature_hash') == pred.get('feature_hash')
+    )
+
+def publish_upload_progress(upload_id: int, stage: str, processed: int = None, total: int = None):
+    """Avance de una carga procesada en el request (sin trabajo) para los clientes SSE"""
+    if upload_id:
+        progress_broker.progress([upload_key(upload_id)], stage, processed, total)
+
+def publish_upload_finished(upload):
+    """Evento final de la carga, con sus estadísticas del historial, para los clientes SSE"""
+    if upload is not None:
+        event = 'error' if upload.status == 'error' else 'complete'
+        progress_broker.publish([upload_key(upload.id)], event, upload.to_dict())
+
+def record_prediction_chunks(file_path: str, upload_id: int, chunk_size: int, start_time: float,
+                             previous=None, previous_upload_id: int = None, progress=None,
+                             sheet: Optional[str] = None):
+    """
+    Predice el archivo bloque a bloque guardando cada bloque en el historial.
+    Entrega las predicciones de cada bloque y, al terminar, devuelve (como valor
+    de retorno del generador) el resumen de la carga.
+
+    progress(stage, processed) se llama antes de predecir y de guardar cada bloque.
+    """
+    db = SessionLocal() if upload_id else None
+    dashboard_rows = []
+    counts = {'Alto': 0, 'Medio': 0, 'Bajo': 0}
+    processed_count = 0
+    reused_count = 0
+    model_version = None
+
+    try:
+        if progress:
+            progress('predict', 0)
+        for chunk in predict_desertion_stream(file_path, chunk_size, previous, sheet, upload_id):
+            if upload_id:
+                if progress:
+                    progress('persist', processed_count)
+                save_predictions_to_history(db, upload_id, chunk)
+
+            for pred in chunk:
+                counts[pred['riesgo_desercion']] += 1
+            processed_count += len(chunk)
+            if previous:
+                reused_count += count_reused(chunk, previous)
+            if chunk:
+                model_version = chunk[0].get('model_version')
+
+            remaining = STREAM_DASHBOARD_ROWS - len(dashboard_rows)
+            if remaining > 0:
+                dashboard_rows.extend(chunk[:remaining])
+
+            if progress:
+                progress('predict', processed_count)
+            yield chunk
+
+        # Actualizar los datos para el frontend
+        update_latest_predictions(dashboard_rows)
+        update_attendance_data(dashboard_rows)
+
+        processing_time = time.time() - start_time
+        if upload_id:
+            upload = UploadHistoryService.update_upload_stats(
+                db=db,
+                upload_id=upload_id,
+                total_students=processed_count,
+                processed_students=processed_count,
+                failed_students=0,
+                high_risk=counts['Alto'],
+                medium_risk=counts['Medio'],
+                low_risk=counts['Bajo'],
+                processing_time=processing_time,
+                status='success',
+                model_version=model_version
+            )
+            print(f"✅ Historial actualizado: {processed_count} predicciones guardadas")
+            publish_upload_finished(upload)
+
+        summary = {
+            "model_version": model_version,
+            "processed_students": processed_count,
+            "high_risk": counts['Alto'],
+            "medium_risk": counts['Medio'],
+            "low_risk": counts['Bajo'],
+            "processing_time": processing_time
+        }
+        if previous is not None:
+            summary["incremental"] = {
+                "previous_upload_id": previous_upload_id,
+                "reused": reused_count,
+                "rescored": processed_count - reused_count
+            }
+        return summary
+
+    except Exception as e:
+        if upload_id:
+            db.rollback()
+            upload = UploadHistoryService.update_upload_stats(
+                db=db,
+                upload_id=upload_id,
+                total_students=processed_count,
+                processed_students=processed_count,
+                failed_students=0,
+                high_risk=counts['Alto'],
+                medium_risk=counts['Medio'],
+                low_risk=counts['Bajo'],
+                processing_time=time.time() - start_time,
+                status='error',
+                error_message=str(e)
+            )
+            publish_upload_finished(upload)
+        raise
+    finally:
+        if db:
+            db.close()
+
+def stream_predictions(file_path: str, upload_id: int, chunk_size: int, start_time: float,
+                       previous=None, previous_upload_id: int = None, sheet: Optional[str] = None):
+    """
+    Genera la respuesta NDJSON del modo streaming de /predict: una línea por
+    predicción, bloque a bloque, y una línea final con el resumen.
+    """
+    progress = None
+    if upload_id:
+        def progress(stage, processed):
+            # Total desde el manifiesto de la caché columnar (un error aquí queda en el historial)
+            publish_upload_progress(upload_id, stage, processed, count_upload_rows(file_path, sheet)[0])
+
+    chunks = record_prediction_chunks(file_path, upload_id, chunk_size, start_time, previous, previous_upload_id,
+                                      progress=progress, sheet=sheet)
+    try:
+        while True:
+            try:
+                chunk = next(chunks)
+            except StopIteration as done:
+                summary = done.value
+                break
+            yield "".join(json.dumps(pred) + "\n" for pred in chunk)
+        yield json.dumps({"summary": summary}) + "\n"
+
+    except Exception as e:
+        print(f"❌ Error en /predict (streaming): {e}")
+        yield json.dumps({"error": str(e)}) + "\n"
+
 @app.post("/predict")
-async def predict(filename: str, upload_id: int = None):
+async def predict(filename: str, upload_id: int = None, stream: bool = False, chunk_size: int = STREAM_CHUNK_SIZE,
+                  incremental: bool = False, background: bool = False, sheet: Optional[str] = None):
+    """
+    Predice la deserción para un archivo subido.
+
+    Con stream=true el archivo se procesa en bloques de chunk_size filas y las
+    predicciones se devuelven como NDJSON a medida que se calculan.
+
+    Con incremental=true (requiere upload_id) los estudiantes cuyas
+    características no cambiaron respecto a la carga anterior del mismo usuario
+    conservan su predicción y solo se recalculan los demás.
+
+    Con background=true la predicción queda como trabajo en segundo plano y la
+    respuesta (202) trae su job_id; repetir el mismo pedido mientras el trabajo
+    sigue en curso devuelve el mismo job_id.
+
+    En archivos XLSX, sheet elige la hoja; sin sheet se usa la elegida al subir
+    la carga (upload_id) o la primera hoja.
+    """
     start_time = time.time()
 
     try:
@@ -176,6 +755,9 @@ async def predict(filename: str, upload_id: int = None):
 
         print(f"Buscando archivo en: {file_path}")
 
+        # Un nombre de antes de comprimir los archivos guardados sigue sirviendo
+        file_path = resolve_stored_path(file_path) or file_path
+
         if not os.path.exists(file_path):
             try:
                 available_files = os.listdir(upload_dir) if os.path.exists(upload_dir) else []
@@ -187,37 +769,70 @@ async def predict(filename: str, upload_id: int = None):
                 detail=f"Archivo no encontrado en: {file_path}. Archivos disponibles: {available_files}"
             )
 
+        if incremental and not upload_id:
+            raise HTTPException(status_code=400, detail="El modo incremental requiere upload_id")
+
+        sheet = await run_blocking(resolve_sheet, file_path, upload_id, sheet)
+
+        if background:
+            if chunk_size < 1:
+                raise HTTPException(status_code=400, detail="chunk_size debe ser mayor que 0")
+            job = await run_blocking(enqueue_predict_job, filename, file_path, upload_id, chunk_size, incremental, sheet)
+            job_pool.notify()
+            return job_accepted_response(job, filename=filename)
+
+        if stream and chunk_size < 1:
+            raise HTTPException(status_code=400, detail="chunk_size debe ser mayor que 0")
+
+        # Mismo contenido ya puntuado por esta versión del modelo: se responde con lo guardado
+        if upload_id:
+            reused = await run_blocking(reuse_scored_upload, upload_id, start_time, sheet)
+            if reused:
+                source_upload_id, predictions = reused
+                summary = deduplicated_summary(upload_id, source_upload_id, predictions, start_time, incremental)
+                if stream:
+                    return StreamingResponse(
+                        iter([
+                            "".join(json.dumps(pred) + "\n" for pred in predictions),
+                            json.dumps({"summary": summary}) + "\n"
+                        ]),
+                        media_type="application/x-ndjson"
+                    )
+                response = {"predictions": predictions, "deduplicated": summary["deduplicated"]}
+                if incremental:
+                    response["incremental"] = summary["incremental"]
+                return response
+
+        previous_upload_id, previous = None, None
+        if incremental:
+            previous_upload_id, previous = await run_blocking(load_previous_predictions, upload_id)
+            print(f"♻️ Modo incremental: {len(previous)} predicciones de la carga {previous_upload_id}")
+
+        if stream:
+            # StreamingResponse recorre el generador síncrono en el pool de hilos de Starlette
+            return StreamingResponse(
+                stream_predictions(file_path, upload_id, chunk_size, start_time, previous, previous_upload_id, sheet),
+                media_type="application/x-ndjson"
+            )
+
         # Verificar que el archivo sea legible
+        publish_upload_progress(upload_id, 'parse')
         try:
-            df_test = pd.read_csv(file_path)
-            print(f"✅ Archivo leído correctamente. Columnas: {df_test.columns.tolist()}")
-            print(f"✅ Número de filas: {len(df_test)}")
-            total_students = len(df_test)
+            total_students = await run_blocking(count_file_rows, file_path, sheet)
         except Exception as e:
             print(f"❌ Error leyendo el archivo: {e}")
 
             # Actualizar historial con error si existe upload_id
             if upload_id:
-                db = SessionLocal()
-                UploadHistoryService.update_upload_stats(
-                    db=db,
-                    upload_id=upload_id,
-                    total_students=0,
-                    processed_students=0,
-                    failed_students=0,
-                    high_risk=0,
-                    medium_risk=0,
-                    low_risk=0,
-                    processing_time=time.time() - start_time,
-                    status='error',
-                    error_message=f"Error leyendo CSV: {str(e)}"
-                )
-                db.close()
+                await run_blocking(record_upload_error, upload_id, start_time, f"Error leyendo CSV: {str(e)}")
 
             raise HTTPException(status_code=400, detail=f"Error leyendo el archivo CSV: {str(e)}")
 
-        # Llamar a la función de predicción
-        predictions = predict_desertion(file_path)
+        # Llamar a la función de predicción en el pool de procesos: el event loop
+        # sigue atendiendo logins y dashboards mientras se procesa el archivo
+        publish_upload_progress(upload_id, 'predict', 0, total_students)
+        predictions = await run_cpu_bound(predict_desertion, file_path, previous, sheet, upload_id)
+        publish_upload_progress(upload_id, 'predict', len(predictions), total_students)
 
         # Actualizar los datos para el frontend
         update_latest_predictions(predictions)
@@ -225,59 +840,18 @@ async def predict(filename: str, upload_id: int = None):
 
         # Guardar predicciones en el historial si existe upload_id
         if upload_id:
-            db = SessionLocal()
-
-            # Contar estadísticas
-            high_risk_count = sum(1 for p in predictions if p.get('riesgo_desercion') == 'Alto')
-            medium_risk_count = sum(1 for p in predictions if p.get('riesgo_desercion') == 'Medio')
-            low_risk_count = sum(1 for p in predictions if p.get('riesgo_desercion') == 'Bajo')
-            processed_count = len(predictions)
-            failed_count = total_students - processed_count
-
-            # Guardar cada predicción
-            for pred in predictions:
-                # Identificar factores de riesgo
-                risk_factors = []
-                if pred.get('nota_final', 0) < 11:
-                    risk_factors.append('Nota baja')
-                if pred.get('asistencia', 100) < 75:
-                    risk_factors.append('Asistencia baja')
-                if pred.get('conducta') in ['Mala', 'Regular']:
-                    risk_factors.append('Conducta deficiente')
-
-                UploadHistoryService.add_prediction_to_upload(
-                    db=db,
-                    upload_id=upload_id,
-                    estudiante_id=pred.get('id_estudiante', 0),
-                    nombre=pred.get('nombre', 'Sin nombre'),
-                    nota_final=pred.get('nota_final', 0),
-                    conducta=pred.get('conducta', ''),
-                    asistencia=pred.get('asistencia', 0),
-                    inasistencia=pred.get('inasistencia', 0),
-                    resultado_prediccion=pred.get('resultado_prediccion', '0'),
-                    riesgo_desercion=pred.get('riesgo_desercion', 'Bajo'),
-                    probabilidad_desercion=pred.get('probabilidad_desercion', 0.0),
-                    tiempo_prediccion=pred.get('tiempo_prediccion', 0.0),
-                    risk_factors={'factors': risk_factors} if risk_factors else None
-                )
-
-            # Actualizar estadísticas del upload
-            processing_time = time.time() - start_time
-            UploadHistoryService.update_upload_stats(
-                db=db,
-                upload_id=upload_id,
-                total_students=total_students,
-                processed_students=processed_count,
-                failed_students=failed_count,
-                high_risk=high_risk_count,
-                medium_risk=medium_risk_count,
-                low_risk=low_risk_count,
-                processing_time=processing_time,
-                status='success' if failed_count == 0 else 'partial'
-            )
+            await run_blocking(record_upload_results, upload_id, predictions, total_students, start_time)
 
-            db.close()
-            print(f"✅ Historial actualizado: {processed_count} predicciones guardadas")
+        if previous is not None:
+            reused_count = count_reused(predictions, previous)
+            return {
+                "predictions": predictions,
+                "incremental": {
+                    "previous_upload_id": previous_upload_id,
+                    "reused": reused_count,
+                    "rescored": len(predictions) - reused_count
+                }
+            }
 
         return {"predictions": predictions}
 
@@ -288,26 +862,140 @@ async def predict(filename: str, upload_id: int = None):
 
         # Actualizar historial con error si existe upload_id
         if upload_id:
-            db = SessionLocal()
-            UploadHistoryService.update_upload_stats(
-                db=db,
-                upload_id=upload_id,
-                total_students=0,
-                processed_students=0,
-                failed_students=0,
-                high_risk=0,
-                medium_risk=0,
-                low_risk=0,
-                processing_time=time.time() - start_time,
-                status='error',
-                error_message=str(e)
-            )
-            db.close()
+            await run_blocking(record_upload_error, upload_id, start_time, str(e))
 
         raise HTTPException(status_code=400, detail=f"Error procesando el archivo: {str(e)}")
 
+def enqueue_predict_job(filename: str, file_path: str, upload_id: int, chunk_size: int, incremental: bool,
+                        sheet: Optional[str] = None):
+    """Encola la predicción de un archivo; un reintento recibe el trabajo en curso"""
+    db = SessionLocal()
+    try:
+        upload = UploadHistoryService.get_upload_by_id(db, upload_id, is_admin=True) if upload_id else None
+        job, _ = JobService.enqueue(
+            db, 'predict',
+            {"file_path": file_path, "filename": filename, "chunk_size": chunk_size, "incremental": incremental,
+             "sheet": sheet},
+            user_id=upload.user_id if upload else None,
+            upload_id=upload_id,
+            dedupe_key=f"predict:{upload_id}:{filename}:{int(incremental)}:{sheet or ''}"
+        )
+        return job
+    finally:
+        db.close()
+
+def run_predict_job(job, params, progress):
+    """Trabajo 'predict': predice por bloques y guarda cada bloque en el historial"""
+    start_time = time.time()
+    file_path = resolve_stored_path(params['file_path']) or params['file_path']
+    sheet = params.get('sheet')
+    upload_id = job.upload_history_id
+
+    progress('parse')
+    total_rows = count_file_rows(file_path, sheet)
+    progress('parse', total_rows, total_rows)
+
+    if upload_id:
+        reused = reuse_scored_upload(upload_id, start_time, sheet)
+        if reused:
+            source_upload_id, predictions = reused
+            summary = deduplicated_summary(upload_id, source_upload_id, predictions, start_time,
+                                           params.get('incremental'))
+            summary["upload_id"] = upload_id
+            return summary
+
+    previous_upload_id, previous = None, None
+    if params.get('incremental'):
+        previous_upload_id, previous = load_previous_predictions(upload_id)
+
+    if upload_id:
+        # Un reintento después de una interrupción no duplica lo que alcanzó a guardar
+        db = SessionLocal()
+        try:
+            UploadHistoryService.clear_upload_predictions(db, upload_id)
+        finally:
+            db.close()
+
+    chunks = record_prediction_chunks(
+        file_path, upload_id, params['chunk_size'], start_time, previous, previous_upload_id,
+        progress=lambda stage, processed: progress(stage, processed, total_rows),
+        sheet=sheet
+    )
+    while True:
+        try:
+            next(chunks)
+        except StopIteration as done:
+            summary = done.value
+            break
+    summary["upload_id"] = upload_id
+    return summary
+
+job_pool.register('parse', run_parse_job)
+job_pool.register('predict', run_predict_job)
+
+def count_file_rows(file_path: str, sheet: Optional[str] = None) -> int:
+    """Número de filas del archivo, desde el manifiesto de su caché columnar (lo ingiere si falta)"""
+    total_rows, columns = count_upload_rows(file_path, sheet)
+    print(f"✅ Archivo leído correctamente. Columnas: {columns}")
+    print(f"✅ Número de filas: {total_rows}")
+    return total_rows
+
+def record_upload_results(upload_id: int, predictions, total_students: int, start_time: float):
+    """Guarda las predicciones de /predict en el historial y actualiza las estadísticas de la carga"""
+    db = SessionLocal()
+
+    # Contar estadísticas
+    high_risk_count = sum(1 for p in predictions if p.get('riesgo_desercion') == 'Alto')
+    medium_risk_count = sum(1 for p in predictions if p.get('riesgo_desercion') == 'Medio')
+    low_risk_count = sum(1 for p in predictions if p.get('riesgo_desercion') == 'Bajo')
+    processed_count = len(predictions)
+    failed_count = total_students - processed_count
+
+    # Guardar cada predicción
+    publish_upload_progress(upload_id, 'persist', 0, processed_count)
+    save_predictions_to_history(db, upload_id, predictions)
+
+    # Actualizar estadísticas del upload
+    processing_time = time.time() - start_time
+    upload = UploadHistoryService.update_upload_stats(
+        db=db,
+        upload_id=upload_id,
+        total_students=total_students,
+        processed_students=processed_count,
+        failed_students=failed_count,
+        high_risk=high_risk_count,
+        medium_risk=medium_risk_count,
+        low_risk=low_risk_count,
+        processing_time=processing_time,
+        status='success' if failed_count == 0 else 'partial',
+        model_version=predictions[0].get('model_version') if predictions else None
+    )
+    publish_upload_finished(upload)
+
+    db.close()
+    print(f"✅ Historial actualizado: {processed_count} predicciones guardadas")
+
+def record_upload_error(upload_id: int, start_time: float, error_message: str):
+    """Marca la carga del historial como fallida"""
+    db = SessionLocal()
+    upload = UploadHistoryService.update_upload_stats(
+        db=db,
+        upload_id=upload_id,
+        total_students=0,
+        processed_students=0,
+        failed_students=0,
+        high_risk=0,
+        medium_risk=0,
+        low_risk=0,
+        processing_time=time.time() - start_time,
+        status='error',
+        error_message=error_message
+    )
+    publish_upload_finished(upload)
+    db.close()
+
 @app.get("/api/reporte-general")
-async def reporte_general():
+def reporte_general():
     try:
         csv_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "student_data.csv"))
         if not os.path.exists(csv_path):
@@ -319,10 +1007,10 @@ async def reporte_general():
         raise HTTPException(status_code=500, detail=f"Error al procesar el reporte general: {str(e)}")
 
 @app.get("/api/resultados-prediccion")
-async def get_resultados_prediccion():
+def get_resultados_prediccion():
     try:
         session = SessionLocal()
-        resultados = session.query(ResultadoPrediccion).all()
+        resultados = current_results(session).all()
         session.close()
         resultados_dict = [
             {
@@ -338,7 +1026,8 @@ async def get_resultados_prediccion():
                 "resultado_prediccion": r.resultado_prediccion,
                 "riesgo_desercion": r.riesgo_desercion,
                 "probabilidad_desercion": r.probabilidad_desercion,
-                "fecha": r.fecha.strftime('%Y-%m-%d %H:%M:%S') if r.fecha else None
+                "fecha": r.fecha.strftime('%Y-%m-%d %H:%M:%S') if r.fecha else None,
+                "model_version": r.model_version
             }
             for r in resultados
         ]
@@ -347,13 +1036,13 @@ async def get_resultados_prediccion():
         raise HTTPException(status_code=500, detail=f"Error al obtener resultados: {str(e)}")
 
 @app.get("/api/estadisticas-generales")
-async def get_estadisticas_generales():
+def get_estadisticas_generales():
     """
     Endpoint para obtener estadísticas generales de las predicciones
     """
     try:
         session = SessionLocal()
-        resultados = session.query(ResultadoPrediccion).all()
+        resultados = current_results(session).all()
 
         if not resultados:
             return JSONResponse(content={
@@ -386,13 +1075,13 @@ async def get_estadisticas_generales():
         raise HTTPException(status_code=500, detail=f"Error al obtener estadísticas: {str(e)}")
 
 @app.get("/api/estudiantes-riesgo")
-async def get_estudiantes_riesgo():
+def get_estudiantes_riesgo():
     """
     Endpoint para obtener la lista de estudiantes en riesgo alto
     """
     try:
         session = SessionLocal()
-        resultados = session.query(ResultadoPrediccion).filter(
+        resultados = current_results(session).filter(
             ResultadoPrediccion.resultado_prediccion == "1"
         ).all()
 
@@ -413,15 +1102,14 @@ async def get_estudiantes_riesgo():
         raise HTTPException(status_code=500, detail=f"Error al obtener estudiantes en riesgo: {str(e)}")
 
 @app.delete("/api/limpiar-datos")
-async def limpiar_datos():
+def limpiar_datos():
     """
     Endpoint para limpiar todos los datos de predicciones cargados
     """
     try:
         session = SessionLocal()
-        # Eliminar todos los registros de predicciones
-        deleted_count = session.query(ResultadoPrediccion).delete()
-        session.commit()
+        # Dejar sin corrida actual; sus filas se borran en bloque con las corridas viejas
+        deleted_count = clear_current_run(session)
         session.close()
 
         print(f"✅ Se eliminaron {deleted_count} registros de predicciones")
@@ -436,7 +1124,7 @@ async def limpiar_datos():
         raise HTTPException(status_code=500, detail=f"Error al limpiar datos: {str(e)}")
 
 @app.delete("/clear-dashboard")
-async def clear_dashboard():
+def clear_dashboard():
     """
     Endpoint para limpiar manualmente todos los datos del dashboard
     """
@@ -451,13 +1139,13 @@ async def clear_dashboard():
         raise HTTPException(status_code=500, detail=f"Error al limpiar dashboard: {str(e)}")
 
 @app.get("/dashboard-status")
-async def get_dashboard_status():
+def get_dashboard_status():
     """
     Endpoint para verificar si hay datos en el dashboard
     """
     try:
         db = SessionLocal()
-        count = db.query(ResultadoPrediccion).count()
+        count = current_results(db).count()
         db.close()
 
         return {
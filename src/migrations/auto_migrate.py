@@ -8,7 +8,35 @@ sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'
 
 from sqlalchemy import inspect, text
 from config import Base, engine
-from models import ResultadoPrediccion, StudentData
+from models import ResultadoPrediccion, StudentData, UploadBatch, PredictionRun, CurrentPredictionRun
+
+def add_missing_columns(table_name: str, columns: dict):
+    """
+    Agrega a una tabla existente las columnas que le falten.
+    Las tablas que aún no existen las crea Base.metadata.create_all al iniciar.
+    """
+    with engine.connect() as conn:
+        for column_name, column_type in columns.items():
+            try:
+                result = conn.execute(text(f"""
+                    SELECT column_name 
+                    FROM information_schema.columns 
+                    WHERE table_name='{table_name}' AND column_name='{column_name}'
+                """))
+
+                if result.fetchone() is None:
+                    print(f"  🔄 Agregando columna {column_name} a {table_name}...")
+                    conn.execute(text(f"""
+                        ALTER TABLE {table_name} 
+                        ADD COLUMN {column_name} {column_type}
+                    """))
+                    conn.commit()
+                    print(f"  ✅ Columna {column_name} agregada")
+                else:
+                    print(f"  ✅ Columna {column_name} ya existe")
+            except Exception as e:
+                print(f"  ⚠️  Error al agregar columna {column_name}: {e}")
+                conn.rollback()
 
 def run_migrations():
     """
@@ -31,35 +59,12 @@ def run_migrations():
         else:
             print("✅ Tabla student_data existe")
             # Agregar columnas faltantes
-            with engine.connect() as conn:
-                student_data_columns = {
-                    'id_estudiante': 'INTEGER NOT NULL DEFAULT 0',
-                    'nota_final': 'FLOAT NOT NULL DEFAULT 0',
-                    'fecha': 'DATE DEFAULT CURRENT_DATE',  # Agregar columna fecha
-                    'created_at': 'TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP',
-                }
-
-                for column_name, column_type in student_data_columns.items():
-                    try:
-                        result = conn.execute(text(f"""
-                            SELECT column_name 
-                            FROM information_schema.columns 
-                            WHERE table_name='student_data' AND column_name='{column_name}'
-                        """))
-
-                        if result.fetchone() is None:
-                            print(f"  🔄 Agregando columna {column_name} a student_data...")
-                            conn.execute(text(f"""
-                                ALTER TABLE student_data 
-                                ADD COLUMN {column_name} {column_type}
-                            """))
-                            conn.commit()
-                            print(f"  ✅ Columna {column_name} agregada")
-                        else:
-                            print(f"  ✅ Columna {column_name} ya existe")
-                    except Exception as e:
-                        print(f"  ⚠️  Error al agregar columna {column_name}: {e}")
-                        conn.rollback()
+            add_missing_columns('student_data', {
+                'id_estudiante': 'INTEGER NOT NULL DEFAULT 0',
+                'nota_final': 'FLOAT NOT NULL DEFAULT 0',
+                'fecha': 'DATE DEFAULT CURRENT_DATE',  # Agregar columna fecha
+                'created_at': 'TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP',
+            })
 
         # =====================================================================
         # MIGRACIÓN 2: Tabla resultados_prediccion
@@ -71,34 +76,138 @@ def run_migrations():
         else:
             print("✅ Tabla resultados_prediccion existe")
             # Agregar columnas faltantes
+            add_missing_columns('resultados_prediccion', {
+                'resultado_prediccion': 'VARCHAR(50)',
+                'fecha': 'DATE',
+                'created_at': 'TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP',
+                'model_version': 'VARCHAR(50)',
+            })
+
+        # =====================================================================
+        # MIGRACIÓN 3: Versión del modelo en el historial de cargas
+        # =====================================================================
+        if 'upload_history' in existing_tables:
+            add_missing_columns('upload_history', {
+                'model_version': 'VARCHAR(50)',
+            })
+        if 'upload_predictions' in existing_tables:
+            add_missing_columns('upload_predictions', {
+                'model_version': 'VARCHAR(50)',
+            })
+
+        # =====================================================================
+        # MIGRACIÓN 4: Hash de características para el modo incremental
+        # =====================================================================
+        if 'upload_predictions' in existing_tables:
+            add_missing_columns('upload_predictions', {
+                'feature_hash': 'VARCHAR(32)',
+            })
+
+        # =====================================================================
+        # MIGRACIÓN 5: Contribuciones por característica de cada predicción
+        # =====================================================================
+        if 'upload_predictions' in existing_tables:
+            add_missing_columns('upload_predictions', {
+                'contributions': 'TEXT',
+            })
+
+        # =====================================================================
+        # MIGRACIÓN 6: Deduplicación de cargas por contenido
+        # =====================================================================
+        if 'upload_history' in existing_tables:
+            add_missing_columns('upload_history', {
+                'content_hash': 'VARCHAR(64)',
+            })
+            with engine.connect() as conn:
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_upload_history_content_hash ON upload_history (content_hash)"
+                ))
+                conn.commit()
+        if 'upload_predictions' in existing_tables:
+            add_missing_columns('upload_predictions', {
+                'fecha': 'DATE',
+            })
+
+        # =====================================================================
+        # MIGRACIÓN 7: Hoja elegida en cargas XLSX
+        # =====================================================================
+        if 'upload_history' in existing_tables:
+            add_missing_columns('upload_history', {
+                'sheet_name': 'VARCHAR(255)',
+            })
+
+        # =====================================================================
+        # MIGRACIÓN 8: Cargas por lotes (zip con varios archivos)
+        # =====================================================================
+        # En una base nueva create_all crea upload_batches junto con las demás tablas
+        if 'upload_history' in existing_tables:
+            if 'upload_batches' not in existing_tables:
+                print("📝 Creando tabla upload_batches...")
+                Base.metadata.create_all(engine, tables=[UploadBatch.__table__])
+                print("✅ Tabla upload_batches creada")
+            add_missing_columns('upload_history', {
+                'batch_id': 'INTEGER REFERENCES upload_batches(id) ON DELETE SET NULL',
+            })
+            with engine.connect() as conn:
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_upload_history_batch_id ON upload_history (batch_id)"
+                ))
+                conn.commit()
+
+        # =====================================================================
+        # MIGRACIÓN 9: Corridas (snapshots) de resultados_prediccion
+        # =====================================================================
+        if 'resultados_prediccion' in existing_tables:
+            Base.metadata.create_all(engine, tables=[PredictionRun.__table__, CurrentPredictionRun.__table__])
+            add_missing_columns('resultados_prediccion', {
+                'run_id': 'INTEGER REFERENCES prediction_runs(id) ON DELETE CASCADE',
+            })
+            with engine.connect() as conn:
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_resultados_prediccion_run_id ON resultados_prediccion (run_id)"
+                ))
+                # Las filas de antes de las corridas pasan a ser la corrida actual
+                legacy_rows = conn.execute(text(
+                    "SELECT COUNT(*) FROM resultados_prediccion WHERE run_id IS NULL"
+                )).scalar()
+                if legacy_rows:
+                    print(f"  🔄 Asignando {legacy_rows} predicciones existentes a una corrida...")
+                    run_id = conn.execute(text("""
+                        INSERT INTO prediction_runs (status, row_count, created_at, completed_at)
+                        VALUES ('complete', :rows, NOW(), NOW())
+                        RETURNING id
+                    """), {"rows": legacy_rows}).scalar()
+                    conn.execute(text(
+                        "UPDATE resultados_prediccion SET run_id = :run_id WHERE run_id IS NULL"
+                    ), {"run_id": run_id})
+                    conn.execute(text("DELETE FROM current_prediction_run"))
+                    conn.execute(text(
+                        "INSERT INTO current_prediction_run (id, run_id) VALUES (1, :run_id)"
+                    ), {"run_id": run_id})
+                    print(f"  ✅ Corrida {run_id} creada como actual")
+                conn.commit()
+
+        # =====================================================================
+        # MIGRACIÓN 10: student_data por carga
+        # =====================================================================
+        # Las filas existentes quedan sin carga (upload_id NULL), como las de
+        # las cargas sin usuario: la próxima de esas las reemplaza
+        if 'student_data' in existing_tables and 'upload_history' in existing_tables:
+            add_missing_columns('student_data', {
+                'upload_id': 'INTEGER REFERENCES upload_history(id) ON DELETE CASCADE',
+            })
             with engine.connect() as conn:
-                resultados_columns = {
-                    'resultado_prediccion': 'VARCHAR(50)',
-                    'fecha': 'DATE',
-                    'created_at': 'TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP',
-                }
-
-                for column_name, column_type in resultados_columns.items():
-                    try:
-                        result = conn.execute(text(f"""
-                            SELECT column_name 
-                            FROM information_schema.columns 
-                            WHERE table_name='resultados_prediccion' AND column_name='{column_name}'
-                        """))
-
-                        if result.fetchone() is None:
-                            print(f"  🔄 Agregando columna {column_name} a resultados_prediccion...")
-                            conn.execute(text(f"""
-                                ALTER TABLE resultados_prediccion 
-                                ADD COLUMN {column_name} {column_type}
-                            """))
-                            conn.commit()
-                            print(f"  ✅ Columna {column_name} agregada")
-                        else:
-                            print(f"  ✅ Columna {column_name} ya existe")
-                    except Exception as e:
-                        print(f"  ⚠️  Error al agregar columna {column_name}: {e}")
-                        conn.rollback()
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_student_data_upload_id ON student_data (upload_id)"
+                ))
+                conn.commit()
+        # La corrida recuerda su carga (o lote) para leer solo sus estudiantes;
+        # prediction_runs ya existe (la crea la migración 9)
+        if 'resultados_prediccion' in existing_tables:
+            add_missing_columns('prediction_runs', {
+                'upload_id': 'INTEGER',
+                'batch_id': 'INTEGER',
+            })
 
         print("✅ Migración completada exitosamente\n")
         return True
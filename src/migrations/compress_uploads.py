@@ -0,0 +1,102 @@
+"""
+Migración de datos: comprime con gzip los CSV ya guardados en uploads/ y
+actualiza file_path y filename en upload_history.
+
+La caché columnar de cada archivo pasa al archivo comprimido (el contenido es
+el mismo), así no hay que volver a ingerirlo. Se puede ejecutar de nuevo: lo
+ya comprimido se salta y una ejecución cortada se retoma donde quedó.
+Conviene ejecutarla con el servidor detenido.
+
+Uso (desde src/):
+    python migrations/compress_uploads.py
+"""
+import sys
+import os
+
+# Agregar el directorio src al path
+if __name__ == "__main__":
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    src_dir = os.path.dirname(current_dir)
+    if src_dir not in sys.path:
+        sys.path.insert(0, src_dir)
+
+from typing import List, Tuple
+
+from config import SessionLocal
+from models.upload_history import UploadHistory
+from services.ingestion_service import move_columnar_cache
+from services.upload_storage import compress_stored_file, should_compress
+from upload import UPLOAD_DIR
+
+
+def uncompressed_uploads(upload_dir: str) -> List[str]:
+    """Archivos guardados sin comprimir cuyo formato se guarda comprimido (según UPLOAD_COMPRESSION)"""
+    paths = []
+    for name in sorted(os.listdir(upload_dir)):
+        path = os.path.join(upload_dir, name)
+        if name.startswith(".") or not os.path.isfile(path):
+            continue
+        if should_compress(os.path.splitext(name)[1]):
+            paths.append(path)
+    return paths
+
+
+def compress_upload(db, path: str) -> Tuple[str, int]:
+    """Comprime un archivo, mueve su caché, actualiza el historial y borra el original"""
+    compressed_path = compress_stored_file(path)
+    move_columnar_cache(path, compressed_path)
+
+    updated = db.query(UploadHistory).filter(UploadHistory.file_path == path).update(
+        {
+            UploadHistory.file_path: compressed_path,
+            UploadHistory.filename: os.path.basename(compressed_path)
+        },
+        synchronize_session=False
+    )
+    db.commit()
+
+    # El original se borra recién cuando el historial ya apunta al comprimido
+    os.remove(path)
+    return compressed_path, updated
+
+
+def migrate(upload_dir: str = UPLOAD_DIR):
+    """Ejecutar la migración"""
+    print(f"🔄 Iniciando migración: comprimiendo archivos guardados en {upload_dir}...")
+
+    paths = uncompressed_uploads(upload_dir)
+    if not paths:
+        print("✅ No hay archivos para comprimir")
+        return
+
+    db = SessionLocal()
+    before = after = records = 0
+    try:
+        for path in paths:
+            size = os.path.getsize(path)
+            compressed_path, updated = compress_upload(db, path)
+            compressed_size = os.path.getsize(compressed_path)
+            before += size
+            after += compressed_size
+            records += updated
+            print(f"  ✅ {os.path.basename(path)}: {size / 1024:.0f} KB → {compressed_size / 1024:.0f} KB "
+                  f"({updated} cargas actualizadas)")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Error durante la migración: {e}")
+        raise
+    finally:
+        db.close()
+
+    print("✅ Migración completada exitosamente!")
+    print(f"   - {len(paths)} archivos comprimidos, {records} cargas del historial actualizadas")
+    print(f"   - {before / (1024 * 1024):.1f} MB → {after / (1024 * 1024):.1f} MB")
+
+
+if __name__ == "__main__":
+    try:
+        migrate()
+    except Exception:
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -1,15 +1,37 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Date
+from sqlalchemy import Column, Integer, String, Float, DateTime, Date, ForeignKey
 from config import Base
 import datetime
 
 # IMPORTANTE: Importar TODOS los modelos ANTES de usar Base.metadata
 # Esto asegura que SQLAlchemy conozca todas las tablas
 from models.user import Usuario, RolEnum
-from models.upload_history import UploadHistory, UploadPrediction
+from models.upload_history import UploadHistory, UploadPrediction, UploadBatch
+from models.job import Job
+
+class PredictionRun(Base):
+    """Una corrida de predicción: el conjunto completo de filas de resultados_prediccion que escribió"""
+    __tablename__ = 'prediction_runs'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    status = Column(String(20), nullable=False, default='building')  # building, complete
+    model_version = Column(String(50), nullable=True)
+    row_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
+    # Carga o lote del que salieron las predicciones (sus estudiantes en student_data);
+    # sin FK: la corrida sigue siendo válida aunque se borre la carga
+    upload_id = Column(Integer, nullable=True)
+    batch_id = Column(Integer, nullable=True)
+
+class CurrentPredictionRun(Base):
+    """Puntero (una sola fila, id=1) a la corrida que muestran los dashboards"""
+    __tablename__ = 'current_prediction_run'
+    id = Column(Integer, primary_key=True)
+    run_id = Column(Integer, ForeignKey('prediction_runs.id', ondelete='SET NULL'), nullable=True)
 
 class ResultadoPrediccion(Base):
     __tablename__ = 'resultados_prediccion'
     id = Column(Integer, primary_key=True, autoincrement=True)
+    run_id = Column(Integer, ForeignKey('prediction_runs.id', ondelete='CASCADE'), nullable=True, index=True)
     id_estudiante = Column(Integer, nullable=False)
     nombre = Column(String, nullable=True)
     nota = Column(Float, nullable=False)
@@ -22,11 +44,14 @@ class ResultadoPrediccion(Base):
     riesgo_desercion = Column(String, nullable=True)
     probabilidad_desercion = Column(Float, nullable=True)
     fecha = Column(Date, nullable=True)
+    model_version = Column(String(50), nullable=True)  # Versión del modelo que generó la predicción
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
 class StudentData(Base):
     __tablename__ = 'student_data'
     id = Column(Integer, primary_key=True, autoincrement=True)
+    # Carga del historial a la que pertenecen los estudiantes (None: cargas sin usuario)
+    upload_id = Column(Integer, ForeignKey('upload_history.id', ondelete='CASCADE'), nullable=True, index=True)
     id_estudiante = Column('estudiante_id', Integer, nullable=False)  # Mapear id_estudiante a estudiante_id en BD
     nombre = Column(String, nullable=False)
     nota_final = Column(Float, nullable=False)  # Agregado
@@ -0,0 +1,478 @@
+"""
+Motor de inferencia para el RandomForest entrenado.
+
+Exporta los árboles del RandomForestClassifier de sklearn a arreglos NumPy
+contiguos (un solo arreglo por atributo de nodo para todo el bosque) y evalúa
+todos los árboles en una sola pasada vectorizada, devolviendo la etiqueta y
+las probabilidades a la vez.
+
+El StandardScaler puede plegarse en los umbrales: cada corte se traduce al
+espacio original de las características, y el bosque recibe las
+características sin escalar.
+
+Los arreglos pueden guardarse como archivos .npy y abrirse con memoria
+mapeada: todos los workers que cargan el mismo directorio comparten las
+mismas páginas físicas en lugar de tener cada uno su copia.
+
+contributions() explica cada predicción recorriendo los mismos caminos de
+decisión: el cambio de probabilidad en cada corte se atribuye a la
+característica que decidió el corte.
+"""
+import json
+import logging
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Filas evaluadas por bloque: bloques pequeños mantienen las matrices
+# (filas x árboles) dentro de la caché del procesador
+BLOCK_ROWS = 512
+
+FOREST_ARRAYS = ("children", "feature", "threshold", "value", "roots", "classes")
+FOLDED_ARRAYS = ("input_bounds",)
+MANIFEST_FILE = "manifest.json"
+
+
+class FlatForest:
+    """Bosque aplanado: todos los nodos de todos los árboles en arreglos contiguos"""
+
+    def __init__(
+        self,
+        children: np.ndarray,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        value: np.ndarray,
+        roots: np.ndarray,
+        classes: np.ndarray,
+        max_depth: int,
+        n_features: int,
+        input_bounds: Optional[np.ndarray] = None
+    ):
+        # children[2 * nodo] es el hijo derecho y children[2 * nodo + 1] el izquierdo,
+        # así el siguiente nodo es children[2 * nodo + (x <= umbral)]
+        self.children = children
+        self.feature = feature
+        self.threshold = threshold
+        self.value = value
+        self.roots = roots
+        self.classes = classes
+        self.max_depth = int(max_depth)
+        self.n_features = int(n_features)
+        # Solo en bosques con el escalador plegado: [mínimo, máximo] admitido por
+        # característica en el espacio original (fuera de ese rango el escalado
+        # de sklearn da infinito en float32)
+        self.input_bounds = input_bounds
+
+    @property
+    def folded(self) -> bool:
+        """True si los umbrales están en el espacio original (escalador plegado)"""
+        return self.input_bounds is not None
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @classmethod
+    def from_sklearn(cls, model) -> "FlatForest":
+        """Exporta un RandomForestClassifier entrenado a arreglos planos"""
+        children, feature, threshold, value, roots = [], [], [], [], []
+        offset = 0
+        max_depth = 0
+
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            if tree.n_outputs != 1:
+                raise ValueError("Solo se soportan bosques de una sola salida")
+
+            left = tree.children_left.astype(np.int64)
+            right = tree.children_right.astype(np.int64)
+            is_leaf = left == -1
+            local_ids = np.arange(tree.node_count, dtype=np.int64)
+
+            # Las hojas apuntan a sí mismas: recorrer de más no las mueve
+            children.append(np.stack([
+                np.where(is_leaf, local_ids, right) + offset,
+                np.where(is_leaf, local_ids, left) + offset
+            ], axis=1).ravel())
+            feature.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+            threshold.append(np.where(is_leaf, 0.0, tree.threshold).astype(np.float64))
+
+            # sklearn >= 1.4 guarda fracciones por nodo y las devuelve tal cual;
+            # versiones anteriores guardaban conteos y normalizaban al predecir
+            node_value = tree.value[:, 0, :].astype(np.float64)
+            normalizer = node_value.sum(axis=1, keepdims=True)
+            if not np.allclose(normalizer, 1.0):
+                normalizer[normalizer == 0.0] = 1.0
+                node_value = node_value / normalizer
+            value.append(node_value)
+
+            roots.append(offset)
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        if 2 * offset >= np.iinfo(np.int32).max:
+            raise ValueError("El bosque tiene demasiados nodos para el motor plano")
+
+        return cls(
+            children=np.ascontiguousarray(np.concatenate(children).astype(np.int32)),
+            feature=np.ascontiguousarray(np.concatenate(feature)),
+            threshold=np.ascontiguousarray(np.concatenate(threshold)),
+            value=np.ascontiguousarray(np.concatenate(value)),
+            roots=np.asarray(roots, dtype=np.int32),
+            classes=np.asarray(model.classes_),
+            max_depth=max_depth,
+            n_features=model.n_features_in_
+        )
+
+    def save(self, directory: str) -> None:
+        """Guarda los arreglos del bosque como .npy (sin pickle) en un directorio existente"""
+        for name in FOREST_ARRAYS + (FOLDED_ARRAYS if self.folded else ()):
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name), allow_pickle=False)
+
+    @classmethod
+    def load(
+        cls,
+        directory: str,
+        max_depth: int,
+        n_features: int,
+        folded: bool = False,
+        mmap_mode: Optional[str] = "r"
+    ) -> "FlatForest":
+        """
+        Abre un bosque guardado con save(). Con mmap_mode="r" los arreglos
+        quedan mapeados en memoria, de solo lectura y compartidos entre procesos.
+        """
+        # np.asarray deja un ndarray común que sigue apuntando al archivo mapeado
+        arrays = {
+            name: np.asarray(np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode, allow_pickle=False))
+            for name in FOREST_ARRAYS + (FOLDED_ARRAYS if folded else ())
+        }
+        return cls(max_depth=max_depth, n_features=n_features, **arrays)
+
+    def _leaves(self, X: np.ndarray) -> np.ndarray:
+        """Devuelve el nodo hoja alcanzado por cada fila en cada árbol (filas x árboles)"""
+        n_rows = X.shape[0]
+        flat_X = X.ravel()
+        row_offsets = (np.arange(n_rows, dtype=np.int32) * self.n_features)[:, np.newaxis]
+
+        nodes = np.repeat(self.roots[np.newaxis, :], n_rows, axis=0)
+        buffer = np.empty_like(nodes)
+        x_values = np.empty(nodes.shape, dtype=np.float64)
+        thresholds = np.empty(nodes.shape, dtype=np.float64)
+        go_left = np.empty(nodes.shape, dtype=bool)
+
+        # Un nivel de todos los árboles por iteración, reutilizando los buffers
+        for _ in range(self.max_depth):
+            self.feature.take(nodes, out=buffer)
+            buffer += row_offsets
+            flat_X.take(buffer, out=x_values)
+            self.threshold.take(nodes, out=thresholds)
+            np.less_equal(x_values, thresholds, out=go_left)
+            nodes *= 2
+            nodes += go_left
+            self.children.take(nodes, out=buffer)
+            nodes, buffer = buffer, nodes
+        return nodes
+
+    def _model_input(self, X) -> np.ndarray:
+        """Valida X y lo deja como float64 contiguo, con los valores que compara sklearn"""
+        if self.folded:
+            # Umbrales en el espacio original: se compara directamente, sin escalar
+            X = np.ascontiguousarray(X, dtype=np.float64)
+            if X.ndim != 2 or X.shape[1] != self.n_features:
+                raise ValueError(f"Se esperaban {self.n_features} características, se recibieron {X.shape}")
+            # NaN falla ambas comparaciones
+            if not ((X >= self.input_bounds[0]) & (X <= self.input_bounds[1])).all():
+                raise ValueError("Input X contains NaN or infinity")
+        else:
+            # sklearn compara las características en float32 contra umbrales float64;
+            # pasar de float32 a float64 es exacto y evita convertir en cada nivel
+            X = np.asarray(X, dtype=np.float32)
+            if X.ndim != 2 or X.shape[1] != self.n_features:
+                raise ValueError(f"Se esperaban {self.n_features} características, se recibieron {X.shape}")
+            if not np.isfinite(X).all():
+                raise ValueError("Input X contains NaN or infinity")
+            X = np.ascontiguousarray(X, dtype=np.float64)
+        return X
+
+    def predict_with_proba(self, X) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Evalúa todos los árboles en una pasada.
+
+        Returns:
+            (etiquetas, probabilidades) con la misma forma que model.predict y
+            model.predict_proba de sklearn.
+        """
+        X = self._model_input(X)
+
+        proba = np.empty((X.shape[0], self.value.shape[1]), dtype=np.float64)
+        for start in range(0, X.shape[0], BLOCK_ROWS):
+            leaves = self._leaves(X[start:start + BLOCK_ROWS])
+            # cumsum suma árbol por árbol, en el mismo orden que sklearn
+            for class_index in range(self.value.shape[1]):
+                tree_values = self.value[:, class_index].take(leaves)
+                proba[start:start + BLOCK_ROWS, class_index] = np.cumsum(tree_values, axis=1)[:, -1]
+        proba /= self.n_trees
+
+        labels = self.classes.take(np.argmax(proba, axis=1), axis=0)
+        return labels, proba
+
+    def contributions(self, X, class_index: int = 1) -> Tuple[float, np.ndarray]:
+        """
+        Contribución de cada característica a la probabilidad de la clase
+        class_index, por fila, a partir de los caminos de decisión.
+
+        En cada corte, la diferencia entre el valor del hijo alcanzado y el del
+        nodo se suma a la característica del corte. Se cumple que
+        sesgo + contribuciones.sum(axis=1) == probabilidad (salvo redondeo).
+
+        Returns:
+            (sesgo, contribuciones): el sesgo es la probabilidad media en las
+            raíces (igual para todas las filas); contribuciones tiene forma
+            (filas x características).
+        """
+        X = self._model_input(X)
+        node_value = np.ascontiguousarray(self.value[:, class_index])
+        bias = float(node_value.take(self.roots).sum() / self.n_trees)
+
+        contributions = np.empty((X.shape[0], self.n_features), dtype=np.float64)
+        for start in range(0, X.shape[0], BLOCK_ROWS):
+            block = X[start:start + BLOCK_ROWS]
+            n_rows = block.shape[0]
+            flat_X = block.ravel()
+            row_offsets = (np.arange(n_rows, dtype=np.int64) * self.n_features)[:, np.newaxis]
+            nodes = np.repeat(self.roots[np.newaxis, :], n_rows, axis=0)
+            totals = np.zeros(n_rows * self.n_features, dtype=np.float64)
+
+            # Mismo recorrido que _leaves; en las hojas el hijo es el propio
+            # nodo, así que los niveles de más suman cero
+            for _ in range(self.max_depth):
+                slots = self.feature.take(nodes) + row_offsets
+                go_left = flat_X.take(slots) <= self.threshold.take(nodes)
+                following = self.children.take(nodes * 2 + go_left)
+                delta = node_value.take(following) - node_value.take(nodes)
+                totals += np.bincount(slots.ravel(), weights=delta.ravel(), minlength=totals.size)
+                nodes = following
+
+            contributions[start:start + n_rows] = totals.reshape(n_rows, self.n_features)
+        contributions /= self.n_trees
+        return bias, contributions
+
+    def matches(self, model, X, scaler=None) -> bool:
+        """
+        Verifica que etiquetas y probabilidades coincidan exactamente con sklearn.
+        Con scaler, X está en el espacio original y sklearn recibe scaler.transform(X).
+        """
+        labels, proba = self.predict_with_proba(X)
+        X_model = scaler.transform(X) if scaler is not None else X
+        return bool(
+            np.array_equal(labels, model.predict(X_model))
+            and np.array_equal(proba, model.predict_proba(X_model))
+        )
+
+
+class FlatScaler:
+    """
+    StandardScaler reducido a sus dos arreglos. Aplica la misma operación que
+    sklearn ((X - mean) / scale en float64) sin tener que importar sklearn.
+    """
+
+    def __init__(self, mean: np.ndarray, scale: np.ndarray):
+        self.mean = mean
+        self.scale = scale
+
+    @classmethod
+    def from_sklearn(cls, scaler) -> "FlatScaler":
+        n_features = scaler.n_features_in_
+        # Restar 0 y dividir entre 1 es exacto, así se respetan with_mean/with_std
+        mean = scaler.mean_ if scaler.with_mean else np.zeros(n_features)
+        scale = scaler.scale_ if scaler.with_std else np.ones(n_features)
+        return cls(np.asarray(mean, dtype=np.float64), np.asarray(scale, dtype=np.float64))
+
+    def transform(self, X) -> np.ndarray:
+        X = np.array(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != len(self.mean):
+            raise ValueError(f"Se esperaban {len(self.mean)} características, se recibieron {X.shape}")
+        X -= self.mean
+        X /= self.scale
+        return X
+
+    def save(self, directory: str) -> None:
+        np.save(os.path.join(directory, "scaler_mean.npy"), self.mean, allow_pickle=False)
+        np.save(os.path.join(directory, "scaler_scale.npy"), self.scale, allow_pickle=False)
+
+    @classmethod
+    def load(cls, directory: str) -> "FlatScaler":
+        return cls(
+            np.load(os.path.join(directory, "scaler_mean.npy"), allow_pickle=False),
+            np.load(os.path.join(directory, "scaler_scale.npy"), allow_pickle=False)
+        )
+
+
+_SIGN_MASK = np.int64(0x7FFFFFFFFFFFFFFF)
+_FLOAT64_MAX = np.finfo(np.float64).max
+
+
+def _ordered_keys(x: np.ndarray) -> np.ndarray:
+    """Enteros con el mismo orden que los float64: floats consecutivos dan enteros consecutivos"""
+    bits = np.asarray(x, dtype=np.float64).view(np.int64)
+    return bits ^ ((bits >> 63) & _SIGN_MASK)
+
+
+def _from_ordered_keys(keys: np.ndarray) -> np.ndarray:
+    return (keys ^ ((keys >> 63) & _SIGN_MASK)).view(np.float64)
+
+
+def _largest_satisfying(predicate, n: int) -> np.ndarray:
+    """
+    Para n condiciones monótonas (verdaderas hasta cierto x y falsas después),
+    devuelve el mayor float64 finito que cumple cada una, buscando por
+    bisección entre floats consecutivos. -inf si ninguno la cumple.
+    """
+    lo = _ordered_keys(np.full(n, -_FLOAT64_MAX))
+    hi = _ordered_keys(np.full(n, _FLOAT64_MAX))
+    at_lowest = predicate(_from_ordered_keys(lo))
+    at_highest = predicate(_from_ordered_keys(hi))
+
+    # Invariante: la condición se cumple en lo y no en hi
+    searching = at_lowest & ~at_highest
+    while True:
+        pending = searching & (lo < hi - 1)
+        if not pending.any():
+            break
+        mid = (lo >> 1) + (hi >> 1) + (lo & hi & 1)
+        holds = predicate(_from_ordered_keys(mid))
+        lo = np.where(pending & holds, mid, lo)
+        hi = np.where(pending & ~holds, mid, hi)
+
+    result = np.full(n, -np.inf)
+    result[searching] = _from_ordered_keys(lo)[searching]
+    result[at_highest] = _FLOAT64_MAX
+    return result
+
+
+def _sklearn_scaled(x: np.ndarray, mean: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    """El valor que compara sklearn: (x - media) / escala en float64, convertido a float32"""
+    with np.errstate(over="ignore", invalid="ignore"):
+        return ((x - mean) / scale).astype(np.float32).astype(np.float64)
+
+
+def _internal_nodes(forest: FlatForest) -> np.ndarray:
+    return forest.children[1::2] != np.arange(len(forest.feature))
+
+
+def fold_scaler(forest: FlatForest, scaler: FlatScaler) -> FlatForest:
+    """
+    Pliega el escalador en los umbrales del bosque.
+
+    sklearn envía una fila a la izquierda si float32((x - media) / escala) <= umbral.
+    Esa expresión es monótona en x, así que las x que van a la izquierda son
+    exactamente x <= T, con T el mayor float64 que todavía cumple el corte.
+    Con esos T el bosque recibe las características sin escalar y decide igual
+    que escalador + modelo, bit a bit.
+    """
+    if forest.folded:
+        raise ValueError("El bosque ya tiene el escalador plegado")
+
+    internal = _internal_nodes(forest)
+    features = forest.feature[internal]
+    mean, scale = scaler.mean[features], scaler.scale[features]
+    thresholds = forest.threshold[internal]
+
+    folded_threshold = np.zeros_like(forest.threshold)
+    folded_threshold[internal] = _largest_satisfying(
+        lambda x: _sklearn_scaled(x, mean, scale) <= thresholds, len(thresholds)
+    )
+
+    # Fuera de [lower, upper] el escalado da ±inf en float32 y sklearn rechaza la fila
+    float32_max = np.finfo(np.float32).max
+    upper = _largest_satisfying(
+        lambda x: _sklearn_scaled(x, scaler.mean, scaler.scale) <= float32_max, forest.n_features
+    )
+    below = _largest_satisfying(
+        lambda x: _sklearn_scaled(x, scaler.mean, scaler.scale) < -float32_max, forest.n_features
+    )
+    lower = np.nextafter(below, np.inf)
+
+    return FlatForest(
+        children=forest.children,
+        feature=forest.feature,
+        threshold=np.ascontiguousarray(folded_threshold),
+        value=forest.value,
+        roots=forest.roots,
+        classes=forest.classes,
+        max_depth=forest.max_depth,
+        n_features=forest.n_features,
+        input_bounds=np.stack([lower, upper])
+    )
+
+
+def save_flat_artifacts(directory: str, forest: FlatForest, scaler: FlatScaler, manifest: dict) -> None:
+    """Guarda bosque, escalador y manifiesto en un directorio existente"""
+    forest.save(directory)
+    scaler.save(directory)
+    manifest = dict(manifest, max_depth=forest.max_depth, n_features=forest.n_features, folded=forest.folded)
+    with open(os.path.join(directory, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def read_flat_manifest(directory: str) -> Optional[dict]:
+    """Manifiesto de un directorio exportado, o None si no existe"""
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def load_flat_artifacts(directory: str, manifest: dict) -> Tuple[FlatForest, FlatScaler]:
+    """Abre bosque (mapeado en memoria) y escalador desde un directorio exportado"""
+    forest = FlatForest.load(
+        directory, manifest["max_depth"], manifest["n_features"], folded=manifest.get("folded", False)
+    )
+    return forest, FlatScaler.load(directory)
+
+
+def verification_sample(forest: FlatForest, n_rows: int = 1024, seed: int = 0) -> np.ndarray:
+    """
+    Genera filas de prueba (en el espacio escalado) para comparar el motor con
+    sklearn, incluyendo valores exactamente iguales a los umbrales de corte.
+    """
+    rng = np.random.default_rng(seed)
+    X = rng.normal(scale=1.5, size=(n_rows, forest.n_features))
+
+    internal = forest.children[1::2] != np.arange(len(forest.feature))
+    for feature_index in range(forest.n_features):
+        thresholds = forest.threshold[internal & (forest.feature == feature_index)]
+        if len(thresholds) == 0:
+            continue
+        rows = rng.random(n_rows) < 0.5
+        X[rows, feature_index] = rng.choice(thresholds, size=rows.sum()).astype(np.float32)
+
+    return X
+
+
+def folded_verification_sample(forest: FlatForest, scaler: FlatScaler, n_rows: int = 4096, seed: int = 0) -> np.ndarray:
+    """
+    Filas de prueba en el espacio original para un bosque plegado: incluyen
+    cada umbral plegado y el float siguiente, que es justo donde un pliegue
+    inexacto cambiaría de rama.
+    """
+    rng = np.random.default_rng(seed)
+    X = scaler.mean + scaler.scale * rng.normal(scale=1.5, size=(n_rows, forest.n_features))
+
+    internal = _internal_nodes(forest)
+    lower, upper = forest.input_bounds
+    for feature_index in range(forest.n_features):
+        thresholds = forest.threshold[internal & (forest.feature == feature_index)]
+        thresholds = thresholds[(thresholds >= lower[feature_index]) & (thresholds < upper[feature_index])]
+        if len(thresholds) == 0:
+            continue
+        rows = rng.random(n_rows) < 0.5
+        picked = rng.choice(thresholds, size=rows.sum())
+        X[rows, feature_index] = np.where(rng.random(len(picked)) < 0.5, picked, np.nextafter(picked, np.inf))
+
+    return X
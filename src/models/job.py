@@ -0,0 +1,69 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from config import Base
+import datetime
+import json
+
+class Job(Base):
+    """Trabajo en segundo plano del flujo carga → predicción (ver services/job_service.py)"""
+    __tablename__ = 'jobs'
+
+    id = Column(String(32), primary_key=True)  # uuid4 en hexadecimal
+    kind = Column(String(20), nullable=False)  # parse, predict
+    status = Column(String(20), nullable=False, default='queued', index=True)  # queued, running, success, error
+
+    # Etapa actual y avance dentro de ella
+    stage = Column(String(20), nullable=True)  # parse, predict, persist
+    processed = Column(Integer, default=0)
+    total = Column(Integer, nullable=True)
+
+    # Parámetros y resultado (JSON)
+    params = Column(Text, nullable=False)
+    result = Column(Text, nullable=True)
+    error_message = Column(Text, nullable=True)
+
+    # Trabajos iguales en curso se reutilizan en lugar de encolar otro
+    dedupe_key = Column(String(255), nullable=True, index=True)
+
+    user_id = Column(Integer, ForeignKey('usuarios.id', ondelete='SET NULL'), nullable=True)
+    upload_history_id = Column(Integer, ForeignKey('upload_history.id', ondelete='SET NULL'), nullable=True)
+
+    # Ejecución: quién lo tomó, cuántas veces y último latido (para recuperar trabajos interrumpidos)
+    worker_id = Column(String(100), nullable=True)
+    attempts = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    def progress(self):
+        """Avance de la etapa actual entre 0 y 1 (None si todavía no se conoce el total)"""
+        if self.status == 'success':
+            return 1.0
+        if not self.total:
+            return None
+        return round(min(self.processed or 0, self.total) / self.total, 4)
+
+    def progress_dict(self):
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'stage': self.stage,
+            'processed': self.processed or 0,
+            'total': self.total,
+            'progress': self.progress()
+        }
+
+    def to_dict(self):
+        data = self.progress_dict()
+        data.update({
+            'upload_id': self.upload_history_id,
+            'user_id': self.user_id,
+            'attempts': self.attempts,
+            'result': json.loads(self.result) if self.result else None,
+            'error_message': self.error_message,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        })
+        return data
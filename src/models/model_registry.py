@@ -0,0 +1,514 @@
+"""
+Registro de versiones del modelo de deserción.
+
+Cada versión vive en su propio directorio dentro de REGISTRY_DIR con sus
+artefactos (trained_model.pkl, scaler.pkl, model_config.pkl) y un
+metadata.json. El archivo ACTIVE indica la versión en uso; se reemplaza de
+forma atómica, y cada worker lo revisa periódicamente para cambiar de versión
+sin reiniciarse. Las predicciones en curso conservan la versión con la que
+empezaron.
+
+Con MODEL_LOAD_MODE=mmap el bosque y el escalador se exportan una sola vez a
+archivos .npy (subdirectorio flat/ de la versión) y cada worker los abre con
+memoria mapeada, compartiendo las páginas en lugar de deserializar su copia.
+
+Uso desde src/:
+    python -m models.model_registry list
+    python -m models.model_registry register <version> <directorio_con_artefactos>
+    python -m models.model_registry activate <version>
+    python -m models.model_registry export [version]
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import warnings
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import joblib
+import numpy as np
+
+from models.forest_engine import (
+    FlatForest,
+    FlatScaler,
+    fold_scaler,
+    folded_verification_sample,
+    load_flat_artifacts,
+    read_flat_manifest,
+    save_flat_artifacts,
+    verification_sample,
+)
+
+logger = logging.getLogger(__name__)
+
+# Directorio histórico de artefactos: se usa como versión inicial si el registro está vacío
+MODEL_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "scripts", "models", "trained"))
+REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", os.path.join(MODEL_DIR, "versions"))
+
+# Cada cuántos segundos un worker revisa si cambió la versión activa
+RELOAD_CHECK_SECONDS = float(os.getenv("MODEL_RELOAD_CHECK_SECONDS", "5"))
+
+# "flat" usa el motor de arreglos planos; "sklearn" fuerza el RandomForest original
+INFERENCE_ENGINE = os.getenv("INFERENCE_ENGINE", "flat").lower()
+
+# "pickle" deserializa los artefactos en cada worker; "mmap" abre la exportación
+# .npy con memoria mapeada, compartida entre todos los workers del contenedor
+MODEL_LOAD_MODE = os.getenv("MODEL_LOAD_MODE", "pickle").lower()
+
+# Plegar el StandardScaler en los umbrales del bosque (se omite el paso de escalado)
+FOLD_SCALER = os.getenv("FOLD_SCALER", "true").lower() == "true"
+
+ACTIVE_FILE = "ACTIVE"
+METADATA_FILE = "metadata.json"
+MODEL_FILE = "trained_model.pkl"
+SCALER_FILE = "scaler.pkl"
+CONFIG_FILE = "model_config.pkl"
+ARTIFACT_FILES = (MODEL_FILE, SCALER_FILE, CONFIG_FILE)
+FLAT_DIR = "flat"
+# Cambia cuando cambia el contenido de flat/; una exportación de otro formato se regenera
+FLAT_FORMAT = 2
+
+VERSION_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{0,49}$")
+
+
+class ModelBundle:
+    """Una versión cargada del modelo. No se modifica después de creada."""
+
+    def __init__(
+        self,
+        version: str,
+        model,
+        scaler,
+        config: Dict,
+        metadata: Dict,
+        engine: Optional[FlatForest] = None,
+        directory: Optional[str] = None
+    ):
+        self.version = version
+        self._model = model
+        self.scaler = scaler
+        self.config = config
+        self.metadata = metadata
+        self.engine = engine
+        self.directory = directory
+        self._explainer = None
+
+    @property
+    def model(self):
+        """RandomForest de sklearn; en modo mmap solo se deserializa si se necesita como respaldo"""
+        if self._model is None:
+            self._model = joblib.load(os.path.join(self.directory, MODEL_FILE))
+        return self._model
+
+    def predict(self, X) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Devuelve (etiquetas, probabilidades) a partir de las características
+        preparadas, sin escalar. Con el escalador plegado no hay paso de escalado.
+        """
+        if self.engine is not None and self.engine.folded:
+            try:
+                return self.engine.predict_with_proba(X)
+            except ValueError as e:
+                logger.warning(f"⚠️ Motor plano no aplicable, usando sklearn: {e}")
+                X_scaled = self.scaler.transform(X)
+                return self.model.predict(X_scaled), self.model.predict_proba(X_scaled)
+        return self.predict_with_proba(self.scaler.transform(X))
+
+    def predict_with_proba(self, X_scaled) -> Tuple[np.ndarray, np.ndarray]:
+        """Devuelve (etiquetas, probabilidades) para características ya escaladas"""
+        if self.engine is not None and not self.engine.folded:
+            try:
+                return self.engine.predict_with_proba(X_scaled)
+            except ValueError as e:
+                logger.warning(f"⚠️ Motor plano no aplicable, usando sklearn: {e}")
+        return self.model.predict(X_scaled), self.model.predict_proba(X_scaled)
+
+    def explain(self, X) -> Tuple[float, np.ndarray]:
+        """
+        Devuelve (sesgo, contribuciones) de cada característica a la probabilidad
+        de deserción, a partir de las características preparadas sin escalar.
+        """
+        if self.engine is not None and self.engine.folded:
+            try:
+                return self.engine.contributions(X)
+            except ValueError as e:
+                logger.warning(f"⚠️ Motor plano no aplicable para explicar, usando umbrales escalados: {e}")
+        return self._scaled_explainer().contributions(self.scaler.transform(X))
+
+    def _scaled_explainer(self) -> FlatForest:
+        """Bosque con umbrales sobre características escaladas (sin plegar), creado al primer uso"""
+        if self.engine is not None and not self.engine.folded:
+            return self.engine
+        if self._explainer is None:
+            self._explainer = FlatForest.from_sklearn(self.model)
+        return self._explainer
+
+
+def fold_engine(engine: FlatForest, model, scaler) -> FlatForest:
+    """
+    Pliega el escalador en los umbrales del motor. Solo se usa si reproduce
+    exactamente al par escalador + modelo de sklearn; si no, se devuelve el
+    motor sin plegar.
+    """
+    if not FOLD_SCALER:
+        return engine
+    try:
+        folded = fold_scaler(engine, FlatScaler.from_sklearn(scaler))
+        sample = folded_verification_sample(folded, FlatScaler.from_sklearn(scaler))
+        with warnings.catch_warnings():
+            # El escalador se entrenó con nombres de columnas; aquí se verifica con un arreglo
+            warnings.simplefilter("ignore", UserWarning)
+            same_predictions = folded.matches(model, sample, scaler=scaler)
+        if same_predictions:
+            logger.info("✅ Escalador plegado en los umbrales del bosque")
+            return folded
+        logger.error("❌ El bosque plegado no coincide con escalador + modelo, se mantiene el escalado")
+    except Exception as e:
+        logger.error(f"❌ No se pudo plegar el escalador, se mantiene el escalado: {str(e)}")
+    return engine
+
+
+def build_engine(model, scaler) -> Optional[FlatForest]:
+    """
+    Exporta el bosque al motor plano y pliega el escalador en sus umbrales.
+    El RandomForest de sklearn queda como respaldo y como referencia: si el
+    motor no reproduce exactamente sus resultados, no se usa.
+    """
+    if INFERENCE_ENGINE != "flat":
+        return None
+    try:
+        engine = FlatForest.from_sklearn(model)
+        if not engine.matches(model, verification_sample(engine)):
+            logger.error("❌ El motor plano no coincide con sklearn, se usará sklearn")
+            return None
+        logger.info(f"✅ Motor de inferencia plano listo ({engine.n_trees} árboles)")
+    except Exception as e:
+        logger.error(f"❌ No se pudo exportar el bosque, se usará sklearn: {str(e)}")
+        return None
+    return fold_engine(engine, model, scaler)
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _artifact_fingerprint(directory: str) -> Dict[str, str]:
+    """Huella de los pickles de origen: si cambian, la exportación .npy queda obsoleta"""
+    return {name: _file_sha256(os.path.join(directory, name)) for name in (MODEL_FILE, SCALER_FILE)}
+
+
+def export_flat_artifacts(directory: str) -> Tuple[str, Dict]:
+    """
+    Exporta el bosque y el escalador de una versión a flat/ (arreglos .npy),
+    solo si no existe una exportación de los mismos pickles. La exportación
+    se verifica contra sklearn antes de publicarse.
+
+    Returns:
+        (directorio flat/, manifiesto)
+    """
+    flat_dir = os.path.join(directory, FLAT_DIR)
+    source = _artifact_fingerprint(directory)
+    manifest = read_flat_manifest(flat_dir)
+    if manifest is not None and manifest.get("source") == source and manifest.get("format") == FLAT_FORMAT:
+        return flat_dir, manifest
+
+    model = joblib.load(os.path.join(directory, MODEL_FILE))
+    scaler = joblib.load(os.path.join(directory, SCALER_FILE))
+    forest = FlatForest.from_sklearn(model)
+    flat_scaler = FlatScaler.from_sklearn(scaler)
+
+    sample = verification_sample(forest)
+    with warnings.catch_warnings():
+        # El escalador se entrenó con nombres de columnas; aquí se verifica con un arreglo
+        warnings.simplefilter("ignore", UserWarning)
+        same_scaling = np.array_equal(flat_scaler.transform(sample), scaler.transform(sample))
+    if not same_scaling or not forest.matches(model, sample):
+        raise ValueError("La exportación no reproduce exactamente a sklearn")
+    forest = fold_engine(forest, model, scaler)
+
+    tmp_dir = f"{flat_dir}.{os.getpid()}.tmp"
+    stale_dir = f"{flat_dir}.{os.getpid()}.old"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    save_flat_artifacts(tmp_dir, forest, flat_scaler, {
+        "source": source,
+        "format": FLAT_FORMAT,
+        "exported_at": datetime.utcnow().isoformat()
+    })
+
+    # Los workers que ya mapearon la exportación anterior conservan sus archivos abiertos
+    if manifest is not None:
+        try:
+            os.rename(flat_dir, stale_dir)
+        except OSError:
+            pass
+    try:
+        os.rename(tmp_dir, flat_dir)
+    except OSError:
+        # Otro proceso publicó su exportación primero
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    shutil.rmtree(stale_dir, ignore_errors=True)
+
+    manifest = read_flat_manifest(flat_dir)
+    if manifest is None or manifest.get("source") != source:
+        raise ValueError(f"No se pudo publicar la exportación en {flat_dir}")
+    logger.info(f"📦 Bosque exportado para memoria mapeada en {flat_dir}")
+    return flat_dir, manifest
+
+
+def _load_mapped_bundle(version: str, directory: str, config: Dict, metadata: Dict) -> ModelBundle:
+    """Abre la exportación .npy de una versión; sklearn no se importa salvo como respaldo"""
+    flat_dir, manifest = export_flat_artifacts(directory)
+    engine, scaler = load_flat_artifacts(flat_dir, manifest)
+    logger.info(f"✅ Modelo versión {version} mapeado en memoria desde {flat_dir}")
+    return ModelBundle(version, None, scaler, config, metadata, engine, directory)
+
+
+def load_bundle(version: str, directory: str) -> ModelBundle:
+    """Carga los artefactos de una versión desde su directorio"""
+    config = joblib.load(os.path.join(directory, CONFIG_FILE))
+
+    metadata_path = os.path.join(directory, METADATA_FILE)
+    metadata = {}
+    if os.path.exists(metadata_path):
+        with open(metadata_path, encoding="utf-8") as f:
+            metadata = json.load(f)
+
+    if MODEL_LOAD_MODE == "mmap" and INFERENCE_ENGINE == "flat":
+        try:
+            bundle = _load_mapped_bundle(version, directory, config, metadata)
+            logger.info(f"✅ Columnas esperadas: {config['expected_columns']}")
+            return bundle
+        except Exception as e:
+            logger.error(f"❌ No se pudo usar la exportación mapeada, se cargará con pickle: {str(e)}")
+
+    model = joblib.load(os.path.join(directory, MODEL_FILE))
+    scaler = joblib.load(os.path.join(directory, SCALER_FILE))
+
+    logger.info(f"✅ Modelo versión {version} cargado desde {directory}")
+    logger.info(f"✅ Columnas esperadas: {config['expected_columns']}")
+    return ModelBundle(version, model, scaler, config, metadata, build_engine(model, scaler), directory)
+
+
+def _write_atomic(path: str, content: str) -> None:
+    """Escribe un archivo de texto reemplazándolo de forma atómica"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class ModelRegistry:
+    """Versiones disponibles del modelo y puntero a la versión activa"""
+
+    def __init__(self, registry_dir: str = REGISTRY_DIR, legacy_dir: str = MODEL_DIR):
+        self.registry_dir = registry_dir
+        self.legacy_dir = legacy_dir
+        self._bundle: Optional[ModelBundle] = None
+        self._legacy_version: Optional[str] = None
+        self._active_mtime: Optional[float] = None
+        self._last_check = 0.0
+        self._load_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Versiones en disco
+    # ------------------------------------------------------------------
+    @property
+    def legacy_version(self) -> str:
+        """Versión de los artefactos en el directorio histórico (model_config['model_version'])"""
+        if self._legacy_version is None:
+            config = joblib.load(os.path.join(self.legacy_dir, CONFIG_FILE))
+            self._legacy_version = str(config.get('model_version', 'legacy'))
+        return self._legacy_version
+
+    def version_dir(self, version: str) -> str:
+        """Directorio de una versión; la versión histórica se lee del directorio original"""
+        if not VERSION_PATTERN.match(version):
+            raise ValueError(f"Nombre de versión inválido: '{version}'")
+        directory = os.path.join(self.registry_dir, version)
+        if os.path.isdir(directory):
+            return directory
+        if version == self.legacy_version:
+            return self.legacy_dir
+        raise ValueError(f"La versión '{version}' no existe en el registro")
+
+    def list_versions(self) -> List[Dict]:
+        """Lista las versiones registradas con sus metadatos"""
+        active = self.active_version()
+        versions = {}
+
+        if os.path.isdir(self.registry_dir):
+            for name in sorted(os.listdir(self.registry_dir)):
+                directory = os.path.join(self.registry_dir, name)
+                if not os.path.isdir(directory) or not VERSION_PATTERN.match(name):
+                    continue
+                metadata = {}
+                metadata_path = os.path.join(directory, METADATA_FILE)
+                if os.path.exists(metadata_path):
+                    with open(metadata_path, encoding="utf-8") as f:
+                        metadata = json.load(f)
+                versions[name] = metadata
+
+        legacy = self.legacy_version
+        if legacy not in versions:
+            versions[legacy] = {'version': legacy, 'source': 'legacy'}
+
+        return [
+            {'version': version, 'active': version == active, 'metadata': metadata}
+            for version, metadata in versions.items()
+        ]
+
+    def register(self, version: str, source_dir: str, metadata: Optional[Dict] = None) -> Dict:
+        """
+        Copia los artefactos de source_dir como una nueva versión del registro.
+        La versión aparece completa o no aparece: se arma en un directorio
+        temporal y luego se renombra.
+        """
+        if not VERSION_PATTERN.match(version):
+            raise ValueError(f"Nombre de versión inválido: '{version}'")
+
+        target_dir = os.path.join(self.registry_dir, version)
+        if os.path.exists(target_dir):
+            raise ValueError(f"La versión '{version}' ya está registrada")
+
+        missing = [name for name in ARTIFACT_FILES if not os.path.exists(os.path.join(source_dir, name))]
+        if missing:
+            raise ValueError(f"Faltan artefactos en {source_dir}: {missing}")
+
+        os.makedirs(self.registry_dir, exist_ok=True)
+        tmp_dir = os.path.join(self.registry_dir, f".{version}.{os.getpid()}.tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name in ARTIFACT_FILES:
+            shutil.copy2(os.path.join(source_dir, name), os.path.join(tmp_dir, name))
+
+        config = joblib.load(os.path.join(tmp_dir, CONFIG_FILE))
+        version_metadata = {
+            'version': version,
+            'registered_at': datetime.utcnow().isoformat(),
+            'training_date': config.get('training_date'),
+            'feature_columns': config.get('feature_columns'),
+        }
+        version_metadata.update(metadata or {})
+        with open(os.path.join(tmp_dir, METADATA_FILE), "w", encoding="utf-8") as f:
+            json.dump(version_metadata, f, indent=2, ensure_ascii=False)
+
+        os.rename(tmp_dir, target_dir)
+        logger.info(f"📦 Versión {version} registrada en {target_dir}")
+        return version_metadata
+
+    def export(self, version: Optional[str] = None) -> str:
+        """Prepara la exportación mapeable de una versión (por defecto la activa)"""
+        version = version or self.active_version()
+        flat_dir, _ = export_flat_artifacts(self.version_dir(version))
+        return flat_dir
+
+    # ------------------------------------------------------------------
+    # Versión activa
+    # ------------------------------------------------------------------
+    def _active_path(self) -> str:
+        return os.path.join(self.registry_dir, ACTIVE_FILE)
+
+    def active_version(self) -> str:
+        """Versión indicada por el archivo ACTIVE, o la histórica si no existe"""
+        try:
+            with open(self._active_path(), encoding="utf-8") as f:
+                version = f.read().strip()
+            if version:
+                return version
+        except FileNotFoundError:
+            pass
+        return self.legacy_version
+
+    def activate(self, version: str) -> ModelBundle:
+        """
+        Carga una versión y la deja activa para todos los workers. El puntero
+        solo se actualiza si la versión cargó correctamente.
+        """
+        bundle = load_bundle(version, self.version_dir(version))
+        os.makedirs(self.registry_dir, exist_ok=True)
+        _write_atomic(self._active_path(), version + "\n")
+        self._swap(bundle)
+        return bundle
+
+    def current(self) -> ModelBundle:
+        """
+        Devuelve la versión activa. Quien la pide debe usar la misma instancia
+        durante toda la operación para no mezclar versiones.
+        """
+        if self._bundle is None:
+            with self._load_lock:
+                if self._bundle is None:
+                    version = self.active_version()
+                    self._active_mtime = self._read_active_mtime()
+                    self._swap(load_bundle(version, self.version_dir(version)))
+        elif time.monotonic() - self._last_check >= RELOAD_CHECK_SECONDS:
+            self._reload_if_changed()
+        return self._bundle
+
+    def _read_active_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self._active_path()).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _reload_if_changed(self) -> None:
+        """Si otro proceso cambió ACTIVE, carga la nueva versión sin bloquear a los demás hilos"""
+        self._last_check = time.monotonic()
+        mtime = self._read_active_mtime()
+        if mtime == self._active_mtime:
+            return
+
+        # Si otro hilo ya está cargando, se sigue usando la versión actual
+        if not self._load_lock.acquire(blocking=False):
+            return
+        try:
+            version = self.active_version()
+            if version != self._bundle.version:
+                logger.info(f"🔄 Cambiando de modelo {self._bundle.version} → {version}")
+                self._swap(load_bundle(version, self.version_dir(version)))
+            self._active_mtime = mtime
+        except Exception as e:
+            logger.error(f"❌ No se pudo cargar la versión activa, se mantiene {self._bundle.version}: {e}")
+        finally:
+            self._load_lock.release()
+
+    def _swap(self, bundle: ModelBundle) -> None:
+        # Asignar la referencia es atómico: cada predicción ve la versión vieja o la nueva completa
+        self._bundle = bundle
+        self._last_check = time.monotonic()
+
+
+registry = ModelRegistry()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    args = sys.argv[1:]
+
+    if args[:1] == ["list"]:
+        for item in registry.list_versions():
+            marker = "*" if item['active'] else " "
+            print(f"{marker} {item['version']}  {item['metadata']}")
+    elif args[:1] == ["register"] and len(args) == 3:
+        print(registry.register(args[1], args[2]))
+    elif args[:1] == ["activate"] and len(args) == 2:
+        registry.activate(args[1])
+        print(f"✅ Versión activa: {args[1]}")
+    elif args[:1] == ["export"] and len(args) <= 2:
+        print(f"✅ Exportación lista en {registry.export(args[1] if len(args) == 2 else None)}")
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,157 @@
+"""
+Caché de predicciones por vector de características.
+
+Los docentes vuelven a subir casi la misma lista de estudiantes varias veces:
+las filas cuyas características preparadas ya se predijeron con la misma
+versión del modelo se responden desde el caché sin escalar ni evaluar el
+bosque. El caché es por worker y tiene tamaño máximo con expulsión LRU.
+
+La versión del modelo es parte de la clave: al cambiar de versión en caliente,
+las predicciones que siguen con la versión anterior y las que ya usan la nueva
+conviven sin pisarse, y las entradas viejas salen por LRU a medida que dejan
+de usarse.
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from models.model_registry import ModelBundle
+
+logger = logging.getLogger(__name__)
+
+# Máximo de filas guardadas por worker (0 desactiva el caché)
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "100000"))
+
+
+def feature_hashes(features: np.ndarray, model_version: str) -> List[bytes]:
+    """
+    Hash (blake2b de 16 bytes) de cada fila de características preparadas,
+    combinado con la versión del modelo.
+    """
+    features = np.ascontiguousarray(features, dtype=np.float64)
+    # Cada fila como un único bloque de bytes, sin copiar fila por fila
+    rows = features.view(np.dtype((np.void, features.shape[1] * features.itemsize))).ravel().tolist()
+    prefix = model_version.encode("utf-8") + b"\0"
+    return [hashlib.blake2b(prefix + row, digest_size=16).digest() for row in rows]
+
+
+class PredictionCache:
+    """LRU de (etiqueta, probabilidades) indexado por hash de características"""
+
+    def __init__(self, max_size: int = PREDICTION_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[bytes, Tuple[object, Tuple[float, ...]]]" = OrderedDict()
+        self._model_version = None
+        self._seen_versions = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.model_changes = 0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _note_version(self, model_version: str) -> None:
+        """Registra la versión de la consulta (con el lock tomado); no borra entradas"""
+        if model_version not in self._seen_versions:
+            if self._seen_versions:
+                self.model_changes += 1
+                logger.info(f"🔄 Caché de predicciones: nueva versión del modelo {model_version} "
+                            f"(las entradas de {self._model_version} salen por LRU)")
+            self._seen_versions.add(model_version)
+        self._model_version = model_version
+
+    def predict(
+        self,
+        bundle: ModelBundle,
+        X: pd.DataFrame,
+        keys: Optional[List[bytes]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Predice solo las filas que no están en el caché.
+
+        Args:
+            bundle: Versión del modelo a usar
+            X: Características preparadas (salida de prepare_features_real)
+            keys: feature_hashes(X, bundle.version) si ya se calcularon
+
+        Returns:
+            (etiquetas, probabilidades), igual que bundle.predict
+        """
+        if self.max_size <= 0 or len(X) == 0:
+            return bundle.predict(X)
+
+        if keys is None:
+            keys = feature_hashes(X.to_numpy(dtype=np.float64), bundle.version)
+        cached = [None] * len(keys)
+        with self._lock:
+            self._note_version(bundle.version)
+            for position, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    cached[position] = entry
+
+        missing = [position for position, entry in enumerate(cached) if entry is None]
+        n_hits = len(keys) - len(missing)
+
+        if missing:
+            X_missing = X.iloc[missing] if n_hits else X
+            labels_missing, proba_missing = bundle.predict(X_missing)
+            new_entries = list(zip(labels_missing.tolist(), map(tuple, proba_missing.tolist())))
+            for position, entry in zip(missing, new_entries):
+                cached[position] = entry
+            self._store([keys[position] for position in missing], new_entries)
+
+        with self._lock:
+            self.hits += n_hits
+            self.misses += len(missing)
+
+        if n_hits:
+            logger.info(f"⚡ Caché de predicciones: {n_hits}/{len(keys)} filas sin inferencia")
+
+        classes = bundle.engine.classes if bundle.engine is not None else bundle.model.classes_
+        y_pred = np.array([entry[0] for entry in cached], dtype=classes.dtype)
+        y_pred_proba = np.array([entry[1] for entry in cached], dtype=np.float64)
+        return y_pred, y_pred_proba
+
+    def _store(self, keys: List[bytes], entries: List[Tuple]) -> None:
+        with self._lock:
+            # Las claves incluyen la versión: filas de otra versión no se mezclan
+            for key, entry in zip(keys, entries):
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict:
+        """Contadores de uso del caché en este worker"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "model_version": self._model_version,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "model_changes": self.model_changes
+            }
+
+
+prediction_cache = PredictionCache()
+
+
+def get_prediction_cache_stats() -> Dict:
+    """Contadores del caché del proceso actual (se puede enviar al pool de procesos)"""
+    return prediction_cache.stats()
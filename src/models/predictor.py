@@ -1,39 +1,37 @@
 import pandas as pd
-import joblib  
 import os
-from typing import List, Dict
+from typing import List, Dict, Tuple, Iterator, Optional
 import logging
 import time
 from config import SessionLocal
 from models import ResultadoPrediccion
+from models.model_registry import ModelBundle, load_bundle, registry
+from models.prediction_cache import prediction_cache, feature_hashes
+from services.executor_service import call_cpu_bound
+from services.ingestion_service import iter_upload_chunks, load_upload_frame
+from services.prediction_run_service import start_run, publish_run, discard_run
+from utils.date_parser import parse_date_column
+from sqlalchemy import insert
 import numpy as np
-from datetime import datetime, date
+from datetime import date
 
 # Configuración de logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# 1. Configuración de paths segura - UBICACIÓN CORRECTA
-MODEL_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "scripts", "models", "trained")
-MODEL_PATH = os.path.join(MODEL_DIR, "trained_model.pkl")
-SCALER_PATH = os.path.join(MODEL_DIR, "scaler.pkl")
-CONFIG_PATH = os.path.join(MODEL_DIR, "model_config.pkl")
-
-# 2. Carga segura del modelo, scaler y configuración
+# Carga de la versión activa del modelo desde el registro. Cada predicción toma
+# una versión (ModelBundle) al empezar y la usa hasta terminar, así un cambio de
+# versión en caliente nunca mezcla modelos dentro de un mismo archivo.
 try:
-    model = joblib.load(MODEL_PATH)
-    scaler = joblib.load(SCALER_PATH)
-    config = joblib.load(CONFIG_PATH)
+    registry.current()
     logger.info("✅ Modelo ajustado a datos reales cargado exitosamente")
-    logger.info(f"✅ Columnas esperadas: {config['expected_columns']}")
-
 except Exception as e:
     logger.error(f"❌ Error al cargar el modelo: {str(e)}")
     raise
 
-def validate_input_data_real(df: pd.DataFrame) -> bool:
+def validate_input_data_real(df: pd.DataFrame, bundle: Optional[ModelBundle] = None) -> bool:
     """Valida que el DataFrame tenga las columnas exactas del sistema real"""
-    expected_columns = config['expected_columns']
+    expected_columns = (bundle or registry.current()).config['expected_columns']
 
     # Verificar columnas críticas mínimas
     critical_columns = ['nota_final', 'asistencia', 'inasistencia', 'conducta']
@@ -46,16 +44,17 @@ def validate_input_data_real(df: pd.DataFrame) -> bool:
 
     return True
 
-def prepare_features_real(df: pd.DataFrame) -> pd.DataFrame:
+def prepare_features_real(df: pd.DataFrame, bundle: Optional[ModelBundle] = None) -> pd.DataFrame:
     """Prepara las características exactamente como el modelo entrenado las espera"""
+    config = (bundle or registry.current()).config
     df_features = df.copy()
 
     # 1. Normalizar nota_final a escala 0-1 (desde escala 0-20)
     df_features['nota_normalizada'] = df_features['nota_final'] / 20.0
 
-    # 2. Codificar conducta usando el mapeo del modelo
+    # 2. Codificar conducta usando el mapeo del modelo (desde la caché llega categórica)
     conducta_map = config['conducta_map']
-    df_features['conducta_encoded'] = df_features['conducta'].map(conducta_map).fillna(1)  # default neutral
+    df_features['conducta_encoded'] = df_features['conducta'].astype(object).map(conducta_map).fillna(1)  # default neutral
 
     # 3. Normalizar asistencia e inasistencia a escala 0-1
     df_features['asistencia_normalizada'] = df_features['asistencia'] / 100.0
@@ -83,192 +82,378 @@ def classify_risk_level(prediction_proba: float) -> str:
     else:
         return "Bajo"
 
-def predict_desertion(file_path: str) -> List[Dict]:
+# Nombre legible de cada característica del modelo, para los factores de riesgo
+FEATURE_LABELS = {
+    'nota_normalizada': 'Nota final',
+    'conducta_encoded': 'Conducta',
+    'asistencia_normalizada': 'Asistencia',
+    'inasistencia_normalizada': 'Inasistencia',
+    'nota_baja': 'Nota baja',
+    'alta_inasistencia': 'Inasistencia alta',
+    'conducta_problematica': 'Conducta problemática',
+}
+
+# Una característica cuenta como factor de riesgo si sube la probabilidad de
+# deserción al menos esta cantidad; se reportan como máximo RISK_FACTOR_LIMIT
+RISK_FACTOR_MIN_CONTRIBUTION = float(os.getenv("RISK_FACTOR_MIN_CONTRIBUTION", "0.02"))
+RISK_FACTOR_LIMIT = int(os.getenv("RISK_FACTOR_LIMIT", "3"))
+
+def explain_contributions(bundle: ModelBundle, X: pd.DataFrame) -> List[Dict[str, float]]:
+    """
+    Contribución de cada característica a la probabilidad de deserción de cada
+    fila, en una sola pasada vectorizada sobre los caminos de decisión del bosque.
+    """
+    _, contribuciones = bundle.explain(X)
+    columnas = list(X.columns)
+    return [dict(zip(columnas, fila)) for fila in np.round(contribuciones, 4).tolist()]
+
+def risk_factors_from_contributions(contribuciones: Dict[str, float]) -> List[str]:
+    """Características que más suben el riesgo según el modelo, de mayor a menor"""
+    positivas = sorted(
+        (columna for columna, valor in contribuciones.items() if valor >= RISK_FACTOR_MIN_CONTRIBUTION),
+        key=contribuciones.get, reverse=True
+    )
+    return [FEATURE_LABELS.get(columna, columna) for columna in positivas[:RISK_FACTOR_LIMIT]]
+
+# Fecha por defecto cuando el CSV no trae una fecha válida
+FECHA_POR_DEFECTO = date(2025, 10, 6)
+
+# Lista de nombres realistas para generar automáticamente
+NOMBRES_FEMENINOS = [
+    "Ana Sofia Martinez", "Maria Isabel Torres", "Lucia Valentina Herrera",
+    "Camila Andrea Flores", "Valentina Rodriguez", "Sofia Elena Castro",
+    "Isabella Carmen Lopez", "Daniela Alejandra Morales", "Fernanda Gabriela Ruiz",
+    "Alejandra Patricia Silva", "Carolina Beatriz Mendoza", "Natalia Andrea Vargas",
+    "Paola Cristina Jimenez", "Andrea Francisca Rivera", "Gabriela Monserrat Gonzalez"
+]
+NOMBRES_MASCULINOS = [
+    "Carlos Eduardo Ramirez", "Diego Fernando Castro", "Sebastian Jose Morales",
+    "Alejandro David Vargas", "Mateo Nicolas Herrera", "Santiago Miguel Torres",
+    "Andres Felipe Rodriguez", "Gabriel Esteban Martinez", "Daniel Antonio Lopez",
+    "Nicolas Emilio Silva", "Rafael Ignacio Mendoza", "Joaquin Maximiliano Ruiz",
+    "Vicente Agustin Jimenez", "Emilio Tomas Gonzalez", "Benjamin Eduardo Rivera"
+]
+
+def classify_risk_levels(probabilidades: np.ndarray) -> np.ndarray:
+    """Versión vectorizada de classify_risk_level para un arreglo de probabilidades"""
+    return np.select(
+        [probabilidades >= 0.7, probabilidades >= 0.4],
+        ["Alto", "Medio"],
+        default="Bajo"
+    )
+
+def _parse_fecha_column(df: pd.DataFrame) -> np.ndarray:
+    """
+    Convierte la columna 'fecha' completa a un arreglo datetime64[D] con el
+    parser compartido (DD/MM/YYYY, ISO o serie de Excel). Las filas vacías o
+    inválidas quedan con FECHA_POR_DEFECTO.
+    """
+    if 'fecha' not in df.columns:
+        return np.full(len(df), np.datetime64(FECHA_POR_DEFECTO, 'D'))
+
+    resultado = parse_date_column(df['fecha'], FECHA_POR_DEFECTO)
+    if len(resultado.invalidas):
+        logger.warning(f"⚠️  {len(resultado.invalidas)} fechas no se pudieron procesar, se usará {FECHA_POR_DEFECTO}")
+    return resultado.fechas
+
+def _student_id_column(df: pd.DataFrame, offset: int = 0) -> np.ndarray:
+    """IDs de estudiante del CSV; las filas sin ID reciben su posición + 1"""
+    ids = np.arange(offset + 1, offset + len(df) + 1, dtype=np.int64)
+    if 'estudiante_id' in df.columns:
+        columna = df['estudiante_id'].reset_index(drop=True)
+        presentes = columna.notna().to_numpy()
+        if presentes.any():
+            ids[presentes] = pd.to_numeric(columna[presentes]).astype(np.int64).to_numpy()
+    return ids
+
+def _student_name_column(df: pd.DataFrame, ids: np.ndarray) -> np.ndarray:
+    """Nombres del CSV; los vacíos se generan alternando listas según el ID"""
+    posicion = (ids - 1) % len(NOMBRES_FEMENINOS)
+    nombres = np.where(
+        ids % 2 == 1,
+        np.array(NOMBRES_FEMENINOS, dtype=object)[posicion],
+        np.array(NOMBRES_MASCULINOS, dtype=object)[posicion]
+    )
+    if 'nombre' in df.columns:
+        columna = df['nombre'].reset_index(drop=True)
+        presentes = columna.notna()
+        limpios = columna[presentes].astype(str).str.strip()
+        limpios = limpios[limpios != '']
+        nombres[limpios.index] = limpios.to_numpy()
+    return nombres
+
+def prediction_record(resultado: Dict, fecha: Optional[date] = None) -> Dict:
+    """
+    Fila de resultados_prediccion a partir de un resultado de predicción.
+    fecha es el objeto date de la fila; si no se pasa, se toma de
+    resultado["fecha"] (ISO) o FECHA_POR_DEFECTO.
+    """
+    if fecha is None:
+        fecha = date.fromisoformat(resultado["fecha"]) if resultado.get("fecha") else FECHA_POR_DEFECTO
+    return {
+        "id_estudiante": resultado["id_estudiante"],
+        "nombre": resultado["nombre"],
+        "nota": resultado["nota_final"],
+        "nota_final": resultado["nota_final"],
+        "conducta": resultado["conducta"],
+        "asistencia": resultado["asistencia"],
+        "inasistencia": resultado["inasistencia"],
+        "tiempo_prediccion": resultado["tiempo_prediccion"],
+        "resultado_prediccion": resultado["resultado_prediccion"],
+        "riesgo_desercion": resultado["riesgo_desercion"],
+        "probabilidad_desercion": resultado["probabilidad_desercion"],
+        "fecha": fecha,  # Usar objeto date, no string
+        "model_version": resultado["model_version"]
+    }
+
+def build_prediction_records(
+    df: pd.DataFrame,
+    y_pred: np.ndarray,
+    y_pred_proba: np.ndarray,
+    tiempo_prediccion: float,
+    offset: int = 0,
+    model_version: Optional[str] = None,
+    hashes: Optional[List[str]] = None,
+    riesgos: Optional[np.ndarray] = None,
+    contribuciones: Optional[List[Dict[str, float]]] = None
+) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Arma los resultados de predicción por columnas completas.
+
+    offset es la posición de la primera fila en el archivo completo (modo
+    streaming), usada para generar IDs y limitar el log de depuración.
+    hashes son los feature_hash de cada fila; riesgos, si se pasan, reemplazan
+    la clasificación por probabilidad (filas reutilizadas en modo incremental).
+    contribuciones son las explicaciones por fila de explain_contributions.
+
+    Returns:
+        (resultados, registros_bd): diccionarios para la respuesta y filas
+        listas para insertar en resultados_prediccion.
+    """
+    ids = _student_id_column(df, offset)
+    nombres = _student_name_column(df, ids)
+    fechas = _parse_fecha_column(df)
+    riesgos = classify_risk_levels(y_pred_proba) if riesgos is None else np.asarray(riesgos)
+    hashes = hashes if hashes is not None else [None] * len(df)
+    contribuciones = contribuciones if contribuciones is not None else [None] * len(df)
+
+    notas = df['nota_final'].astype(float).tolist()
+    asistencias = df['asistencia'].astype(float).tolist()
+    inasistencias = df['inasistencia'].astype(float).tolist()
+    conductas = df['conducta'].astype(str).tolist()
+    predicciones = [str(p) for p in np.asarray(y_pred).astype(int).tolist()]
+    probabilidades = [round(p, 4) for p in np.asarray(y_pred_proba, dtype=float).tolist()]
+
+    ids = ids.tolist()
+    nombres = nombres.tolist()
+    riesgos = riesgos.tolist()
+    fechas_str = np.datetime_as_string(fechas, unit='D').tolist()
+    fechas = fechas.astype(object).tolist()
+
+    # Log para debug - verificar que los valores se están leyendo correctamente
+    for idx in range(min(max(3 - offset, 0), len(notas))):
+        logger.info(f"📊 Fila {offset + idx}: nota_final={notas[idx]}, asistencia={asistencias[idx]}")
+
+    resultados = [
+        {
+            "id_estudiante": estudiante_id,
+            "nombre": nombre,
+            "nota_final": nota,
+            "nota": nota,  # Mantener por compatibilidad con frontend
+            "asistencia": asistencia,
+            "inasistencia": inasistencia,
+            "conducta": conducta,
+            "fecha": fecha_str,
+            "tiempo_prediccion": tiempo_prediccion,
+            "resultado_prediccion": prediccion,
+            "riesgo_desercion": riesgo,
+            "probabilidad_desercion": probabilidad,
+            "model_version": model_version,
+            "feature_hash": feature_hash,
+            "contributions": contribucion,
+            "risk_factors": risk_factors_from_contributions(contribucion) if contribucion is not None else None
+        }
+        for estudiante_id, nombre, nota, asistencia, inasistencia, conducta, fecha_str, prediccion, riesgo, probabilidad, feature_hash, contribucion
+        in zip(ids, nombres, notas, asistencias, inasistencias, conductas, fechas_str, predicciones, riesgos, probabilidades, hashes, contribuciones)
+    ]
+
+    registros_bd = [prediction_record(resultado, fecha) for resultado, fecha in zip(resultados, fechas)]
+
+    return resultados, registros_bd
+
+def save_prediction_records(session, registros_bd: List[Dict], run_id: int) -> None:
+    """Inserta las filas de resultados_prediccion de la corrida run_id en una sola sentencia executemany"""
+    if registros_bd:
+        session.execute(insert(ResultadoPrediccion).values(run_id=run_id), registros_bd)
+
+# Filas por bloque en el modo streaming
+STREAM_CHUNK_SIZE = int(os.getenv("PREDICTION_CHUNK_SIZE", "10000"))
+
+def _score_incremental(
+    bundle: ModelBundle,
+    X: pd.DataFrame,
+    ids: List[int],
+    keys: List[bytes],
+    hashes: List[str],
+    previous: Dict[int, Dict]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[Optional[Dict[str, float]]]]:
+    """
+    Reutiliza la predicción de la carga anterior para cada estudiante cuyo
+    feature_hash no cambió y predice solo el resto. El hash incluye la versión
+    del modelo, así que una fila reutilizada es exactamente lo que daría
+    volver a predecirla.
+
+    Returns:
+        (etiquetas, probabilidades de deserción, niveles de riesgo,
+        contribuciones reutilizadas o None en las filas recalculadas)
+    """
+    anteriores = [previous.get(estudiante_id) for estudiante_id in ids]
+    reutilizables = [
+        anterior if anterior is not None and anterior['feature_hash'] == feature_hash else None
+        for anterior, feature_hash in zip(anteriores, hashes)
+    ]
+    cambiadas = [posicion for posicion, anterior in enumerate(reutilizables) if anterior is None]
+
+    y_pred = np.zeros(len(ids), dtype=np.int64)
+    y_pred_proba = np.zeros(len(ids), dtype=np.float64)
+    riesgos = np.empty(len(ids), dtype=object)
+    contribuciones = [None] * len(ids)
+
+    if cambiadas:
+        etiquetas, probabilidades = prediction_cache.predict(
+            bundle, X.iloc[cambiadas], [keys[posicion] for posicion in cambiadas]
+        )
+        y_pred[cambiadas] = np.asarray(etiquetas).astype(np.int64)
+        y_pred_proba[cambiadas] = probabilidades[:, 1]
+        riesgos[cambiadas] = classify_risk_levels(probabilidades[:, 1])
+
+    for posicion, anterior in enumerate(reutilizables):
+        if anterior is not None:
+            y_pred[posicion] = int(anterior['resultado_prediccion'])
+            y_pred_proba[posicion] = anterior['probabilidad_desercion']
+            riesgos[posicion] = anterior['riesgo_desercion']
+            contribuciones[posicion] = anterior['contributions']
+
+    logger.info(f"♻️ Modo incremental: {len(ids) - len(cambiadas)} estudiantes sin cambios, {len(cambiadas)} recalculados")
+    return y_pred, y_pred_proba, riesgos, contribuciones
+
+def score_dataframe(
+    df: pd.DataFrame,
+    offset: int = 0,
+    bundle: Optional[ModelBundle] = None,
+    previous: Optional[Dict[int, Dict]] = None
+) -> Tuple[List[Dict], List[Dict], float]:
+    """
+    Prepara y predice un DataFrame ya normalizado.
+
+    Args:
+        df: Datos con columnas normalizadas
+        offset: Posición de la primera fila dentro del archivo completo
+        bundle: Versión del modelo a usar (por defecto, la activa)
+        previous: Predicciones de la carga anterior por estudiante_id (modo
+                  incremental); los estudiantes sin cambios no se vuelven a predecir
+
+    Returns:
+        (resultados, registros_bd, tiempo_prediccion)
+    """
+    bundle = bundle or registry.current()
+
+    # Preparar características para el modelo
+    X = prepare_features_real(df, bundle)
+
+    # Hash por fila de las características + versión del modelo
+    keys = feature_hashes(X.to_numpy(dtype=np.float64), bundle.version)
+    hashes = [key.hex() for key in keys]
+
+    # Medir tiempo de predicción
+    start_time = time.time()
+
+    riesgos = None
+    contribuciones = [None] * len(X)
+    if previous:
+        ids = _student_id_column(df, offset).tolist()
+        y_pred, y_pred_proba, riesgos, contribuciones = _score_incremental(bundle, X, ids, keys, hashes, previous)
+    else:
+        # Predecir (etiqueta y probabilidad en una sola pasada) sobre las características
+        # sin escalar: el escalador está plegado en los umbrales del bosque. Las filas
+        # ya vistas con esta versión del modelo salen del caché sin inferencia
+        y_pred, y_pred_proba = prediction_cache.predict(bundle, X, keys)
+        y_pred_proba = y_pred_proba[:, 1]
+
+    end_time = time.time()
+    tiempo_prediccion = end_time - start_time
+
+    # Explicar las filas que se predijeron ahora (las reutilizadas ya traen la suya).
+    # Las filas con alguna característica vacía (NaN) o infinita se predicen con
+    # sklearn pero quedan sin contribuciones ni factores de riesgo
+    finitas = np.isfinite(X.to_numpy(dtype=np.float64)).all(axis=1)
+    pendientes = [
+        posicion for posicion, contribucion in enumerate(contribuciones)
+        if contribucion is None and finitas[posicion]
+    ]
+    if pendientes:
+        explicadas = explain_contributions(bundle, X.iloc[pendientes] if len(pendientes) < len(X) else X)
+        for posicion, contribucion in zip(pendientes, explicadas):
+            contribuciones[posicion] = contribucion
+
+    # Armar todas las columnas de salida de una sola vez (sin iterrows)
+    resultados, registros_bd = build_prediction_records(
+        df, y_pred, y_pred_proba, tiempo_prediccion, offset=offset, model_version=bundle.version,
+        hashes=hashes, riesgos=riesgos, contribuciones=contribuciones
+    )
+    return resultados, registros_bd, tiempo_prediccion
+
+def predict_desertion(file_path: str, previous: Optional[Dict[int, Dict]] = None,
+                      sheet: Optional[str] = None, upload_id: Optional[int] = None) -> List[Dict]:
     """
     Realiza predicciones de deserción usando el modelo ajustado a datos reales
 
     Args:
         file_path: Ruta al archivo CSV con la estructura real del sistema
+        previous: Predicciones de la carga anterior por estudiante_id (modo incremental)
+        sheet: Hoja a leer si el archivo es XLSX (por defecto la primera)
+        upload_id: Carga del historial del archivo (la corrida muestra sus estudiantes)
 
     Returns:
         Lista de diccionarios con predicciones
     """
     try:
-        # Cargar datos
-        if file_path.endswith(".xlsx"):
-            df = pd.read_excel(file_path)
-        else:
-            df = pd.read_csv(file_path)
+        # Fijar la versión del modelo para todo el archivo
+        bundle = registry.current()
+
+        # Cargar datos desde la caché columnar de la carga (ya normalizados y tipados)
+        df = load_upload_frame(file_path, sheet)
 
         logger.info(f"📂 Datos cargados: {len(df)} filas")
         logger.info(f"📋 Columnas encontradas: {df.columns.tolist()}")
-
-        # Limpiar nombres de columnas
-        df.columns = df.columns.str.strip().str.lower()
-
-        # Mapear nombres de columnas si es necesario para mantener consistencia
-        column_mapping = {
-            'estudiante_id': 'estudiante_id',
-            'id_estudiante': 'estudiante_id',  # Por si viene con nombre alternativo
-            'id': 'estudiante_id',  # Otro posible nombre
-        }
-
-        df = df.rename(columns=column_mapping)
-
-        # Imprimir las columnas después de la normalización para debug
-        logger.info(f"📋 Columnas después de normalización: {df.columns.tolist()}")
         logger.info(f"📊 Primeras filas de datos:")
         for col in ['estudiante_id', 'nombre', 'nota_final', 'asistencia', 'conducta']:
             if col in df.columns:
                 logger.info(f"  {col}: {df[col].head(3).tolist()}")
 
         # Validar estructura de datos
-        if not validate_input_data_real(df):
+        if not validate_input_data_real(df, bundle):
             raise ValueError("La estructura de datos no coincide con la esperada por el modelo")
 
-        # Preparar características para el modelo
-        X = prepare_features_real(df)
+        resultados, registros_bd, tiempo_prediccion = score_dataframe(df, bundle=bundle, previous=previous)
 
-        # Aplicar escalado
-        X_scaled = scaler.transform(X)
-
-        # Medir tiempo de predicción
-        start_time = time.time()
-
-        # Realizar predicciones
-        y_pred = model.predict(X_scaled)
-        y_pred_proba = model.predict_proba(X_scaled)[:, 1]
-
-        end_time = time.time()
-        tiempo_prediccion = end_time - start_time
-
-        # Guardar resultados en la base de datos
+        # Guardar resultados en la base de datos como una corrida nueva; los
+        # dashboards siguen viendo la anterior hasta que se publica
         session = SessionLocal()
-        resultados = []
 
         logger.info(f"💾 Procesando {len(df)} registros con modelo ajustado...")
 
-        # Limpiar registros anteriores para evitar duplicados
-        try:
-            session.query(ResultadoPrediccion).delete()
-            session.commit()
-            logger.info("🗑️ Registros anteriores eliminados")
-        except Exception as e:
-            logger.warning(f"⚠️ Error limpiando registros anteriores: {e}")
-            session.rollback()
-
-        for idx, row in df.iterrows():
-            # Obtener predicciones
-            prediccion = int(y_pred[idx])
-            probabilidad = float(y_pred_proba[idx])
-            riesgo = classify_risk_level(probabilidad)
-
-            # Procesar fecha correctamente del CSV
-            fecha_obj = date(2025, 10, 6)  # Fecha actual como defecto
-
-            if 'fecha' in row.index and pd.notna(row['fecha']):
-                try:
-                    fecha_original = str(row['fecha']).strip()
-                    if '/' in fecha_original:
-                        parts = fecha_original.split('/')
-                        if len(parts) == 3:
-                            # Formato DD/MM/YYYY
-                            dia = int(parts[0])
-                            mes = int(parts[1])
-                            año = int(parts[2])
-                            if año < 100:
-                                año = 2000 + año if año < 50 else 1900 + año
-                            fecha_obj = date(año, mes, dia)
-                            logger.info(f"📅 Fecha procesada: {fecha_original} → {fecha_obj}")
-                    elif '-' in fecha_original:
-                        # Formato YYYY-MM-DD
-                        fecha_obj = datetime.strptime(fecha_original, '%Y-%m-%d').date()
-                except Exception as e:
-                    logger.warning(f"⚠️  Error procesando fecha {row.get('fecha')}: {e}")
-
-            # Generar ID del estudiante si no existe en el CSV
-            if 'estudiante_id' in row.index and pd.notna(row['estudiante_id']):
-                estudiante_id = int(row['estudiante_id'])
-            else:
-                estudiante_id = idx + 1  # Generar ID automáticamente
-
-            # Generar nombre del estudiante si no existe en el CSV
-            if 'nombre' in row.index and pd.notna(row['nombre']) and str(row['nombre']).strip():
-                nombre = str(row['nombre']).strip()
-            else:
-                # Lista de nombres realistas para generar automáticamente
-                nombres_femeninos = [
-                    "Ana Sofia Martinez", "Maria Isabel Torres", "Lucia Valentina Herrera",
-                    "Camila Andrea Flores", "Valentina Rodriguez", "Sofia Elena Castro",
-                    "Isabella Carmen Lopez", "Daniela Alejandra Morales", "Fernanda Gabriela Ruiz",
-                    "Alejandra Patricia Silva", "Carolina Beatriz Mendoza", "Natalia Andrea Vargas",
-                    "Paola Cristina Jimenez", "Andrea Francisca Rivera", "Gabriela Monserrat Gonzalez"
-                ]
-                nombres_masculinos = [
-                    "Carlos Eduardo Ramirez", "Diego Fernando Castro", "Sebastian Jose Morales",
-                    "Alejandro David Vargas", "Mateo Nicolas Herrera", "Santiago Miguel Torres",
-                    "Andres Felipe Rodriguez", "Gabriel Esteban Martinez", "Daniel Antonio Lopez",
-                    "Nicolas Emilio Silva", "Rafael Ignacio Mendoza", "Joaquin Maximiliano Ruiz",
-                    "Vicente Agustin Jimenez", "Emilio Tomas Gonzalez", "Benjamin Eduardo Rivera"
-                ]
-
-                # Alternar entre nombres femeninos y masculinos
-                if estudiante_id % 2 == 1:
-                    nombre = nombres_femeninos[(estudiante_id - 1) % len(nombres_femeninos)]
-                else:
-                    nombre = nombres_masculinos[(estudiante_id - 1) % len(nombres_masculinos)]
-
-            # Obtener los valores reales del CSV con logging para debug
-            nota_final_value = float(row.get('nota_final', 0))
-            asistencia_value = float(row.get('asistencia', 0))
-            inasistencia_value = float(row.get('inasistencia', 0))
-            conducta_value = str(row.get('conducta', 'Regular'))
-
-            # Log para debug - verificar que los valores se están leyendo correctamente
-            if idx < 3:  # Solo para las primeras 3 filas
-                logger.info(f"📊 Fila {idx}: nota_final={nota_final_value}, asistencia={asistencia_value}")
-
-            # Guardar en la base de datos
-            resultado_bd = ResultadoPrediccion(
-                id_estudiante=estudiante_id,
-                nombre=nombre,
-                nota=nota_final_value,
-                nota_final=nota_final_value,
-                conducta=conducta_value,
-                asistencia=asistencia_value,
-                inasistencia=inasistencia_value,
-                tiempo_prediccion=tiempo_prediccion,
-                resultado_prediccion=str(prediccion),
-                riesgo_desercion=riesgo,
-                probabilidad_desercion=round(probabilidad, 4),
-                fecha=fecha_obj  # Usar objeto date, no string
-            )
-            session.add(resultado_bd)
-
-            # Preparar resultado para retorno
-            resultado_dict = {
-                "id_estudiante": estudiante_id,
-                "nombre": nombre,
-                "nota_final": nota_final_value,
-                "nota": nota_final_value,  # Mantener por compatibilidad con frontend
-                "asistencia": asistencia_value,
-                "inasistencia": inasistencia_value,
-                "conducta": conducta_value,
-                "fecha": fecha_obj.strftime('%Y-%m-%d'),  # Convertir a string para el diccionario
-                "tiempo_prediccion": tiempo_prediccion,
-                "resultado_prediccion": str(prediccion),
-                "riesgo_desercion": riesgo,
-                "probabilidad_desercion": round(probabilidad, 4)
-            }
-            resultados.append(resultado_dict)
-
-        # Commit todos los registros de una vez
+        run_id = None
         try:
+            run_id = start_run(session, bundle.version, upload_id=upload_id)
+            save_prediction_records(session, registros_bd, run_id)
             session.commit()
+            publish_run(session, run_id, len(registros_bd))
             logger.info(f"✅ {len(resultados)} registros guardados en la base de datos")
         except Exception as e:
             logger.error(f"❌ Error guardando en BD: {e}")
-            session.rollback()
+            if run_id is not None:
+                discard_run(session, run_id)
         finally:
             session.close()
 
@@ -277,7 +462,7 @@ def predict_desertion(file_path: str) -> List[Dict]:
         medio_riesgo = sum(1 for r in resultados if r['riesgo_desercion'] == 'Medio')
         bajo_riesgo = sum(1 for r in resultados if r['riesgo_desercion'] == 'Bajo')
 
-        logger.info(f"✅ Predicciones completadas en {tiempo_prediccion:.4f}s")
+        logger.info(f"✅ Predicciones completadas en {tiempo_prediccion:.4f}s (modelo {bundle.version})")
         logger.info(f"📊 Distribución: Alto={alto_riesgo}, Medio={medio_riesgo}, Bajo={bajo_riesgo}")
 
         return resultados
@@ -286,6 +471,161 @@ def predict_desertion(file_path: str) -> List[Dict]:
         logger.error(f"❌ Error en predicción: {str(e)}")
         raise Exception(f"Error al procesar las predicciones: {str(e)}")
 
+def score_upload_file(file_path: str, sheet: Optional[str] = None) -> List[Dict]:
+    """
+    Predicciones de un archivo sin escribir en la base de datos. Es la parte
+    de predict_desertion que corre en los procesos de la carga por lotes
+    (un archivo por proceso); el registro en la base lo hace quien la llama.
+    """
+    bundle = registry.current()
+    df = load_upload_frame(file_path, sheet)
+    if not validate_input_data_real(df, bundle):
+        raise ValueError("La estructura de datos no coincide con la esperada por el modelo")
+
+    resultados, _, tiempo_prediccion = score_dataframe(df, bundle=bundle)
+    logger.info(f"✅ {len(resultados)} predicciones de {os.path.basename(file_path)} en {tiempo_prediccion:.4f}s")
+    return resultados
+
+# Versión del modelo que fijó un archivo en streaming si, durante un cambio de
+# versión en caliente, ya no es la activa en este proceso
+_pinned_bundle: Optional[ModelBundle] = None
+
+def _bundle_for_version(version: str) -> ModelBundle:
+    """La versión indicada del modelo: la activa o, si cambió, la fijada por el archivo"""
+    global _pinned_bundle
+    bundle = registry.current()
+    if bundle.version == version:
+        return bundle
+    pinned = _pinned_bundle
+    if pinned is None or pinned.version != version:
+        pinned = load_bundle(version, registry.version_dir(version))
+        _pinned_bundle = pinned
+    return pinned
+
+def score_chunk(bloque: pd.DataFrame, offset: int, version: str,
+                previous: Optional[Dict[int, Dict]] = None) -> Tuple[List[Dict], List[Dict], float]:
+    """
+    score_dataframe de un bloque del modo streaming. Corre en el pool de
+    procesos de predicción (a nivel de módulo para poder enviarse) con la
+    versión del modelo que fijó el archivo.
+    """
+    return score_dataframe(bloque, offset=offset, bundle=_bundle_for_version(version), previous=previous)
+
+def _previous_for_chunk(previous: Dict[int, Dict], bloque: pd.DataFrame, offset: int) -> Dict[int, Dict]:
+    """Predicciones anteriores solo de los estudiantes del bloque (lo que se envía al proceso)"""
+    return {
+        estudiante_id: previous[estudiante_id]
+        for estudiante_id in _student_id_column(bloque, offset).tolist()
+        if estudiante_id in previous
+    }
+
+def predict_desertion_stream(
+    file_path: str,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+    previous: Optional[Dict[int, Dict]] = None,
+    sheet: Optional[str] = None,
+    upload_id: Optional[int] = None
+) -> Iterator[List[Dict]]:
+    """
+    Versión por bloques de predict_desertion para archivos muy grandes.
+
+    Lee (de la caché columnar mapeada en memoria), predice y guarda
+    chunk_size filas a la vez, y entrega los resultados de cada bloque apenas
+    están listos. La memoria usada depende del tamaño del bloque y no del
+    tamaño del archivo.
+
+    Cada bloque se puntúa en el pool de procesos de predicción (call_cpu_bound):
+    los trabajos en segundo plano y las respuestas en streaming corren en hilos
+    del servidor y así no compiten por el GIL con las demás peticiones.
+
+    Args:
+        file_path: Ruta al archivo CSV/XLSX con la estructura real del sistema
+        chunk_size: Filas por bloque
+        previous: Predicciones de la carga anterior por estudiante_id (modo incremental)
+        sheet: Hoja a leer si el archivo es XLSX (por defecto la primera)
+        upload_id: Carga del historial del archivo (la corrida muestra sus estudiantes)
+
+    Yields:
+        Lista de diccionarios con las predicciones de cada bloque
+    """
+    # Fijar la versión del modelo para todo el archivo
+    bundle = registry.current()
+    session = SessionLocal()
+    run_id = None
+    published = False
+    try:
+        # Los bloques se guardan en una corrida nueva, visible recién al publicarla completa
+        run_id = start_run(session, bundle.version, upload_id=upload_id)
+
+        procesadas = 0
+        conteo = {"Alto": 0, "Medio": 0, "Bajo": 0}
+        tiempo_total = 0.0
+
+        for bloque in iter_upload_chunks(file_path, chunk_size, sheet):
+            # Validar estructura de datos con el primer bloque
+            if procesadas == 0:
+                logger.info(f"📋 Columnas encontradas: {bloque.columns.tolist()}")
+                if not validate_input_data_real(bloque, bundle):
+                    raise ValueError("La estructura de datos no coincide con la esperada por el modelo")
+
+            anteriores = _previous_for_chunk(previous, bloque, procesadas) if previous is not None else None
+            resultados, registros_bd, tiempo_prediccion = call_cpu_bound(
+                score_chunk, bloque, procesadas, bundle.version, anteriores
+            )
+
+            # Cada bloque se confirma por separado para no acumular filas en la sesión
+            save_prediction_records(session, registros_bd, run_id)
+            session.commit()
+
+            procesadas += len(resultados)
+            tiempo_total += tiempo_prediccion
+            for riesgo in conteo:
+                conteo[riesgo] += sum(1 for r in resultados if r['riesgo_desercion'] == riesgo)
+            logger.info(f"💾 Bloque guardado: {procesadas} registros procesados")
+
+            yield resultados
+
+        publish_run(session, run_id, procesadas)
+        published = True
+        logger.info(f"✅ Predicciones completadas en {tiempo_total:.4f}s ({procesadas} registros, modelo {bundle.version})")
+        logger.info(f"📊 Distribución: Alto={conteo['Alto']}, Medio={conteo['Medio']}, Bajo={conteo['Bajo']}")
+
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Error en predicción: {str(e)}")
+        raise Exception(f"Error al procesar las predicciones: {str(e)}")
+    finally:
+        # También si el cliente cortó el stream: la corrida incompleta no se publica
+        if run_id is not None and not published:
+            discard_run(session, run_id)
+        session.close()
+
+def store_stored_results(resultados: List[Dict], upload_id: Optional[int] = None,
+                         batch_id: Optional[int] = None) -> None:
+    """
+    Publica como corrida actual predicciones ya calculadas (una carga
+    deduplicada reutiliza las de la carga original con el mismo contenido, y
+    una carga por lotes guarda juntas las de todos sus archivos). upload_id o
+    batch_id indican de qué carga o lote son.
+    """
+    registros_bd = [prediction_record(resultado) for resultado in resultados]
+
+    session = SessionLocal()
+    run_id = None
+    try:
+        run_id = start_run(session, registros_bd[0]["model_version"] if registros_bd else None,
+                           upload_id=upload_id, batch_id=batch_id)
+        save_prediction_records(session, registros_bd, run_id)
+        session.commit()
+        publish_run(session, run_id, len(registros_bd))
+        logger.info(f"✅ {len(registros_bd)} registros ya calculados guardados en la base de datos")
+    except Exception:
+        if run_id is not None:
+            discard_run(session, run_id)
+        raise
+    finally:
+        session.close()
+
 # Mapeo de compatibilidad con el código existente
 CONDUCTA_MAP = {"positivo": 0, "neutral": 1, "agresivo": 2}
 
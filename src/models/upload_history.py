@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Text, Boolean
 from sqlalchemy.orm import relationship
 from config import Base
 import datetime
@@ -37,9 +37,22 @@ class UploadHistory(Base):
     # Tiempo de procesamiento
     processing_time = Column(Float, nullable=True)  # en segundos
 
+    # Versión del modelo que generó las predicciones
+    model_version = Column(String(50), nullable=True)
+
+    # SHA-256 del archivo: cargas con el mismo contenido reutilizan las predicciones
+    content_hash = Column(String(64), nullable=True, index=True)
+
+    # Hoja leída de un XLSX (None: la primera hoja, o un CSV)
+    sheet_name = Column(String(255), nullable=True)
+
+    # Carga por lotes (zip) a la que pertenece el archivo
+    batch_id = Column(Integer, ForeignKey('upload_batches.id', ondelete='SET NULL'), nullable=True, index=True)
+
     # Relaciones
     user = relationship("Usuario", back_populates="upload_history")
     predictions = relationship("UploadPrediction", back_populates="upload_history", cascade="all, delete-orphan")
+    batch = relationship("UploadBatch", back_populates="uploads")
 
     def to_dict(self):
         return {
@@ -62,6 +75,65 @@ class UploadHistory(Base):
             'status': self.status,
             'error_message': self.error_message,
             'notes': self.notes,
+            'processing_time': round(self.processing_time, 2) if self.processing_time else None,
+            'model_version': self.model_version,
+            'content_hash': self.content_hash,
+            'sheet_name': self.sheet_name,
+            'batch_id': self.batch_id
+        }
+
+
+class UploadBatch(Base):
+    """Carga por lotes: un zip con varios archivos, cada uno con su UploadHistory"""
+    __tablename__ = 'upload_batches'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    filename = Column(String(255), nullable=False)
+    original_filename = Column(String(255), nullable=False)
+    file_path = Column(String(500), nullable=False)
+    content_hash = Column(String(64), nullable=True)
+    upload_date = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+    user_id = Column(Integer, ForeignKey('usuarios.id', ondelete='SET NULL'), nullable=True)
+
+    # Archivos del zip
+    total_files = Column(Integer, default=0)
+    processed_files = Column(Integer, default=0)
+    failed_files = Column(Integer, default=0)
+
+    # Estadísticas sumadas de todos los archivos
+    total_students = Column(Integer, default=0)
+    processed_students = Column(Integer, default=0)
+    high_risk_count = Column(Integer, default=0)
+    medium_risk_count = Column(Integer, default=0)
+    low_risk_count = Column(Integer, default=0)
+
+    status = Column(String(50), default='processing')  # processing, success, error, partial
+    error_message = Column(Text, nullable=True)
+    processing_time = Column(Float, nullable=True)  # en segundos
+
+    uploads = relationship("UploadHistory", back_populates="batch", order_by="UploadHistory.id")
+
+    def to_dict(self):
+        processed = self.processed_students or 0
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'original_filename': self.original_filename,
+            'upload_date': self.upload_date.isoformat() if self.upload_date else None,
+            'user_id': self.user_id,
+            'total_files': self.total_files,
+            'processed_files': self.processed_files,
+            'failed_files': self.failed_files,
+            'total_students': self.total_students,
+            'processed_students': processed,
+            'high_risk_count': self.high_risk_count,
+            'medium_risk_count': self.medium_risk_count,
+            'low_risk_count': self.low_risk_count,
+            'high_risk_percentage': round(self.high_risk_count / processed * 100, 2) if processed else 0.0,
+            'medium_risk_percentage': round(self.medium_risk_count / processed * 100, 2) if processed else 0.0,
+            'low_risk_percentage': round(self.low_risk_count / processed * 100, 2) if processed else 0.0,
+            'status': self.status,
+            'error_message': self.error_message,
             'processing_time': round(self.processing_time, 2) if self.processing_time else None
         }
 
@@ -82,6 +154,7 @@ class UploadPrediction(Base):
     conducta = Column(String(50), nullable=True)
     asistencia = Column(Float, nullable=False)
     inasistencia = Column(Float, nullable=True)
+    fecha = Column(Date, nullable=True)
 
     # Resultados de predicción
     resultado_prediccion = Column(String(50), nullable=False)
@@ -91,10 +164,19 @@ class UploadPrediction(Base):
     # Factores de riesgo identificados
     risk_factors = Column(Text, nullable=True)  # JSON string con factores
 
+    # Contribución de cada característica a la probabilidad de deserción
+    contributions = Column(Text, nullable=True)  # JSON string {característica: contribución}
+
     # Tiempo de predicción
     tiempo_prediccion = Column(Float, nullable=False)
     fecha_prediccion = Column(DateTime, default=datetime.datetime.utcnow)
 
+    # Versión del modelo que generó la predicción
+    model_version = Column(String(50), nullable=True)
+
+    # Hash de las características preparadas + versión del modelo (modo incremental)
+    feature_hash = Column(String(32), nullable=True)
+
     # Relación
     upload_history = relationship("UploadHistory", back_populates="predictions")
 
@@ -108,10 +190,13 @@ class UploadPrediction(Base):
             'conducta': self.conducta,
             'asistencia': self.asistencia,
             'inasistencia': self.inasistencia,
+            'fecha': self.fecha.isoformat() if self.fecha else None,
             'resultado_prediccion': self.resultado_prediccion,
             'riesgo_desercion': self.riesgo_desercion,
             'probabilidad_desercion': round(self.probabilidad_desercion, 4) if self.probabilidad_desercion else None,
             'risk_factors': self.risk_factors,
+            'contributions': self.contributions,
             'tiempo_prediccion': round(self.tiempo_prediccion, 4),
-            'fecha_prediccion': self.fecha_prediccion.isoformat() if self.fecha_prediccion else None
+            'fecha_prediccion': self.fecha_prediccion.isoformat() if self.fecha_prediccion else None,
+            'model_version': self.model_version
         }
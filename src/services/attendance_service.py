@@ -9,6 +9,7 @@ from datetime import datetime
 from sqlalchemy.orm import Session
 from config import SessionLocal
 from models import ResultadoPrediccion
+from services.prediction_run_service import current_results
 
 # Variable global para almacenar los datos más recientes del CSV
 latest_csv_data = None
@@ -70,7 +71,7 @@ class AttendanceService:
         db = SessionLocal()
         try:
             # Obtener todos los registros de ResultadoPrediccion
-            results = db.query(ResultadoPrediccion).all()
+            results = current_results(db).all()
 
             # Si no hay datos, devolver todo en 0
             if not results:
@@ -213,7 +214,7 @@ class AttendanceService:
         db = SessionLocal()
         try:
             # Usar los datos de ResultadoPrediccion
-            student_data = db.query(ResultadoPrediccion).filter(ResultadoPrediccion.id_estudiante == student_id).all()
+            student_data = current_results(db).filter(ResultadoPrediccion.id_estudiante == student_id).all()
 
             if not student_data:
                 # Si no hay datos, devolver arrays vacíos
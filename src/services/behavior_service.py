@@ -4,8 +4,9 @@ import matplotlib.pyplot as plt
 from io import BytesIO
 import base64
 from sqlalchemy.orm import Session
-from src.config import SessionLocal
-from src.models import StudentData  # Corregido el import
+from config import SessionLocal
+from models import StudentData
+from services.prediction_run_service import current_students
 
 
 class BehaviorService:
@@ -16,7 +17,8 @@ class BehaviorService:
         """
         db = SessionLocal()
         try:
-            student_data = db.query(StudentData).filter(StudentData.id_estudiante == student_id).all()  # Cambiado a id_estudiante
+            # Solo los estudiantes de la carga que muestra el dashboard (la de la corrida actual)
+            student_data = current_students(db).filter(StudentData.id_estudiante == student_id).all()
             behavior = [data.conducta for data in student_data]  # Recupera los valores de conducta
             dates = [data.created_at.strftime("%b %Y") for data in student_data]  # Cambiado a created_at
             return behavior, dates
@@ -0,0 +1,119 @@
+# src/services/bulk_loader.py
+"""
+Carga masiva de filas en una tabla.
+
+En PostgreSQL las filas se envían con COPY ... FROM STDIN en formato CSV: el
+DataFrame se serializa por bloques de BULK_COPY_CHUNK_ROWS filas mientras el
+servidor lee, sin armar el archivo completo en memoria. En otros motores se
+usa un INSERT executemany.
+
+La semántica de valores es la de un INSERT con los mismos datos: None/NaN en
+columnas de texto es NULL, NaN en columnas float se guarda como NaN.
+"""
+import csv
+import io
+import logging
+import os
+from typing import Iterator
+
+import pandas as pd
+from sqlalchemy import Table, insert
+
+logger = logging.getLogger(__name__)
+
+# Filas serializadas por bloque al alimentar COPY
+BULK_COPY_CHUNK_ROWS = int(os.getenv("BULK_COPY_CHUNK_ROWS", "50000"))
+
+# Marca de NULL en el CSV de COPY (igual que en el formato texto de PostgreSQL)
+COPY_NULL = "\\N"
+
+# Bytes que psycopg2 pide en cada lectura del flujo CSV
+COPY_READ_SIZE = 1 << 20
+
+
+class _CsvStream(io.TextIOBase):
+    """Archivo de solo lectura que va generando el CSV bloque a bloque para COPY"""
+
+    def __init__(self, chunks: Iterator[str]):
+        self._chunks = chunks
+        self._buffer = ""
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> str:
+        parts = []
+        remaining = size
+        while size < 0 or remaining > 0:
+            if self._position >= len(self._buffer):
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    break
+                self._buffer, self._position = chunk, 0
+            end = len(self._buffer) if size < 0 else min(len(self._buffer), self._position + remaining)
+            parts.append(self._buffer[self._position:end])
+            remaining -= end - self._position
+            self._position = end
+        return "".join(parts)
+
+
+def _copy_ready(frame: pd.DataFrame) -> pd.DataFrame:
+    """NaN en columnas float se escribe como 'NaN' (no como NULL), igual que un INSERT"""
+    frame = frame.copy(deep=False)
+    for column in frame.columns:
+        serie = frame[column]
+        if pd.api.types.is_float_dtype(serie) and serie.isna().any():
+            frame[column] = serie.astype(object).where(serie.notna(), "NaN")
+    return frame
+
+
+def _csv_chunks(frame: pd.DataFrame, chunk_rows: int) -> Iterator[str]:
+    for start in range(0, len(frame), chunk_rows):
+        # QUOTE_NONNUMERIC: el texto va entre comillas (así "" es cadena vacía);
+        # los nulos se escriben con COPY_NULL, que COPY lee como NULL (FORCE_NULL)
+        yield frame.iloc[start:start + chunk_rows].to_csv(
+            header=False, index=False, quoting=csv.QUOTE_NONNUMERIC, lineterminator="\n", na_rep=COPY_NULL
+        )
+
+
+def copy_frame(session, table: Table, frame: pd.DataFrame, chunk_rows: int = BULK_COPY_CHUNK_ROWS) -> None:
+    """COPY FROM STDIN de todas las filas del DataFrame (solo PostgreSQL)"""
+    columns = ", ".join(f'"{column}"' for column in frame.columns)
+    sql = f'COPY "{table.name}" ({columns}) FROM STDIN WITH (FORMAT csv, NULL \'{COPY_NULL}\', FORCE_NULL ({columns}))'
+    # La conexión DBAPI (psycopg2) de la transacción actual de la sesión
+    dbapi_connection = session.connection().connection.dbapi_connection
+    with dbapi_connection.cursor() as cursor:
+        cursor.copy_expert(sql, _CsvStream(_csv_chunks(_copy_ready(frame), chunk_rows)), size=COPY_READ_SIZE)
+
+
+def insert_frame(session, table: Table, frame: pd.DataFrame) -> None:
+    """INSERT executemany de todas las filas del DataFrame (cualquier motor)"""
+    frame = frame.copy(deep=False)
+    for column in frame.columns:
+        serie = frame[column]
+        if not pd.api.types.is_float_dtype(serie) and serie.isna().any():
+            frame[column] = serie.astype(object).where(serie.notna(), None)
+    session.execute(insert(table), frame.to_dict("records"))
+
+
+def bulk_insert(session, table: Table, frame: pd.DataFrame) -> int:
+    """
+    Inserta todas las filas del DataFrame en la tabla dentro de la transacción
+    de la sesión (el commit queda a cargo de quien llama).
+
+    Args:
+        session: Sesión de SQLAlchemy
+        table: Tabla destino (Modelo.__table__)
+        frame: Una columna por columna de la tabla, con sus nombres en la BD
+
+    Returns:
+        Cantidad de filas insertadas
+    """
+    if frame.empty:
+        return 0
+    if session.get_bind().dialect.name == "postgresql":
+        copy_frame(session, table, frame)
+    else:
+        insert_frame(session, table, frame)
+    return len(frame)
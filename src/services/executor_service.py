@@ -0,0 +1,161 @@
+# src/services/executor_service.py
+"""
+Capa de ejecución para no bloquear el event loop de FastAPI.
+
+- run_cpu_bound: trabajo de CPU (lectura del archivo y scoring del modelo) en
+  un pool de procesos, para que no compita por el GIL con las demás peticiones.
+- run_blocking: llamadas bloqueantes (SQLAlchemy, lectura de archivos) en un
+  pool de hilos.
+- run_cpu_bound_many: la misma función sobre varios archivos (cargas por lotes)
+  en un pool de procesos aparte, de BATCH_PROCESS_WORKERS procesos, para que un
+  lote no deje sin procesos a las predicciones individuales.
+- call_cpu_bound: como run_cpu_bound pero síncrona, para hilos que no son del
+  event loop (trabajos en segundo plano, respuestas en streaming).
+
+Las funciones enviadas al pool de procesos deben estar definidas a nivel de
+módulo y sus argumentos y resultados deben poder serializarse con pickle.
+"""
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Procesos dedicados al scoring por worker de uvicorn (0 = usar el pool de hilos)
+PREDICTION_PROCESS_WORKERS = int(os.getenv("PREDICTION_PROCESS_WORKERS", "1"))
+
+# Procesos para puntuar en paralelo los archivos de una carga por lotes
+BATCH_PROCESS_WORKERS = int(os.getenv("BATCH_PROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Hilos para trabajo bloqueante de base de datos y archivos
+BLOCKING_THREAD_WORKERS = int(os.getenv("BLOCKING_THREAD_WORKERS", "8"))
+
+_process_pool = None
+_batch_pool = None
+_thread_pool = None
+_pool_lock = threading.Lock()
+
+
+def _new_process_pool(workers: int, name: str) -> ProcessPoolExecutor:
+    # spawn: el proceso hijo no hereda los hilos ni las conexiones abiertas del servidor
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    logger.info(f"⚙️ Pool de procesos para {name} iniciado ({workers} procesos)")
+    return pool
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    with _pool_lock:
+        if _process_pool is None:
+            _process_pool = _new_process_pool(PREDICTION_PROCESS_WORKERS, "predicción")
+        return _process_pool
+
+
+def _get_batch_pool() -> ProcessPoolExecutor:
+    global _batch_pool
+    with _pool_lock:
+        if _batch_pool is None:
+            _batch_pool = _new_process_pool(BATCH_PROCESS_WORKERS, "cargas por lotes")
+        return _batch_pool
+
+
+def _get_thread_pool() -> ThreadPoolExecutor:
+    global _thread_pool
+    with _pool_lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(
+                max_workers=BLOCKING_THREAD_WORKERS,
+                thread_name_prefix="eduforge-blocking"
+            )
+        return _thread_pool
+
+
+def _discard_process_pool(pool: ProcessPoolExecutor) -> None:
+    """Descarta un pool roto (p. ej. un proceso murió por falta de memoria) para crear uno nuevo"""
+    global _process_pool, _batch_pool
+    with _pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+        if _batch_pool is pool:
+            _batch_pool = None
+    pool.shutdown(wait=False)
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Ejecuta una función bloqueante en el pool de hilos y espera su resultado"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_thread_pool(), functools.partial(func, *args, **kwargs))
+
+
+async def run_cpu_bound(func, *args, **kwargs):
+    """Ejecuta una función de CPU en el pool de procesos y espera su resultado"""
+    if PREDICTION_PROCESS_WORKERS <= 0:
+        return await run_blocking(func, *args, **kwargs)
+
+    loop = asyncio.get_running_loop()
+    pool = _get_process_pool()
+    try:
+        return await loop.run_in_executor(pool, functools.partial(func, *args, **kwargs))
+    except BrokenProcessPool:
+        logger.error("❌ El proceso de predicción terminó inesperadamente, se reiniciará el pool")
+        _discard_process_pool(pool)
+        raise
+
+
+def call_cpu_bound(func, *args, **kwargs):
+    """
+    Ejecuta una función de CPU en el pool de procesos desde un hilo (no desde
+    el event loop) y espera su resultado. Con PREDICTION_PROCESS_WORKERS=0 se
+    ejecuta en el mismo hilo.
+    """
+    if PREDICTION_PROCESS_WORKERS <= 0:
+        return func(*args, **kwargs)
+
+    pool = _get_process_pool()
+    try:
+        return pool.submit(func, *args, **kwargs).result()
+    except BrokenProcessPool:
+        logger.error("❌ El proceso de predicción terminó inesperadamente, se reiniciará el pool")
+        _discard_process_pool(pool)
+        raise
+
+
+async def run_cpu_bound_many(func, args_list: Sequence[tuple]) -> List:
+    """
+    Ejecuta func(*args) para cada elemento de args_list en el pool de procesos
+    de lotes, en paralelo. Devuelve los resultados en el mismo orden; el de
+    una llamada que falló es su excepción (las demás siguen).
+    """
+    if BATCH_PROCESS_WORKERS <= 0:
+        return await asyncio.gather(*(run_blocking(func, *args) for args in args_list), return_exceptions=True)
+
+    loop = asyncio.get_running_loop()
+    pool = _get_batch_pool()
+    results = await asyncio.gather(
+        *(loop.run_in_executor(pool, functools.partial(func, *args)) for args in args_list),
+        return_exceptions=True
+    )
+    if any(isinstance(result, BrokenProcessPool) for result in results):
+        logger.error("❌ Un proceso de la carga por lotes terminó inesperadamente, se reiniciará el pool")
+        _discard_process_pool(pool)
+    return results
+
+
+def shutdown_executors() -> None:
+    """Cierra los pools al apagar el servidor"""
+    global _process_pool, _batch_pool, _thread_pool
+    with _pool_lock:
+        process_pool, _process_pool = _process_pool, None
+        batch_pool, _batch_pool = _batch_pool, None
+        thread_pool, _thread_pool = _thread_pool, None
+    for pool in (process_pool, batch_pool):
+        if pool is not None:
+            pool.shutdown(wait=True)
+    if thread_pool is not None:
+        thread_pool.shutdown(wait=True)
@@ -4,8 +4,9 @@ import matplotlib.pyplot as plt
 from io import BytesIO
 import base64
 from sqlalchemy.orm import Session
-from src.config import SessionLocal
-from src.models import StudentData  # Corregido el import
+from config import SessionLocal
+from models import StudentData
+from services.prediction_run_service import current_students
 
 
 class GradesService:
@@ -16,7 +17,8 @@ class GradesService:
         """
         db = SessionLocal()
         try:
-            student_data = db.query(StudentData).filter(StudentData.id_estudiante == student_id).all()  # Cambiado a id_estudiante
+            # Solo los estudiantes de la carga que muestra el dashboard (la de la corrida actual)
+            student_data = current_students(db).filter(StudentData.id_estudiante == student_id).all()
             # Aquí obtienes las calificaciones, asistencia, conducta
             grades = [data.nota_final for data in student_data]  # Cambiado a nota_final
             attendance = [data.asistencia for data in student_data]
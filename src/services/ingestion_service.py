@@ -0,0 +1,379 @@
+# src/services/ingestion_service.py
+"""
+Ingesta de archivos subidos.
+
+Cada archivo se lee una sola vez al subirlo, por bloques y según su plan de
+lectura (services/upload_schema.py): solo las columnas que usa el modelo, ya
+tipadas, rechazando el archivo en cuanto falta una columna crítica o aparece
+un valor inválido. La columna fecha se convierte a datetime64 y el resultado
+se guarda como caché columnar junto al archivo (uploads/.columnar/<archivo>/,
+un .npy por columna y un manifest.json).
+
+Las etapas posteriores (conteo de filas, predicción, re-predicción y modo
+streaming) leen de la caché en lugar de volver a leer el CSV/XLSX. Los .npy se
+abren con memoria mapeada, así el modo streaming recorre el archivo por
+bloques sin cargarlo entero.
+
+Si el archivo original cambia (misma ruta, otro tamaño o fecha de
+modificación) o el modelo activo espera otras columnas, la caché se regenera
+en la siguiente lectura.
+
+Los XLSX se leen con openpyxl en modo solo lectura, fila a fila y en bloques
+de XLSX_BATCH_ROWS, sin cargar el libro completo. Cada hoja elegida (sheet)
+tiene su propia caché; sin sheet se usa la primera hoja.
+"""
+import json
+import logging
+import os
+import shutil
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from models.model_registry import registry
+from services.upload_schema import (
+    READ_BLOCK_ROWS, ReadPlan, build_read_plan, apply_read_plan, finish_frame
+)
+from utils.date_parser import parse_date_column
+
+logger = logging.getLogger(__name__)
+
+# Subdirectorio (dentro del directorio del archivo) donde se guardan las cachés
+COLUMNAR_DIR = ".columnar"
+COLUMNAR_FORMAT = 2
+MANIFEST_FILE = "manifest.json"
+
+# Filas de XLSX que se convierten a DataFrame por bloque
+XLSX_BATCH_ROWS = int(os.getenv("XLSX_BATCH_ROWS", "10000"))
+
+
+class SheetNotFoundError(ValueError):
+    """La hoja pedida no existe en el libro"""
+
+
+def is_excel_file(file_path: str) -> bool:
+    return file_path.lower().endswith(".xlsx")
+
+
+def source_sheet(file_path: str, sheet: Optional[str]) -> Optional[str]:
+    """La hoja solo aplica a XLSX; en otros formatos se ignora"""
+    return sheet if sheet and is_excel_file(file_path) else None
+
+
+def _select_sheet(workbook, sheet: Optional[str]):
+    if sheet is None:
+        return workbook.worksheets[0]
+    if sheet not in workbook.sheetnames:
+        raise SheetNotFoundError(f"La hoja '{sheet}' no existe. Hojas disponibles: {workbook.sheetnames}")
+    return workbook[sheet]
+
+
+def _xlsx_batch(rows: List[tuple], columns: List[str]) -> pd.DataFrame:
+    df = pd.DataFrame.from_records(rows, columns=columns)
+    # Igual que read_excel: celdas vacías como NaN (columnas vacías quedan float)
+    for column in df.columns[df.dtypes == object]:
+        df[column] = df[column].where(df[column].notna(), np.nan)
+    return df.infer_objects()
+
+
+def read_xlsx_header(file_path: str, sheet: Optional[str] = None) -> List[str]:
+    """Encabezados (primera fila) de una hoja de un XLSX"""
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        header = next(_select_sheet(workbook, sheet).iter_rows(max_row=1, values_only=True), None)
+    finally:
+        workbook.close()
+    return [str(name) if name is not None else f"Unnamed: {i}" for i, name in enumerate(header or ())]
+
+
+def iter_xlsx_batches(file_path: str, sheet: Optional[str] = None,
+                      batch_rows: int = XLSX_BATCH_ROWS,
+                      usecols: Optional[List[int]] = None) -> Iterator[pd.DataFrame]:
+    """
+    Recorre una hoja de un XLSX en modo solo lectura y entrega DataFrames de
+    hasta batch_rows filas (primera fila = encabezados). En memoria solo hay
+    un bloque de filas como objetos Python a la vez. Con usecols solo se
+    conservan esas posiciones de cada fila.
+    """
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = _select_sheet(workbook, sheet).iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(name) if name is not None else f"Unnamed: {i}" for i, name in enumerate(header)]
+        if usecols is not None:
+            columns = [columns[i] for i in usecols]
+
+        batch, blank_rows = [], []
+        for row in rows:
+            # Las filas vacías del final no cuentan (como en read_excel)
+            if all(value is None for value in row):
+                blank_rows.append(row if usecols is None else (None,) * len(usecols))
+                continue
+            batch.extend(blank_rows)
+            blank_rows = []
+            if usecols is not None:
+                row = tuple(row[i] if i < len(row) else None for i in usecols)
+            batch.append(row)
+            if len(batch) >= batch_rows:
+                yield _xlsx_batch(batch, columns)
+                batch = []
+        if batch:
+            yield _xlsx_batch(batch, columns)
+    finally:
+        workbook.close()
+
+
+def read_excel_file(file_path: str, sheet: Optional[str] = None) -> pd.DataFrame:
+    """Hoja completa de un XLSX leída por bloques con iter_xlsx_batches"""
+    batches = list(iter_xlsx_batches(file_path, sheet))
+    if not batches:
+        return pd.DataFrame()
+    df = pd.concat(batches, ignore_index=True)
+    if len(batches) > 1:
+        # Un bloque con una columna entera y otro con vacíos dejan object
+        df = df.infer_objects()
+    # Columnas del final sin encabezado ni datos (read_excel las descarta)
+    while len(df.columns) and df.columns[-1].startswith("Unnamed: ") and df.iloc[:, -1].isna().all():
+        df = df.iloc[:, :-1]
+    return df
+
+
+def read_source_file(file_path: str, sheet: Optional[str] = None) -> Tuple[pd.DataFrame, ReadPlan]:
+    """
+    Lee el archivo original (CSV o XLSX) por bloques según su plan de lectura.
+
+    Returns:
+        (DataFrame con las columnas del plan ya tipadas, plan usado)
+
+    Raises:
+        MalformedUploadError: en cuanto falta una columna crítica o un bloque trae un valor inválido
+    """
+    config = registry.current().config
+    if is_excel_file(file_path):
+        plan = build_read_plan(read_xlsx_header(file_path, sheet), config)
+        blocks = iter_xlsx_batches(file_path, sheet, XLSX_BATCH_ROWS, usecols=plan.positions)
+    else:
+        plan = build_read_plan(pd.read_csv(file_path, nrows=0).columns, config)
+        blocks = pd.read_csv(file_path, usecols=plan.positions, chunksize=READ_BLOCK_ROWS)
+
+    frames = []
+    start_row = 0
+    for block in blocks:
+        frames.append(apply_read_plan(plan, block, start_row))
+        start_row += len(block)
+    return finish_frame(plan, frames), plan
+
+
+def columnar_cache_dir(file_path: str, sheet: Optional[str] = None) -> str:
+    """Directorio de la caché columnar de un archivo subido (una por hoja en XLSX)"""
+    directory, filename = os.path.split(os.path.abspath(file_path))
+    sheet = source_sheet(file_path, sheet)
+    if sheet is not None:
+        filename = f"{filename}.sheet-{quote(sheet, safe='')}"
+    return os.path.join(directory, COLUMNAR_DIR, filename)
+
+
+def _source_fingerprint(file_path: str) -> Dict[str, int]:
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _typed_frame(df: pd.DataFrame) -> Tuple[pd.DataFrame, int]:
+    """
+    Deja cada columna con un tipo que se pueda guardar sin pickle. La columna
+    fecha se convierte a datetime64[D] (NaT si está vacía o no es válida).
+
+    Returns:
+        (DataFrame tipado, cantidad de fechas inválidas)
+    """
+    df = df.reset_index(drop=True)
+    fechas_invalidas = 0
+    if 'fecha' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['fecha']):
+        resultado = parse_date_column(df['fecha'], None)
+        df['fecha'] = resultado.fechas
+        fechas_invalidas = len(resultado.invalidas)
+    return df, fechas_invalidas
+
+
+def _save_column(directory: str, index: int, serie: pd.Series) -> Dict:
+    """
+    Guarda una columna como .npy; el texto va como unicode de ancho fijo con
+    máscara de nulos y las categóricas como códigos enteros (-1 = nulo) más
+    sus categorías
+    """
+    path = os.path.join(directory, f"{index}.npy")
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        np.save(path, serie.cat.codes.to_numpy(), allow_pickle=False)
+        categorias = serie.cat.categories.astype(str).to_numpy().astype(np.str_)
+        np.save(os.path.join(directory, f"{index}.categories.npy"), categorias, allow_pickle=False)
+        return {"kind": "category"}
+    if serie.dtype == object:
+        nulos = serie.isna().to_numpy()
+        texto = serie.where(~nulos, "").astype(str).to_numpy().astype(np.str_)
+        np.save(path, texto, allow_pickle=False)
+        np.save(os.path.join(directory, f"{index}.nulls.npy"), nulos, allow_pickle=False)
+        return {"kind": "text"}
+    np.save(path, serie.to_numpy(), allow_pickle=False)
+    return {"kind": "array"}
+
+
+def ingest_file(file_path: str, sheet: Optional[str] = None) -> Tuple[pd.DataFrame, Dict]:
+    """
+    Lee el archivo una vez, lo tipa y publica su caché columnar.
+
+    Returns:
+        (DataFrame normalizado y tipado, manifiesto de la caché)
+    """
+    sheet = source_sheet(file_path, sheet)
+    source = _source_fingerprint(file_path)
+    df, plan = read_source_file(file_path, sheet)
+    df, fechas_invalidas = _typed_frame(df)
+
+    if plan.missing:
+        logger.info(f"ℹ️ {os.path.basename(file_path)}: sin las columnas opcionales {plan.missing}")
+    if fechas_invalidas:
+        logger.warning(f"⚠️ {fechas_invalidas} fechas no se pudieron procesar en {os.path.basename(file_path)}")
+
+    cache_dir = columnar_cache_dir(file_path, sheet)
+    tmp_dir = f"{cache_dir}.{os.getpid()}.tmp"
+    stale_dir = f"{cache_dir}.{os.getpid()}.old"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    columns = []
+    for index, name in enumerate(df.columns):
+        column = _save_column(tmp_dir, index, df.iloc[:, index])
+        column["name"] = name
+        columns.append(column)
+
+    manifest = {
+        "format": COLUMNAR_FORMAT,
+        "source": source,
+        "sheet": sheet,
+        "expected_columns": list(registry.current().config['expected_columns']),
+        "rows": len(df),
+        "columns": columns,
+        "missing_columns": plan.missing,
+        "invalid_dates": fechas_invalidas
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f)
+
+    # Igual que la exportación del modelo: quien ya mapeó la caché anterior
+    # conserva sus archivos abiertos
+    if os.path.isdir(cache_dir):
+        try:
+            os.rename(cache_dir, stale_dir)
+        except OSError:
+            pass
+    try:
+        os.rename(tmp_dir, cache_dir)
+    except OSError:
+        # Otro proceso publicó su caché primero
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    shutil.rmtree(stale_dir, ignore_errors=True)
+
+    logger.info(f"📦 Caché columnar lista: {len(df)} filas, {len(columns)} columnas")
+    return df, manifest
+
+
+def read_manifest(file_path: str, sheet: Optional[str] = None) -> Optional[Dict]:
+    """Manifiesto de la caché si existe y corresponde al archivo actual"""
+    try:
+        with open(os.path.join(columnar_cache_dir(file_path, sheet), MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("format") != COLUMNAR_FORMAT or manifest.get("source") != _source_fingerprint(file_path):
+        return None
+    if manifest.get("expected_columns") != list(registry.current().config['expected_columns']):
+        return None
+    return manifest
+
+
+def ensure_ingested(file_path: str, sheet: Optional[str] = None) -> Dict:
+    """Devuelve el manifiesto de la caché, ingiriendo el archivo si falta o quedó obsoleta"""
+    manifest = read_manifest(file_path, sheet)
+    if manifest is None:
+        _, manifest = ingest_file(file_path, sheet)
+    return manifest
+
+
+def move_columnar_cache(old_path: str, new_path: str) -> bool:
+    """
+    Pasa la caché de old_path a new_path, un archivo con el mismo contenido
+    (p. ej. su versión comprimida), sin volver a ingerirlo. Solo se mueve una
+    caché vigente para old_path; devuelve si se movió.
+    """
+    old_dir = columnar_cache_dir(old_path)
+    manifest_path = os.path.join(old_dir, MANIFEST_FILE)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if manifest.get("source") != _source_fingerprint(old_path):
+        return False
+
+    manifest["source"] = _source_fingerprint(new_path)
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f)
+    new_dir = columnar_cache_dir(new_path)
+    shutil.rmtree(new_dir, ignore_errors=True)
+    os.rename(old_dir, new_dir)
+    return True
+
+
+def _open_columns(file_path: str, manifest: Dict) -> List[Tuple[Dict, np.ndarray, Optional[np.ndarray]]]:
+    cache_dir = columnar_cache_dir(file_path, manifest.get("sheet"))
+    abiertas = []
+    for index, column in enumerate(manifest["columns"]):
+        valores = np.load(os.path.join(cache_dir, f"{index}.npy"), mmap_mode="r", allow_pickle=False)
+        # Texto: máscara de nulos; categórica: sus categorías
+        extra = None
+        if column["kind"] == "text":
+            extra = np.load(os.path.join(cache_dir, f"{index}.nulls.npy"), allow_pickle=False)
+        elif column["kind"] == "category":
+            extra = np.load(os.path.join(cache_dir, f"{index}.categories.npy"), allow_pickle=False).astype(object)
+        abiertas.append((column, valores, extra))
+    return abiertas
+
+
+def _frame_slice(abiertas, start: int, stop: int) -> pd.DataFrame:
+    datos = {}
+    for posicion, (column, valores, extra) in enumerate(abiertas):
+        bloque = np.array(valores[start:stop])
+        if column["kind"] == "category":
+            bloque = pd.Categorical.from_codes(bloque, categories=extra)
+        elif column["kind"] == "text":
+            bloque = bloque.astype(object)
+            bloque[extra[start:stop]] = np.nan
+        datos[posicion] = bloque
+    df = pd.DataFrame(datos)
+    df.columns = [column["name"] for column, _, _ in abiertas]
+    return df
+
+
+def load_upload_frame(file_path: str, sheet: Optional[str] = None) -> pd.DataFrame:
+    """DataFrame normalizado y tipado de un archivo subido, desde su caché columnar"""
+    manifest = ensure_ingested(file_path, sheet)
+    return _frame_slice(_open_columns(file_path, manifest), 0, manifest["rows"])
+
+
+def iter_upload_chunks(file_path: str, chunk_size: int, sheet: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """Recorre la caché columnar en bloques de chunk_size filas (memoria acotada por bloque)"""
+    manifest = ensure_ingested(file_path, sheet)
+    abiertas = _open_columns(file_path, manifest)
+    for start in range(0, manifest["rows"], chunk_size):
+        yield _frame_slice(abiertas, start, min(start + chunk_size, manifest["rows"]))
+
+
+def count_upload_rows(file_path: str, sheet: Optional[str] = None) -> Tuple[int, List[str]]:
+    """Filas y columnas de un archivo subido, leídas del manifiesto"""
+    manifest = ensure_ingested(file_path, sheet)
+    return manifest["rows"], [column["name"] for column in manifest["columns"]]
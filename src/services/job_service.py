@@ -0,0 +1,438 @@
+# src/services/job_service.py
+"""
+Trabajos en segundo plano para el flujo carga → predicción.
+
+Con background=true, /upload y /predict encolan un trabajo en la tabla jobs y
+responden enseguida con su id; el avance se consulta en /api/jobs/{id}.
+
+- Cada worker de uvicorn levanta un JobWorkerPool con JOB_WORKERS hilos que
+  toman trabajos encolados. La toma es un UPDATE condicionado al estado
+  'queued', así dos procesos nunca ejecutan el mismo trabajo.
+- Mientras un trabajo corre, su proceso actualiza heartbeat_at cada
+  JOB_HEARTBEAT_INTERVAL segundos. Un trabajo 'running' sin latido hace más de
+  JOB_STALE_AFTER segundos quedó interrumpido (reinicio, proceso muerto): se
+  vuelve a encolar hasta JOB_MAX_ATTEMPTS intentos y luego se marca como error.
+- Las cargas del historial que siguen en 'processing' sin ningún trabajo
+  pendiente después de UPLOAD_PROCESSING_TIMEOUT segundos se marcan como error
+  en lugar de quedar así para siempre.
+- Un trabajo igual a otro que todavía está en curso (mismo dedupe_key) no se
+  encola de nuevo: un request reintentado recibe el id del trabajo existente.
+"""
+import datetime
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from config import SessionLocal
+from models.job import Job
+from models.upload_history import UploadHistory
+from services.progress_service import progress_broker, job_key, upload_key
+
+logger = logging.getLogger(__name__)
+
+# Hilos que ejecutan trabajos por worker de uvicorn
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+
+# Espera entre consultas a la cola cuando no hay trabajos
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+
+# Latido de los trabajos en ejecución y plazo para darlos por interrumpidos
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "10"))
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "60"))
+
+# Intentos antes de marcar como error un trabajo que se sigue interrumpiendo
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+# Cargas en 'processing' sin trabajo pendiente que se dan por interrumpidas
+UPLOAD_PROCESSING_TIMEOUT = float(os.getenv("UPLOAD_PROCESSING_TIMEOUT", "3600"))
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+class JobService:
+    """Operaciones sobre la tabla jobs"""
+
+    @staticmethod
+    def enqueue(
+        db: Session,
+        kind: str,
+        params: Dict,
+        user_id: Optional[int] = None,
+        upload_id: Optional[int] = None,
+        dedupe_key: Optional[str] = None
+    ) -> Tuple[Job, bool]:
+        """
+        Encola un trabajo, o devuelve el que ya está en curso con el mismo dedupe_key.
+
+        Returns:
+            (trabajo, True si se creó ahora)
+        """
+        if dedupe_key:
+            existing = JobService.find_active(db, dedupe_key)
+            if existing:
+                return existing, False
+
+        job = Job(
+            id=uuid.uuid4().hex,
+            kind=kind,
+            status='queued',
+            params=json.dumps(params),
+            dedupe_key=dedupe_key,
+            user_id=user_id,
+            upload_history_id=upload_id
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job, True
+
+    @staticmethod
+    def find_active(db: Session, dedupe_key: str) -> Optional[Job]:
+        """Trabajo encolado o en ejecución con ese dedupe_key"""
+        return db.query(Job).filter(
+            Job.dedupe_key == dedupe_key,
+            Job.status.in_(ACTIVE_STATUSES)
+        ).order_by(Job.created_at).first()
+
+    @staticmethod
+    def get_job(db: Session, job_id: str) -> Optional[Job]:
+        return db.query(Job).filter(Job.id == job_id).first()
+
+    @staticmethod
+    def claim_next(db: Session, worker_id: str, kinds: List[str]) -> Optional[Job]:
+        """Toma el trabajo encolado más antiguo de los tipos indicados"""
+        candidates = db.query(Job.id).filter(
+            Job.status == 'queued',
+            Job.kind.in_(kinds)
+        ).order_by(Job.created_at).limit(5).all()
+
+        for (job_id,) in candidates:
+            now = datetime.datetime.utcnow()
+            # Solo uno de los procesos que compiten por el trabajo ve rowcount 1
+            claimed = db.query(Job).filter(Job.id == job_id, Job.status == 'queued').update({
+                Job.status: 'running',
+                Job.worker_id: worker_id,
+                Job.attempts: Job.attempts + 1,
+                Job.started_at: now,
+                Job.heartbeat_at: now
+            }, synchronize_session=False)
+            db.commit()
+            if claimed:
+                return JobService.get_job(db, job_id)
+        return None
+
+    @staticmethod
+    def update_progress(
+        db: Session,
+        job_id: str,
+        stage: Optional[str] = None,
+        processed: Optional[int] = None,
+        total: Optional[int] = None
+    ) -> None:
+        """Registra la etapa y el avance de un trabajo (también cuenta como latido)"""
+        values = {Job.heartbeat_at: datetime.datetime.utcnow()}
+        if stage is not None:
+            values[Job.stage] = stage
+        if processed is not None:
+            values[Job.processed] = processed
+        if total is not None:
+            values[Job.total] = total
+        db.query(Job).filter(Job.id == job_id).update(values, synchronize_session=False)
+        db.commit()
+
+    @staticmethod
+    def heartbeat(db: Session, job_ids: List[str]) -> None:
+        if not job_ids:
+            return
+        db.query(Job).filter(Job.id.in_(job_ids), Job.status == 'running').update(
+            {Job.heartbeat_at: datetime.datetime.utcnow()}, synchronize_session=False
+        )
+        db.commit()
+
+    @staticmethod
+    def complete(db: Session, job_id: str, result: Optional[Dict]) -> None:
+        now = datetime.datetime.utcnow()
+        db.query(Job).filter(Job.id == job_id).update({
+            Job.status: 'success',
+            Job.result: json.dumps(result) if result is not None else None,
+            Job.finished_at: now,
+            Job.heartbeat_at: now
+        }, synchronize_session=False)
+        db.commit()
+
+    @staticmethod
+    def fail(db: Session, job_id: str, error_message: str) -> None:
+        """Marca el trabajo como fallido y su carga del historial como error"""
+        now = datetime.datetime.utcnow()
+        db.query(Job).filter(Job.id == job_id).update({
+            Job.status: 'error',
+            Job.error_message: error_message,
+            Job.finished_at: now,
+            Job.heartbeat_at: now
+        }, synchronize_session=False)
+        db.commit()
+
+        job = JobService.get_job(db, job_id)
+        if job and job.upload_history_id:
+            JobService._mark_upload_error(db, [job.upload_history_id], error_message)
+
+    @staticmethod
+    def _mark_upload_error(db: Session, upload_ids: List[int], error_message: str) -> None:
+        db.query(UploadHistory).filter(
+            UploadHistory.id.in_(upload_ids),
+            UploadHistory.status == 'processing'
+        ).update({
+            UploadHistory.status: 'error',
+            UploadHistory.error_message: error_message
+        }, synchronize_session=False)
+        db.commit()
+
+    @staticmethod
+    def recover_interrupted(db: Session) -> Dict[str, int]:
+        """
+        Recupera los trabajos interrumpidos y las cargas que quedaron en
+        'processing' sin nada que las termine.
+
+        Returns:
+            Cantidad de trabajos reencolados, trabajos fallidos y cargas marcadas como error
+        """
+        now = datetime.datetime.utcnow()
+        stale_before = now - datetime.timedelta(seconds=JOB_STALE_AFTER)
+        stale = db.query(Job).filter(
+            Job.status == 'running',
+            Job.heartbeat_at < stale_before
+        ).all()
+
+        requeued, failed = 0, 0
+        for job in stale:
+            if (job.attempts or 0) < JOB_MAX_ATTEMPTS:
+                values = {Job.status: 'queued', Job.worker_id: None, Job.stage: None, Job.processed: 0}
+                requeued += 1
+            else:
+                values = {
+                    Job.status: 'error',
+                    Job.error_message: f"Trabajo interrumpido {job.attempts} veces, no se reintenta más",
+                    Job.finished_at: now
+                }
+                failed += 1
+            # Condicionado al latido leído: si el dueño revivió entre medio, no se toca
+            db.query(Job).filter(
+                Job.id == job.id,
+                Job.status == 'running',
+                Job.heartbeat_at == job.heartbeat_at
+            ).update(values, synchronize_session=False)
+        db.commit()
+
+        failed_uploads = [
+            job.upload_history_id for job in stale
+            if job.upload_history_id and (job.attempts or 0) >= JOB_MAX_ATTEMPTS
+        ]
+        if failed_uploads:
+            JobService._mark_upload_error(db, failed_uploads, "Procesamiento interrumpido")
+
+        # Cargas en 'processing' que ningún trabajo pendiente va a terminar
+        pending_uploads = db.query(Job.upload_history_id).filter(
+            Job.status.in_(ACTIVE_STATUSES),
+            Job.upload_history_id.isnot(None)
+        )
+        orphaned = db.query(UploadHistory).filter(
+            UploadHistory.status == 'processing',
+            UploadHistory.upload_date < now - datetime.timedelta(seconds=UPLOAD_PROCESSING_TIMEOUT),
+            UploadHistory.id.notin_(pending_uploads)
+        ).update({
+            UploadHistory.status: 'error',
+            UploadHistory.error_message: "Procesamiento interrumpido"
+        }, synchronize_session=False)
+        db.commit()
+
+        if requeued or failed or orphaned:
+            logger.warning(
+                f"♻️ Recuperación: {requeued} trabajos reencolados, {failed} fallidos, "
+                f"{orphaned} cargas interrumpidas marcadas como error"
+            )
+        return {"requeued": requeued, "failed": failed, "orphaned_uploads": orphaned}
+
+
+def job_event_keys(job: Job) -> List[str]:
+    """Claves de eventos SSE del trabajo y de su carga"""
+    keys = [job_key(job.id)]
+    if job.upload_history_id:
+        keys.append(upload_key(job.upload_history_id))
+    return keys
+
+
+def job_state_event(db: Session, job: Job) -> Tuple[str, Dict]:
+    """
+    Estado guardado del trabajo como evento SSE: 'status' mientras sigue en
+    curso, 'complete' o 'error' (con las estadísticas de su carga) al terminar.
+    """
+    if job.status in ACTIVE_STATUSES:
+        return "status", job.progress_dict()
+    upload = None
+    if job.upload_history_id:
+        upload = db.query(UploadHistory).filter(UploadHistory.id == job.upload_history_id).first()
+    data = {
+        "job_id": job.id,
+        "kind": job.kind,
+        "result": json.loads(job.result) if job.result else None,
+        "error_message": job.error_message,
+        "upload": upload.to_dict() if upload else None
+    }
+    return ("complete" if job.status == 'success' else "error"), data
+
+
+class JobProgress:
+    """
+    Callback que reciben los handlers para informar la etapa y el avance de su
+    trabajo: queda en la tabla jobs y se publica a los clientes SSE
+    """
+
+    def __init__(self, job: Job):
+        self.job_id = job.id
+        self.keys = job_event_keys(job)
+
+    def __call__(self, stage: Optional[str] = None, processed: Optional[int] = None,
+                 total: Optional[int] = None) -> None:
+        db = SessionLocal()
+        try:
+            JobService.update_progress(db, self.job_id, stage, processed, total)
+        finally:
+            db.close()
+        progress_broker.progress(self.keys, stage, processed, total)
+
+
+# handler(job, params, progress) -> resultado (dict serializable a JSON)
+JobHandler = Callable[[Job, Dict, JobProgress], Optional[Dict]]
+
+
+class JobWorkerPool:
+    """Hilos que ejecutan los trabajos encolados en la tabla jobs"""
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self.workers = workers
+        self._handlers: Dict[str, JobHandler] = {}
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._running: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        self._handlers[kind] = handler
+
+    def notify(self) -> None:
+        """Despierta a los hilos sin esperar a la próxima consulta de la cola"""
+        self._wakeup.set()
+
+    def start(self) -> None:
+        if self._threads or self.workers <= 0:
+            return
+        self._stop.clear()
+        self._recover()
+
+        for index in range(self.workers):
+            worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+            thread = threading.Thread(
+                target=self._worker_loop, args=(worker_id,), name=f"eduforge-job-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+        monitor = threading.Thread(target=self._monitor_loop, name="eduforge-job-monitor", daemon=True)
+        monitor.start()
+        self._threads.append(monitor)
+        logger.info(f"⚙️ Pool de trabajos iniciado ({self.workers} hilos, tipos: {sorted(self._handlers)})")
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Detiene los hilos. Un trabajo en curso se deja terminar hasta timeout; si
+        el proceso se cierra antes, la recuperación lo vuelve a encolar.
+        """
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _recover(self) -> None:
+        db = SessionLocal()
+        try:
+            JobService.recover_interrupted(db)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"❌ Error recuperando trabajos interrumpidos: {e}")
+        finally:
+            db.close()
+
+    def _worker_loop(self, worker_id: str) -> None:
+        while not self._stop.is_set():
+            db = SessionLocal()
+            try:
+                job = JobService.claim_next(db, worker_id, list(self._handlers))
+            except Exception as e:
+                db.rollback()
+                logger.error(f"❌ Error consultando la cola de trabajos: {e}")
+                job = None
+            finally:
+                db.close()
+
+            if job is None:
+                self._wakeup.wait(JOB_POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+            self._run(job, worker_id)
+
+    def _run(self, job: Job, worker_id: str) -> None:
+        with self._lock:
+            self._running[job.id] = worker_id
+        logger.info(f"▶️ Trabajo {job.id} ({job.kind}, intento {job.attempts}) en {worker_id}")
+
+        try:
+            result = self._handlers[job.kind](job, json.loads(job.params), JobProgress(job))
+            outcome = ("complete", result)
+        except Exception as e:
+            logger.error(f"❌ Trabajo {job.id} ({job.kind}) falló: {e}")
+            outcome = ("fail", str(e))
+        finally:
+            with self._lock:
+                self._running.pop(job.id, None)
+
+        db = SessionLocal()
+        try:
+            if outcome[0] == "complete":
+                JobService.complete(db, job.id, outcome[1])
+                logger.info(f"✅ Trabajo {job.id} ({job.kind}) terminado")
+            else:
+                JobService.fail(db, job.id, outcome[1])
+
+            event, data = job_state_event(db, JobService.get_job(db, job.id))
+            # Un trabajo 'parse' terminado no cierra el stream de su carga (falta la predicción)
+            keys = job_event_keys(job) if event == "error" else [job_key(job.id)]
+            progress_broker.publish(keys, event, data)
+        finally:
+            db.close()
+
+    def _monitor_loop(self) -> None:
+        """Latido de los trabajos de este proceso y recuperación periódica de los interrumpidos"""
+        while not self._stop.wait(JOB_HEARTBEAT_INTERVAL):
+            with self._lock:
+                job_ids = list(self._running)
+            db = SessionLocal()
+            try:
+                JobService.heartbeat(db, job_ids)
+            except Exception as e:
+                db.rollback()
+                logger.error(f"❌ Error registrando el latido de los trabajos: {e}")
+            finally:
+                db.close()
+            self._recover()
+
+
+# Pool del proceso (main.py registra los handlers y lo inicia al arrancar)
+job_pool = JobWorkerPool()
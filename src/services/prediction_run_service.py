@@ -0,0 +1,193 @@
+# src/services/prediction_run_service.py
+"""
+Corridas (snapshots) de resultados_prediccion.
+
+Cada predicción escribe sus filas con un run_id nuevo mientras los dashboards
+siguen leyendo la corrida actual. Al terminar, la corrida se publica
+cambiando el puntero current_prediction_run en una sola transacción: los
+lectores ven la corrida anterior completa o la nueva completa, nunca una
+tabla vacía ni a medio escribir.
+
+Las corridas viejas se borran en bloque por run_id (índice) después de
+publicar. Se conservan las últimas PREDICTION_RUNS_KEPT corridas completas
+(la actual incluida) para que una lectura que empezó antes del cambio de
+puntero termine con los mismos datos.
+
+Cada corrida recuerda la carga (o el lote) de la que salió: los estudiantes
+de student_data que se muestran son los de esa carga (current_students).
+"""
+import datetime
+import logging
+import os
+from typing import List, Optional
+
+from sqlalchemy import false, select
+
+from models import CurrentPredictionRun, PredictionRun, ResultadoPrediccion, StudentData
+from models.upload_history import UploadHistory
+
+logger = logging.getLogger(__name__)
+
+# Corridas completas que se conservan (la actual y las anteriores más recientes)
+PREDICTION_RUNS_KEPT = max(1, int(os.getenv("PREDICTION_RUNS_KEPT", "2")))
+
+# Una corrida que sigue en construcción después de este tiempo se da por
+# abandonada (el proceso murió a mitad) y se borra
+PREDICTION_RUN_STALE_HOURS = float(os.getenv("PREDICTION_RUN_STALE_HOURS", "6"))
+
+# Fila única del puntero
+POINTER_ID = 1
+
+
+def current_run_filter():
+    """
+    Condición para leer solo la corrida actual. Es una subconsulta, así la
+    lectura del puntero y de las filas ocurre en la misma sentencia.
+    """
+    current = select(CurrentPredictionRun.run_id).where(CurrentPredictionRun.id == POINTER_ID).scalar_subquery()
+    return ResultadoPrediccion.run_id == current
+
+
+def current_results(session):
+    """Consulta de resultados_prediccion limitada a la corrida actual"""
+    return session.query(ResultadoPrediccion).filter(current_run_filter())
+
+
+def current_run_id(session) -> Optional[int]:
+    return session.query(CurrentPredictionRun.run_id).filter(CurrentPredictionRun.id == POINTER_ID).scalar()
+
+
+def current_students(session):
+    """
+    Consulta de student_data limitada a la carga de la corrida actual (todas
+    las cargas de su lote en una carga por lotes, el grupo sin carga si se
+    predijo sin upload_id). Sin corrida actual no devuelve filas.
+    """
+    run = session.query(PredictionRun.upload_id, PredictionRun.batch_id).join(
+        CurrentPredictionRun, CurrentPredictionRun.run_id == PredictionRun.id
+    ).filter(CurrentPredictionRun.id == POINTER_ID).first()
+
+    query = session.query(StudentData)
+    if run is None:
+        return query.filter(false())
+    if run.batch_id is not None:
+        batch_uploads = select(UploadHistory.id).where(UploadHistory.batch_id == run.batch_id)
+        return query.filter(StudentData.upload_id.in_(batch_uploads))
+    if run.upload_id is not None:
+        return query.filter(StudentData.upload_id == run.upload_id)
+    return query.filter(StudentData.upload_id.is_(None))
+
+
+def start_run(session, model_version: Optional[str] = None, upload_id: Optional[int] = None,
+              batch_id: Optional[int] = None) -> int:
+    """Crea una corrida en construcción (invisible para los dashboards) y devuelve su id"""
+    run = PredictionRun(status='building', model_version=model_version, upload_id=upload_id, batch_id=batch_id)
+    session.add(run)
+    session.commit()
+    return run.id
+
+
+def _set_pointer(session, run_id: Optional[int]) -> None:
+    updated = session.query(CurrentPredictionRun).filter(
+        CurrentPredictionRun.id == POINTER_ID
+    ).update({CurrentPredictionRun.run_id: run_id}, synchronize_session=False)
+    if not updated:
+        session.add(CurrentPredictionRun(id=POINTER_ID, run_id=run_id))
+
+
+def publish_run(session, run_id: int, row_count: int) -> None:
+    """Marca la corrida como completa y la deja como actual (en una transacción); luego borra las viejas"""
+    updated = session.query(PredictionRun).filter(
+        PredictionRun.id == run_id, PredictionRun.status == 'building'
+    ).update({
+        PredictionRun.status: 'complete',
+        PredictionRun.row_count: row_count,
+        PredictionRun.completed_at: datetime.datetime.utcnow()
+    }, synchronize_session=False)
+    if not updated:
+        session.rollback()
+        raise RuntimeError(f"La corrida {run_id} ya no está en construcción (se dio por abandonada)")
+    _set_pointer(session, run_id)
+    session.commit()
+    logger.info(f"📌 Corrida {run_id} publicada ({row_count} predicciones)")
+    prune_runs(session)
+
+
+def discard_run(session, run_id: int) -> None:
+    """Borra una corrida que no llegó a publicarse (error a mitad de la predicción)"""
+    try:
+        session.rollback()
+        _delete_runs(session, [run_id])
+        session.commit()
+    except Exception as e:
+        # Queda en construcción; prune_runs la borra cuando se da por abandonada
+        session.rollback()
+        logger.warning(f"⚠️ Error descartando la corrida {run_id}: {e}")
+
+
+def clear_current_run(session) -> int:
+    """
+    Deja los dashboards sin corrida actual (vacíos) y borra las viejas.
+    Devuelve cuántas predicciones tenía la corrida que se dejó de mostrar.
+    """
+    run_id = current_run_id(session)
+    row_count = 0
+    if run_id is not None:
+        row_count = session.query(PredictionRun.row_count).filter(PredictionRun.id == run_id).scalar() or 0
+    _set_pointer(session, None)
+    session.commit()
+    prune_runs(session)
+    return row_count
+
+
+def _delete_runs(session, run_ids: List[int]) -> int:
+    if not run_ids:
+        return 0
+    deleted = session.query(ResultadoPrediccion).filter(
+        ResultadoPrediccion.run_id.in_(run_ids)
+    ).delete(synchronize_session=False)
+    session.query(PredictionRun).filter(PredictionRun.id.in_(run_ids)).delete(synchronize_session=False)
+    return deleted
+
+
+def prune_runs(session, keep: int = PREDICTION_RUNS_KEPT) -> int:
+    """
+    Borra en bloque las corridas que ya no se muestran: las completas más allá
+    de las keep más recientes y las que llevan más de
+    PREDICTION_RUN_STALE_HOURS en construcción. Las demás corridas en
+    construcción (predicciones en curso) no se tocan.
+
+    Returns:
+        Filas de resultados_prediccion borradas
+    """
+    try:
+        current = current_run_id(session)
+        completas = [
+            run_id for (run_id,) in session.query(PredictionRun.id).filter(
+                PredictionRun.status == 'complete'
+            ).order_by(PredictionRun.id.desc())
+            if run_id != current
+        ]
+        kept = set(completas[:keep - 1] if current is not None else completas[:keep])
+        if current is not None:
+            kept.add(current)
+
+        abandoned_before = datetime.datetime.utcnow() - datetime.timedelta(hours=PREDICTION_RUN_STALE_HOURS)
+        stale = []
+        for run_id, status, created_at in session.query(PredictionRun.id, PredictionRun.status, PredictionRun.created_at):
+            if run_id in kept:
+                continue
+            if status == 'building' and (created_at is None or created_at > abandoned_before):
+                continue
+            stale.append(run_id)
+
+        deleted = _delete_runs(session, stale)
+        session.commit()
+        if stale:
+            logger.info(f"🗑️ {len(stale)} corridas anteriores eliminadas ({deleted} predicciones)")
+        return deleted
+    except Exception as e:
+        # Limpieza diferida: si falla, se reintenta en la próxima publicación
+        session.rollback()
+        logger.warning(f"⚠️ Error eliminando corridas anteriores: {e}")
+        return 0
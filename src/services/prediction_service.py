@@ -1,42 +1,130 @@
 # src/services/prediction_service.py
+"""
+Predicción en tiempo real para un estudiante.
 
-# Asegúrate de que 'StandardScaler' esté importado correctamente desde sklearn
-from sklearn.preprocessing import StandardScaler
-from src.models.prediction_model import DropoutPredictionModel
+Usa el mismo modelo que /predict (la versión activa del registro). Las
+peticiones individuales que llegan dentro de una ventana corta se agrupan en
+un solo lote: una sola preparación de características y una sola pasada del
+bosque para todas, en lugar de una por petición.
+"""
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
 
-# Usar la ruta completa para el modelo y el scaler entrenados
-model_path = r"C:\Users\james\OneDrive\Documentos\PREGRADO UPAO\CICLO 9\Tesis I\EduForge\src\models\trained\dropout_model.pkl"
-scaler_path = r"C:\Users\james\OneDrive\Documentos\PREGRADO UPAO\CICLO 9\Tesis I\EduForge\src\models\trained\scaler.pkl"
+import numpy as np
+import pandas as pd
 
-# Inicializar el modelo y el scaler cargados
-model = DropoutPredictionModel(model_path, scaler_path)
+from models.model_registry import registry
+from models.prediction_cache import prediction_cache
+from models.predictor import classify_risk_levels, prepare_features_real
+from services.executor_service import run_blocking
 
+logger = logging.getLogger(__name__)
 
-def predict_dropout(calificacion: float, asistencia: float, conducta: str):
+# Cuánto espera el primer pedido de un lote a que lleguen otros
+PREDICTION_BATCH_WINDOW_MS = float(os.getenv("PREDICTION_BATCH_WINDOW_MS", "5"))
+
+# Máximo de estudiantes por lote
+PREDICTION_BATCH_MAX_SIZE = int(os.getenv("PREDICTION_BATCH_MAX_SIZE", "256"))
+
+
+def predict_students(students: List[Dict]) -> List[Dict]:
     """
-    Realiza la predicción sobre si un estudiante va a desertar o no.
+    Predice un lote de estudiantes con el modelo activo.
+
+    Args:
+        students: Diccionarios con nota_final, asistencia, inasistencia y conducta
+                  (estudiante_id y nombre son opcionales y se devuelven tal cual)
 
-    :param calificacion: La calificación del estudiante
-    :param asistencia: El porcentaje de asistencia del estudiante
-    :param conducta: La conducta del estudiante ("Buena", "Mala")
-    :return: Un mensaje indicando si el estudiante tiene riesgo de deserción o no
+    Returns:
+        Un diccionario de resultado por estudiante, en el mismo orden
     """
-    try:
-        # Convertir la conducta en una variable numérica (1 = Buena, 0 = Mala)
-        conducta = 1 if conducta.lower() == 'buena' else 0
+    bundle = registry.current()
+    df = pd.DataFrame(students, columns=["estudiante_id", "nombre", "nota_final", "asistencia", "inasistencia", "conducta"])
+
+    X = prepare_features_real(df, bundle)
+    y_pred, y_pred_proba = prediction_cache.predict(bundle, X)
+    y_pred_proba = y_pred_proba[:, 1]
+    riesgos = classify_risk_levels(y_pred_proba).tolist()
+
+    resultados = []
+    for student, prediccion, probabilidad, riesgo in zip(
+        students, np.asarray(y_pred).astype(int).tolist(), y_pred_proba.tolist(), riesgos
+    ):
+        resultados.append({
+            "estudiante_id": student.get("estudiante_id"),
+            "nombre": student.get("nombre"),
+            "resultado_prediccion": str(prediccion),
+            "probabilidad_desercion": round(probabilidad, 4),
+            "riesgo_desercion": riesgo,
+            "prediccion": "Sí" if prediccion == 1 else "No",
+            "mensaje": "El estudiante tiene riesgo de deserción." if prediccion == 1
+                       else "El estudiante no tiene riesgo de deserción.",
+            "model_version": bundle.version
+        })
+    return resultados
+
+
+class PredictionBatcher:
+    """Agrupa las peticiones individuales concurrentes en lotes vectorizados"""
+
+    def __init__(self, window_ms: float = PREDICTION_BATCH_WINDOW_MS, max_size: int = PREDICTION_BATCH_MAX_SIZE):
+        self.window_seconds = window_ms / 1000.0
+        self.max_size = max_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.requests = 0
+
+    def _ensure_running(self) -> None:
+        loop = asyncio.get_running_loop()
+        # La cola y la tarea pertenecen al event loop en el que se crearon
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+
+    async def predict(self, student: Dict) -> Dict:
+        """Encola un estudiante y espera su resultado"""
+        self._ensure_running()
+        future = self._loop.create_future()
+        self._queue.put_nowait((student, future))
+        return await future
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+
+            # Dar tiempo a que lleguen más peticiones, salvo que el lote ya esté lleno
+            if self._queue.qsize() < self.max_size - 1 and self.window_seconds > 0:
+                await asyncio.sleep(self.window_seconds)
+            while len(batch) < self.max_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            await self._score(batch)
+
+    async def _score(self, batch: List[Tuple[Dict, asyncio.Future]]) -> None:
+        # Las peticiones canceladas (cliente desconectado) no se predicen
+        batch = [(student, future) for student, future in batch if not future.done()]
+        if not batch:
+            return
 
-        # Las características de entrada
-        features = [calificacion, asistencia, conducta]
+        try:
+            resultados = await run_blocking(predict_students, [student for student, _ in batch])
+        except Exception as e:
+            logger.error(f"❌ Error en lote de predicción individual ({len(batch)} estudiantes): {str(e)}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
 
-        # Normalizar los datos usando el scaler
-        features_scaled = StandardScaler().fit_transform([features])
+        self.batches += 1
+        self.requests += len(batch)
+        for (_, future), resultado in zip(batch, resultados):
+            if not future.done():
+                future.set_result(resultado)
 
-        # Realizar la predicción
-        prediction = model.predict(features_scaled)
 
-        if prediction == 1:
-            return {"prediccion": "Sí", "mensaje": "El estudiante tiene riesgo de deserción."}
-        else:
-            return {"prediccion": "No", "mensaje": "El estudiante no tiene riesgo de deserción."}
-    except Exception as e:
-        raise Exception(f"Error al realizar la predicción: {e}")
+prediction_batcher = PredictionBatcher()
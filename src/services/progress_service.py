@@ -0,0 +1,162 @@
+# src/services/progress_service.py
+"""
+Eventos de avance de las predicciones para los clientes SSE.
+
+El flujo de predicción (trabajos en segundo plano, modo streaming y /predict
+síncrono) publica aquí cada cambio de etapa (parse, predict, persist), las
+filas procesadas y el resultado final. Los endpoints SSE se suscriben a la
+clave del trabajo ("job:<id>") o de la carga ("upload:<id>") y reciben los
+eventos en cuanto ocurren, sin consultar la base de datos.
+
+Los eventos viven en memoria del proceso: un cliente conectado a otro worker
+de uvicorn no los ve (el endpoint SSE lo compensa revisando la base de datos
+cada SSE_KEEPALIVE_SECONDS).
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from services.executor_service import run_blocking
+
+logger = logging.getLogger(__name__)
+
+# Eventos que cierran el stream
+FINAL_EVENTS = ("complete", "error")
+
+# Sin eventos durante este tiempo se manda un comentario de keepalive y se
+# revisa el estado guardado (por si el trabajo corre en otro worker)
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+
+
+def job_key(job_id: str) -> str:
+    return f"job:{job_id}"
+
+
+def upload_key(upload_id: int) -> str:
+    return f"upload:{upload_id}"
+
+
+class Subscription:
+    """Cola asyncio de un cliente SSE; se alimenta desde cualquier hilo"""
+
+    def __init__(self, key: str, loop: asyncio.AbstractEventLoop):
+        self.key = key
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    def push(self, event: Dict) -> None:
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+
+    async def get(self, timeout: float) -> Optional[Dict]:
+        """Próximo evento, o None si no llegó ninguno en timeout segundos"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class ProgressBroker:
+    """Reparte los eventos de avance entre los suscriptores de cada clave"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, List[Subscription]] = {}
+        self._stages: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, key: str) -> Subscription:
+        """Suscribe al cliente actual (llamar desde el event loop)"""
+        subscription = Subscription(key, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(key, []).append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.key, [])
+            if subscription in subscribers:
+                subscribers.remove(subscription)
+            if not subscribers:
+                self._subscribers.pop(subscription.key, None)
+
+    def publish(self, keys: List[str], event: str, data: Dict) -> None:
+        """Envía el evento a los suscriptores de cada clave (desde cualquier hilo)"""
+        with self._lock:
+            targets = [(key, list(self._subscribers.get(key, []))) for key in keys]
+            if event in FINAL_EVENTS:
+                for key in keys:
+                    self._stages.pop(key, None)
+        for key, subscribers in targets:
+            for subscription in subscribers:
+                try:
+                    subscription.push({"event": event, "data": data})
+                except RuntimeError:
+                    # El event loop del cliente ya se cerró
+                    self.unsubscribe(subscription)
+
+    def progress(self, keys: List[str], stage: Optional[str], processed: Optional[int] = None,
+                 total: Optional[int] = None) -> None:
+        """Publica el avance como 'stage' si cambió la etapa o como 'progress' si no"""
+        data = {"stage": stage, "processed": processed, "total": total}
+        with self._lock:
+            changed = [key for key in keys if stage is not None and self._stages.get(key) != stage]
+            for key in changed:
+                self._stages[key] = stage
+        if changed:
+            self.publish(changed, "stage", data)
+        unchanged = [key for key in keys if key not in changed]
+        if unchanged:
+            self.publish(unchanged, "progress", data)
+
+
+def format_sse(event: str, data: Dict) -> str:
+    """Un evento en el formato text/event-stream"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def event_stream(
+    subscription: Subscription,
+    read_state: Callable[[], Tuple[str, Dict]],
+    keepalive: float = SSE_KEEPALIVE_SECONDS
+) -> AsyncIterator[str]:
+    """
+    Cuerpo de una respuesta SSE: primero el estado guardado y luego los eventos
+    publicados hasta el evento final.
+
+    Args:
+        subscription: Suscripción creada antes de leer el estado (no se pierde
+                      ningún evento entre la lectura y la espera)
+        read_state: Función bloqueante que devuelve (evento, datos) del estado
+                    guardado: 'status' si sigue en curso o el evento final
+        keepalive: Segundos sin eventos antes del keepalive y de volver a leer el estado
+    """
+    try:
+        event, data = await run_blocking(read_state)
+        yield format_sse(event, data)
+        if event in FINAL_EVENTS:
+            return
+
+        while True:
+            item = await subscription.get(keepalive)
+            if item is None:
+                event, current = await run_blocking(read_state)
+                if event in FINAL_EVENTS or current != data:
+                    data = current
+                    yield format_sse(event, data)
+                    if event in FINAL_EVENTS:
+                        return
+                else:
+                    yield ": keepalive\n\n"
+                continue
+
+            yield format_sse(item["event"], item["data"])
+            if item["event"] in FINAL_EVENTS:
+                return
+    finally:
+        progress_broker.unsubscribe(subscription)
+
+
+# Broker del proceso
+progress_broker = ProgressBroker()
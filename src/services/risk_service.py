@@ -2,7 +2,7 @@
 
 from sqlalchemy.orm import Session
 from config import SessionLocal
-from models import ResultadoPrediccion
+from services.prediction_run_service import current_results
 
 # Variable global para almacenar los últimos resultados de predicción del CSV (mantener para compatibilidad)
 latest_predictions = []
@@ -33,7 +33,7 @@ class RiskService:
         db = SessionLocal()
         try:
             # Leer desde la base de datos
-            results = db.query(ResultadoPrediccion).all()
+            results = current_results(db).all()
 
             print(f"🔍 DEBUG: get_students_at_risk - {len(results)} registros encontrados en BD")
 
@@ -1,10 +1,19 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, and_, or_
-from models.upload_history import UploadHistory, UploadPrediction
+from sqlalchemy import desc, and_, or_, insert, select, literal
+from models import StudentData
+from models.upload_history import UploadHistory, UploadPrediction, UploadBatch
 from models.user import Usuario
-from datetime import datetime, timedelta
-from typing import List, Optional, Dict
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Dict, Tuple
 import json
+import os
+
+import pandas as pd
+
+from services.bulk_loader import bulk_insert
+
+# Predicciones por sentencia al guardar el historial de una carga
+HISTORY_BULK_BATCH_ROWS = int(os.getenv("HISTORY_BULK_BATCH_ROWS", "10000"))
 
 
 class UploadHistoryService:
@@ -16,7 +25,10 @@ class UploadHistoryService:
         filename: str,
         original_filename: str,
         file_path: str,
-        user_id: int
+        user_id: int,
+        content_hash: Optional[str] = None,
+        sheet_name: Optional[str] = None,
+        batch_id: Optional[int] = None
     ) -> UploadHistory:
         """Crear un registro de carga nuevo"""
         upload = UploadHistory(
@@ -24,13 +36,82 @@ class UploadHistoryService:
             original_filename=original_filename,
             file_path=file_path,
             user_id=user_id,
-            status='processing'
+            status='processing',
+            content_hash=content_hash,
+            sheet_name=sheet_name,
+            batch_id=batch_id
         )
         db.add(upload)
         db.commit()
         db.refresh(upload)
         return upload
 
+    @staticmethod
+    def create_batch_record(
+        db: Session,
+        filename: str,
+        original_filename: str,
+        file_path: str,
+        user_id: Optional[int],
+        content_hash: Optional[str] = None
+    ) -> UploadBatch:
+        """Crear el registro padre de una carga por lotes (zip)"""
+        batch = UploadBatch(
+            filename=filename,
+            original_filename=original_filename,
+            file_path=file_path,
+            user_id=user_id,
+            content_hash=content_hash,
+            status='processing'
+        )
+        db.add(batch)
+        db.commit()
+        db.refresh(batch)
+        return batch
+
+    @staticmethod
+    def update_batch_stats(db: Session, batch_id: int, processing_time: float) -> Optional[UploadBatch]:
+        """Suma las estadísticas de los archivos del lote y fija su estado"""
+        batch = db.query(UploadBatch).filter(UploadBatch.id == batch_id).first()
+        if not batch:
+            return None
+
+        uploads = db.query(UploadHistory).filter(UploadHistory.batch_id == batch_id).all()
+        processed = [upload for upload in uploads if upload.status in ('success', 'partial')]
+        failed = len(uploads) - len(processed)
+
+        batch.total_files = len(uploads)
+        batch.processed_files = len(processed)
+        batch.failed_files = failed
+        batch.total_students = sum(upload.total_students or 0 for upload in uploads)
+        batch.processed_students = sum(upload.processed_students or 0 for upload in processed)
+        batch.high_risk_count = sum(upload.high_risk_count or 0 for upload in processed)
+        batch.medium_risk_count = sum(upload.medium_risk_count or 0 for upload in processed)
+        batch.low_risk_count = sum(upload.low_risk_count or 0 for upload in processed)
+        batch.processing_time = processing_time
+
+        if failed == 0:
+            batch.status = 'success'
+            batch.error_message = None
+        else:
+            batch.status = 'error' if not processed else 'partial'
+            batch.error_message = f"{failed} de {len(uploads)} archivos con error"
+
+        db.commit()
+        db.refresh(batch)
+        return batch
+
+    @staticmethod
+    def get_batch_by_id(db: Session, batch_id: int, user_id: Optional[int] = None, is_admin: bool = False) -> Optional[UploadBatch]:
+        """Obtener una carga por lotes por ID"""
+        query = db.query(UploadBatch).filter(UploadBatch.id == batch_id)
+
+        # Si no es admin, verificar que sea dueño del lote
+        if not is_admin and user_id:
+            query = query.filter(UploadBatch.user_id == user_id)
+
+        return query.first()
+
     @staticmethod
     def update_upload_stats(
         db: Session,
@@ -43,7 +124,8 @@ class UploadHistoryService:
         low_risk: int,
         processing_time: float,
         status: str = 'success',
-        error_message: Optional[str] = None
+        error_message: Optional[str] = None,
+        model_version: Optional[str] = None
     ):
         """Actualizar las estadísticas de una carga"""
         upload = db.query(UploadHistory).filter(UploadHistory.id == upload_id).first()
@@ -64,6 +146,8 @@ class UploadHistoryService:
             upload.processing_time = processing_time
             upload.status = status
             upload.error_message = error_message
+            if model_version:
+                upload.model_version = model_version
 
             db.commit()
             db.refresh(upload)
@@ -83,7 +167,11 @@ class UploadHistoryService:
         riesgo_desercion: str,
         probabilidad_desercion: float,
         tiempo_prediccion: float,
-        risk_factors: Optional[Dict] = None
+        risk_factors: Optional[Dict] = None,
+        model_version: Optional[str] = None,
+        feature_hash: Optional[str] = None,
+        contributions: Optional[Dict[str, float]] = None,
+        fecha: Optional[date] = None
     ):
         """Agregar una predicción individual al historial"""
         prediction = UploadPrediction(
@@ -94,16 +182,226 @@ class UploadHistoryService:
             conducta=conducta,
             asistencia=asistencia,
             inasistencia=inasistencia,
+            fecha=fecha,
             resultado_prediccion=resultado_prediccion,
             riesgo_desercion=riesgo_desercion,
             probabilidad_desercion=probabilidad_desercion,
             tiempo_prediccion=tiempo_prediccion,
-            risk_factors=json.dumps(risk_factors) if risk_factors else None
+            risk_factors=json.dumps(risk_factors) if risk_factors else None,
+            model_version=model_version,
+            feature_hash=feature_hash,
+            contributions=json.dumps(contributions) if contributions else None
         )
         db.add(prediction)
         db.commit()
         return prediction
 
+    @staticmethod
+    def add_predictions_to_upload(db: Session, upload_id: int, predictions: List[Dict],
+                                  batch_rows: int = HISTORY_BULK_BATCH_ROWS) -> int:
+        """
+        Guarda en el historial todas las predicciones de una carga (con la forma
+        que devuelve /predict) en una sola transacción, de a batch_rows filas
+        por sentencia (COPY en PostgreSQL). Guarda los mismos valores que
+        add_prediction_to_upload fila por fila.
+
+        Returns:
+            Cantidad de predicciones guardadas
+        """
+        fecha_prediccion = datetime.utcnow()
+        try:
+            for start in range(0, len(predictions), batch_rows):
+                chunk = predictions[start:start + batch_rows]
+                rows = pd.DataFrame({
+                    'upload_history_id': upload_id,
+                    'estudiante_id': [pred.get('id_estudiante', 0) for pred in chunk],
+                    'nombre': [pred.get('nombre', 'Sin nombre') for pred in chunk],
+                    'nota_final': [pred.get('nota_final', 0) for pred in chunk],
+                    'conducta': [pred.get('conducta', '') for pred in chunk],
+                    'asistencia': [pred.get('asistencia', 0) for pred in chunk],
+                    'inasistencia': [pred.get('inasistencia', 0) for pred in chunk],
+                    'fecha': [date.fromisoformat(pred['fecha']) if pred.get('fecha') else None for pred in chunk],
+                    'resultado_prediccion': [pred.get('resultado_prediccion', '0') for pred in chunk],
+                    'riesgo_desercion': [pred.get('riesgo_desercion', 'Bajo') for pred in chunk],
+                    'probabilidad_desercion': [pred.get('probabilidad_desercion', 0.0) for pred in chunk],
+                    # Una lista de factores vacía se guarda como NULL
+                    'risk_factors': [
+                        json.dumps({'factors': pred['risk_factors']}) if pred.get('risk_factors') else None
+                        for pred in chunk
+                    ],
+                    'contributions': [
+                        json.dumps(pred['contributions']) if pred.get('contributions') else None
+                        for pred in chunk
+                    ],
+                    'tiempo_prediccion': [pred.get('tiempo_prediccion', 0.0) for pred in chunk],
+                    'fecha_prediccion': fecha_prediccion,
+                    'model_version': [pred.get('model_version') for pred in chunk],
+                    'feature_hash': [pred.get('feature_hash') for pred in chunk]
+                })
+                bulk_insert(db, UploadPrediction.__table__, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return len(predictions)
+
+    @staticmethod
+    def clear_upload_predictions(db: Session, upload_id: int) -> int:
+        """Borrar las predicciones guardadas de una carga (antes de reintentar su predicción)"""
+        deleted = db.query(UploadPrediction).filter(
+            UploadPrediction.upload_history_id == upload_id
+        ).delete(synchronize_session=False)
+        db.commit()
+        return deleted
+
+    @staticmethod
+    def clear_upload_students(db: Session, upload_id: Optional[int]) -> int:
+        """
+        Borrar de student_data los estudiantes de una carga (upload_id None: los
+        de cargas sin usuario). No hace commit: queda en la transacción de quien llama.
+        """
+        query = db.query(StudentData)
+        if upload_id is None:
+            query = query.filter(StudentData.upload_id.is_(None))
+        else:
+            query = query.filter(StudentData.upload_id == upload_id)
+        return query.delete(synchronize_session=False)
+
+    @staticmethod
+    def find_scored_duplicate(
+        db: Session,
+        content_hash: str,
+        model_version: str,
+        exclude_upload_id: Optional[int] = None,
+        sheet_name: Optional[str] = None
+    ) -> Optional[UploadHistory]:
+        """
+        Carga anterior con el mismo contenido (SHA-256) y la misma hoja ya
+        puntuada por la versión del modelo indicada, con sus predicciones guardadas.
+        """
+        if not content_hash or not model_version:
+            return None
+        query = db.query(UploadHistory).filter(
+            UploadHistory.content_hash == content_hash,
+            UploadHistory.model_version == model_version,
+            UploadHistory.status == 'success',
+            UploadHistory.processed_students > 0,
+            UploadHistory.sheet_name.is_(None) if sheet_name is None else UploadHistory.sheet_name == sheet_name
+        )
+        if exclude_upload_id is not None:
+            query = query.filter(UploadHistory.id != exclude_upload_id)
+
+        for candidate in query.order_by(desc(UploadHistory.upload_date), desc(UploadHistory.id)).limit(5):
+            stored = db.query(UploadPrediction).filter(
+                UploadPrediction.upload_history_id == candidate.id
+            ).count()
+            if stored == candidate.processed_students:
+                return candidate
+        return None
+
+    @staticmethod
+    def copy_upload_predictions(db: Session, source_upload_id: int, target_upload_id: int) -> int:
+        """Copia (INSERT ... SELECT, en la base de datos) las predicciones de una carga a otra"""
+        columns = [
+            column.name for column in UploadPrediction.__table__.columns
+            if column.name not in ('id', 'upload_history_id')
+        ]
+        table = UploadPrediction.__table__
+        rows = select(
+            literal(target_upload_id), *[table.c[name] for name in columns]
+        ).where(table.c.upload_history_id == source_upload_id).order_by(table.c.id)
+        result = db.execute(insert(table).from_select(['upload_history_id'] + columns, rows))
+        db.commit()
+        return result.rowcount
+
+    @staticmethod
+    def get_stored_results(db: Session, upload_id: int) -> List[Dict]:
+        """
+        Predicciones guardadas de una carga con la misma forma que devuelve
+        /predict (para responder una carga deduplicada sin volver a predecir)
+        """
+        rows = db.query(UploadPrediction).filter(
+            UploadPrediction.upload_history_id == upload_id
+        ).order_by(UploadPrediction.id).all()
+
+        resultados = []
+        for row in rows:
+            contributions = json.loads(row.contributions) if row.contributions else None
+            # Una lista de factores vacía se guarda como NULL
+            if row.risk_factors:
+                risk_factors = json.loads(row.risk_factors)['factors']
+            else:
+                risk_factors = [] if contributions is not None else None
+            resultados.append({
+                "id_estudiante": row.estudiante_id,
+                "nombre": row.nombre,
+                "nota_final": row.nota_final,
+                "nota": row.nota_final,
+                "asistencia": row.asistencia,
+                "inasistencia": row.inasistencia,
+                "conducta": row.conducta,
+                "fecha": row.fecha.isoformat() if row.fecha else None,
+                "tiempo_prediccion": row.tiempo_prediccion,
+                "resultado_prediccion": row.resultado_prediccion,
+                "riesgo_desercion": row.riesgo_desercion,
+                "probabilidad_desercion": row.probabilidad_desercion,
+                "model_version": row.model_version,
+                "feature_hash": row.feature_hash,
+                "contributions": contributions,
+                "risk_factors": risk_factors
+            })
+        return resultados
+
+    @staticmethod
+    def get_previous_predictions(db: Session, upload_id: int) -> Tuple[Optional[int], Dict[int, Dict]]:
+        """
+        Predicciones de la carga anterior del mismo usuario, por estudiante_id,
+        para el modo incremental de /predict.
+
+        Returns:
+            (id de la carga anterior o None, {estudiante_id: predicción})
+        """
+        upload = db.query(UploadHistory).filter(UploadHistory.id == upload_id).first()
+        if not upload or upload.user_id is None:
+            return None, {}
+
+        # Solo cargas hechas antes que esta (re-predecir una carga vieja no usa las posteriores)
+        previous = db.query(UploadHistory).filter(
+            UploadHistory.user_id == upload.user_id,
+            UploadHistory.id != upload_id,
+            or_(
+                UploadHistory.upload_date < upload.upload_date,
+                and_(UploadHistory.upload_date == upload.upload_date, UploadHistory.id < upload_id)
+            ),
+            UploadHistory.status.in_(['success', 'partial'])
+        ).order_by(desc(UploadHistory.upload_date), desc(UploadHistory.id)).first()
+        if not previous:
+            return None, {}
+
+        rows = db.query(
+            UploadPrediction.estudiante_id,
+            UploadPrediction.feature_hash,
+            UploadPrediction.resultado_prediccion,
+            UploadPrediction.probabilidad_desercion,
+            UploadPrediction.riesgo_desercion,
+            UploadPrediction.contributions
+        ).filter(
+            UploadPrediction.upload_history_id == previous.id,
+            UploadPrediction.feature_hash.isnot(None),
+            UploadPrediction.contributions.isnot(None)
+        ).all()
+
+        return previous.id, {
+            row.estudiante_id: {
+                'feature_hash': row.feature_hash,
+                'resultado_prediccion': row.resultado_prediccion,
+                'probabilidad_desercion': row.probabilidad_desercion,
+                'riesgo_desercion': row.riesgo_desercion,
+                'contributions': json.loads(row.contributions)
+            }
+            for row in rows
+        }
+
     @staticmethod
     def get_all_uploads(
         db: Session,
@@ -172,7 +470,7 @@ class UploadHistoryService:
 
     @staticmethod
     def delete_upload(db: Session, upload_id: int, user_id: Optional[int] = None, is_admin: bool = False) -> bool:
-        """Eliminar una carga y todas sus predicciones"""
+        """Eliminar una carga, todas sus predicciones y sus estudiantes de student_data"""
         query = db.query(UploadHistory).filter(UploadHistory.id == upload_id)
 
         # Si no es admin, verificar que sea dueño
@@ -181,6 +479,7 @@ class UploadHistoryService:
 
         upload = query.first()
         if upload:
+            UploadHistoryService.clear_upload_students(db, upload_id)
             db.delete(upload)
             db.commit()
             return True
@@ -0,0 +1,134 @@
+# src/services/upload_schema.py
+"""
+Esquema de lectura de las cargas.
+
+A partir del encabezado del archivo y de la configuración del modelo
+(expected_columns) se arma un plan de lectura: qué columnas del archivo se
+leen, con qué nombre quedan (alias de COLUMN_MAPPING) y con qué tipo. Las
+columnas que el sistema no usa no se leen, las numéricas quedan float64 (sin
+caer a object por un valor suelto) y conducta queda categórica.
+
+El archivo se lee por bloques de READ_BLOCK_ROWS filas: si faltan columnas
+críticas se rechaza antes de leer una sola fila, y un valor no numérico se
+rechaza en el bloque donde aparece, sin parsear el resto del archivo.
+"""
+import os
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Filas por bloque al leer el archivo original
+READ_BLOCK_ROWS = int(os.getenv("READ_BLOCK_ROWS", "50000"))
+
+# Alias de columnas (ya en minúsculas y sin espacios) → nombre del sistema
+COLUMN_MAPPING = {
+    'estudiante_id': 'estudiante_id',
+    'id_estudiante': 'estudiante_id',  # Por si viene con nombre alternativo
+    'id': 'estudiante_id',  # Otro posible nombre
+    'nota': 'nota_final',  # Exportaciones antiguas
+}
+
+# Columnas sin las que no se puede predecir
+CRITICAL_COLUMNS = ['nota_final', 'asistencia', 'inasistencia', 'conducta']
+
+# Tipos de lectura; nombre y fecha quedan como vienen (la fecha se parsea en la ingesta)
+NUMERIC_COLUMNS = ['nota_final', 'asistencia', 'inasistencia']
+CATEGORY_COLUMNS = ['conducta']
+ID_COLUMN = 'estudiante_id'
+
+
+class MalformedUploadError(ValueError):
+    """El archivo no tiene las columnas o los tipos que necesita el modelo"""
+
+
+class ReadPlan(NamedTuple):
+    positions: List[int]  # Posición en el archivo de cada columna que se lee
+    names: List[str]      # Nombre del sistema de cada una (mismo orden)
+    missing: List[str]    # Columnas esperadas (no críticas) que el archivo no trae
+
+
+def build_read_plan(header: Iterable, config: Dict) -> ReadPlan:
+    """
+    Plan de lectura para un archivo con este encabezado.
+
+    Si varias columnas del archivo corresponden a la misma columna del
+    sistema, gana la que tiene el nombre exacto y si no la primera.
+
+    Raises:
+        MalformedUploadError: si faltan columnas críticas
+    """
+    header = list(header)
+    wanted = list(config['expected_columns']) + [col for col in CRITICAL_COLUMNS if col not in config['expected_columns']]
+
+    chosen: Dict[str, Tuple[int, bool]] = {}
+    for position, raw in enumerate(header):
+        plain = str(raw).strip().lower()
+        name = COLUMN_MAPPING.get(plain, plain)
+        if name not in wanted:
+            continue
+        exact = plain == name
+        if name not in chosen or (exact and not chosen[name][1]):
+            chosen[name] = (position, exact)
+
+    missing_critical = [col for col in CRITICAL_COLUMNS if col not in chosen]
+    if missing_critical:
+        raise MalformedUploadError(
+            f"Faltan columnas críticas: {missing_critical}. Columnas del archivo: {[str(col) for col in header]}"
+        )
+
+    ordered = sorted(chosen.items(), key=lambda item: item[1][0])
+    return ReadPlan(
+        positions=[position for _, (position, _) in ordered],
+        names=[name for name, _ in ordered],
+        missing=[col for col in wanted if col not in chosen]
+    )
+
+
+def apply_read_plan(plan: ReadPlan, block: pd.DataFrame, start_row: int) -> pd.DataFrame:
+    """
+    Renombra un bloque ya recortado a las columnas del plan y convierte las
+    numéricas a float64.
+
+    Args:
+        block: Columnas del plan, en el mismo orden
+        start_row: Filas de datos anteriores a este bloque (para el mensaje de error)
+
+    Raises:
+        MalformedUploadError: si una columna numérica trae un valor que no es número
+    """
+    block = block.reset_index(drop=True)
+    block.columns = plan.names
+    for column in NUMERIC_COLUMNS + [ID_COLUMN]:
+        if column not in block.columns:
+            continue
+        valores = pd.to_numeric(block[column], errors='coerce')
+        invalidas = np.flatnonzero((valores.isna() & block[column].notna()).to_numpy())
+        if len(invalidas):
+            posicion = int(invalidas[0])
+            # +2: encabezado y filas contadas desde 1
+            raise MalformedUploadError(
+                f"Columna '{column}': valor no numérico {block[column].iloc[posicion]!r} "
+                f"en la fila {start_row + posicion + 2}"
+            )
+        block[column] = valores.astype(np.float64)
+    return block
+
+
+def finish_frame(plan: ReadPlan, blocks: List[pd.DataFrame]) -> pd.DataFrame:
+    """Une los bloques y deja los tipos compactos: conducta categórica e IDs enteros si están completos"""
+    if not blocks:
+        return pd.DataFrame({name: pd.Series(dtype=object) for name in plan.names})
+    df = pd.concat(blocks, ignore_index=True)
+
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns:
+            # Categorías como texto (igual que las lee el modelo con astype(str))
+            valores = df[column]
+            df[column] = valores.where(valores.isna(), valores.astype(str)).astype('category')
+
+    if ID_COLUMN in df.columns:
+        ids = df[ID_COLUMN]
+        if ids.notna().all() and (ids == np.floor(ids)).all():
+            df[ID_COLUMN] = pd.to_numeric(ids.astype(np.int64), downcast='integer')
+    return df
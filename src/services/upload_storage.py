@@ -0,0 +1,102 @@
+# src/services/upload_storage.py
+"""
+Almacenamiento comprimido de los archivos subidos.
+
+Los CSV se guardan en UPLOAD_DIR comprimidos con gzip (<hash>.csv.gz). Se
+comprimen mientras se copian desde la petición, sin una segunda pasada por
+el disco. La ingesta los lee sin cambios (pandas descomprime según la
+extensión) y la descarga del historial sirve los bytes comprimidos con
+Content-Encoding: gzip, o los descomprime para el cliente que no lo acepta.
+
+Los XLSX y los zip de las cargas por lotes ya vienen comprimidos: se guardan
+tal cual. Los archivos guardados antes sin comprimir se siguen leyendo; el
+script migrations/compress_uploads.py los comprime.
+"""
+import gzip
+import os
+from typing import BinaryIO, Iterator, Optional
+
+# gzip | none
+UPLOAD_COMPRESSION = os.getenv("UPLOAD_COMPRESSION", "gzip").lower()
+UPLOAD_GZIP_LEVEL = int(os.getenv("UPLOAD_GZIP_LEVEL", "6"))
+
+COMPRESSED_SUFFIX = ".gz"
+
+# Formatos que vale la pena comprimir (texto)
+COMPRESSIBLE_EXTENSIONS = (".csv",)
+
+# Bloque al descomprimir para una descarga
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def is_compressed(path: str) -> bool:
+    return path.lower().endswith(COMPRESSED_SUFFIX)
+
+
+def source_extension(path: str) -> str:
+    """Extensión del archivo original, sin el .gz del almacenamiento"""
+    if is_compressed(path):
+        path = path[:-len(COMPRESSED_SUFFIX)]
+    return os.path.splitext(path)[1].lower()
+
+
+def should_compress(extension: str) -> bool:
+    return UPLOAD_COMPRESSION == "gzip" and extension.lower() in COMPRESSIBLE_EXTENSIONS
+
+
+def open_for_write(path: str, compressed: bool) -> BinaryIO:
+    """Archivo de escritura binaria; con compressed, lo escrito se guarda con gzip"""
+    if compressed:
+        # mtime=0: el mismo contenido produce siempre los mismos bytes
+        return gzip.GzipFile(path, "wb", compresslevel=UPLOAD_GZIP_LEVEL, mtime=0)
+    return open(path, "wb")
+
+
+def open_stored(path: str) -> BinaryIO:
+    """Lectura binaria del contenido original, descomprimido si hace falta"""
+    return gzip.open(path, "rb") if is_compressed(path) else open(path, "rb")
+
+
+def iter_stored(path: str, chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> Iterator[bytes]:
+    """Contenido original por bloques (para una descarga sin Content-Encoding)"""
+    with open_stored(path) as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def resolve_stored_path(path: str) -> Optional[str]:
+    """
+    Ruta en disco del archivo guardado: la misma o su versión comprimida o sin
+    comprimir (una ruta anterior a la migración, o UPLOAD_COMPRESSION cambiado).
+    None si no existe ninguna.
+    """
+    if os.path.exists(path):
+        return path
+    other = path[:-len(COMPRESSED_SUFFIX)] if is_compressed(path) else path + COMPRESSED_SUFFIX
+    return other if os.path.exists(other) else None
+
+
+def compress_stored_file(path: str) -> str:
+    """
+    Escribe la versión gzip de un archivo ya guardado (<ruta>.gz) y devuelve
+    su ruta. El original no se borra: quien llama lo elimina cuando ya nada
+    apunta a él.
+    """
+    target = path + COMPRESSED_SUFFIX
+    tmp_path = f"{target}.{os.getpid()}.part"
+    try:
+        with open(path, "rb") as source, open_for_write(tmp_path, compressed=True) as destination:
+            while True:
+                chunk = source.read(DOWNLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                destination.write(chunk)
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return target
@@ -1,52 +1,59 @@
+import hashlib
 import os
+import re
+import uuid
+import zipfile
+import zlib
+from typing import List, NamedTuple, Optional
 from fastapi import UploadFile
-import pandas as pd
-from models import StudentData, ResultadoPrediccion
+from models import StudentData
 from config import SessionLocal
-from datetime import datetime
+from datetime import date, datetime
+import numpy as np
+import pandas as pd
+from services.bulk_loader import bulk_insert
+from services.executor_service import run_blocking
+from services.ingestion_service import load_upload_frame
+from services.prediction_run_service import clear_current_run
+from services.upload_history_service import UploadHistoryService
+from services.upload_storage import (
+    COMPRESSED_SUFFIX, open_for_write, resolve_stored_path, should_compress, source_extension
+)
+from utils.date_parser import parse_date_column
 
 # Usar la misma ruta que en main.py para consistencia
 UPLOAD_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "uploads"))
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-def excel_date_to_str(excel_date):
-    # Excel date serial number to datetime
-    try:
-        if isinstance(excel_date, str):
-            # Si ya es string, verificar si es una fecha válida
-            try:
-                datetime.strptime(excel_date, '%Y-%m-%d')
-                return excel_date
-            except:
-                try:
-                    datetime.strptime(excel_date, '%d/%m/%Y')
-                    # Convertir formato DD/MM/YYYY a YYYY-MM-DD
-                    dt = datetime.strptime(excel_date, '%d/%m/%Y')
-                    return dt.strftime('%Y-%m-%d')
-                except:
-                    return '2025-01-01'
-
-        # Si es número (formato Excel)
-        base_date = datetime(1899, 12, 30)
-        date = base_date + pd.to_timedelta(float(excel_date), unit='D')
-        return date.strftime('%Y-%m-%d')
-    except Exception:
-        return '2025-01-01'
+# Tamaño de cada bloque al copiar un archivo subido a disco
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+# Tamaño máximo aceptado por archivo subido
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_SIZE_MB", "50")) * 1024 * 1024)
+
+# Tamaño máximo de un zip de carga por lotes y de cada archivo que contiene
+MAX_BATCH_UPLOAD_BYTES = int(float(os.getenv("MAX_BATCH_UPLOAD_SIZE_MB", "200")) * 1024 * 1024)
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "100"))
+
+# Archivos del zip que se procesan (los demás se ignoran)
+BATCH_MEMBER_EXTENSIONS = ('.csv', '.xlsx')
+
+# Fecha para las filas sin fecha o con una fecha que no se pudo convertir
+FECHA_POR_DEFECTO = date(2025, 1, 1)
 
 def clear_previous_data():
     """
-    Función para limpiar todos los datos anteriores del dashboard
+    Función para limpiar los datos del dashboard.
+
+    Solo deja de mostrar la corrida de predicciones actual: los estudiantes de
+    student_data son de cada carga (ver load_student_data) y no se tocan, así
+    una carga no borra lo que otra está ingiriendo al mismo tiempo.
     """
     session = SessionLocal()
     try:
-        # Eliminar todos los registros de predicciones anteriores
-        deleted_predictions = session.query(ResultadoPrediccion).delete()
-
-        # Eliminar todos los datos de estudiantes anteriores
-        deleted_students = session.query(StudentData).delete()
-
-        session.commit()
-        print(f"✅ Datos limpiados: {deleted_predictions} predicciones, {deleted_students} estudiantes")
+        # Dejar de mostrar la corrida de predicciones actual (las viejas se borran en bloque)
+        deleted_predictions = clear_current_run(session)
+        print(f"✅ Datos limpiados: {deleted_predictions} predicciones")
 
     except Exception as e:
         session.rollback()
@@ -55,39 +62,236 @@ def clear_previous_data():
     finally:
         session.close()
 
-async def save_uploaded_file(file: UploadFile):
-    file_path = os.path.join(UPLOAD_DIR, file.filename)
+class UploadTooLargeError(Exception):
+    """El archivo subido supera el tamaño máximo permitido"""
 
-    with open(file_path, "wb") as f:
-        content = await file.read()
-        f.write(content)
 
-    # Procesar el CSV y guardar los datos en la base de datos
-    if file.filename.endswith('.csv'):
-        df = pd.read_csv(file_path)
-        session = SessionLocal()
-        for _, row in df.iterrows():
-            # Convertir fecha si es numérica
-            fecha_val = row.get('fecha', '2025-01-01')
-            if isinstance(fecha_val, (float, int)) or (isinstance(fecha_val, str) and fecha_val.replace('.', '', 1).isdigit()):
-                fecha_str = excel_date_to_str(fecha_val)
-            else:
-                fecha_str = str(fecha_val)
+class InvalidBatchError(ValueError):
+    """El zip de la carga por lotes no se puede abrir o no trae archivos válidos"""
+
+
+class SavedUpload(NamedTuple):
+    """Archivo subido ya escrito en UPLOAD_DIR"""
+    path: str
+    sha256: str
+    size: int
+    existing: bool  # El mismo contenido ya estaba guardado
+
+
+def _upload_extension(original_filename: str) -> str:
+    extension = os.path.splitext(original_filename or "")[1].lower()
+    return extension if re.fullmatch(r"\.[a-z0-9]{1,10}", extension) else ""
+
+
+def stored_upload_name(sha256: str, original_filename: str) -> str:
+    """
+    Nombre del archivo en UPLOAD_DIR: el hash del contenido con la extensión
+    original (la ingesta elige el lector por extensión), más .gz si el
+    formato se guarda comprimido. Dos archivos distintos con el mismo nombre
+    ya no se pisan, y el mismo archivo subido dos veces queda guardado una
+    sola vez.
+    """
+    extension = _upload_extension(original_filename)
+    suffix = COMPRESSED_SUFFIX if should_compress(extension) else ""
+    return f"{sha256}{extension}{suffix}"
+
+
+def _publish_upload(tmp_path: str, sha256: str, original_filename: str) -> tuple:
+    """
+    Mueve el temporal a su nombre definitivo (stored_upload_name). Si ese
+    contenido ya estaba guardado (comprimido o no) se descarta el temporal y
+    se conserva el existente, así su caché columnar sigue vigente.
+
+    Returns:
+        (ruta definitiva, True si ya existía)
+    """
+    file_path = os.path.join(UPLOAD_DIR, stored_upload_name(sha256, original_filename))
+    stored_path = resolve_stored_path(file_path)
+    if stored_path:
+        os.remove(tmp_path)
+        return stored_path, True
+    os.replace(tmp_path, file_path)
+    return file_path, False
+
+
+async def save_uploaded_file(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> SavedUpload:
+    """
+    Copia el archivo subido a UPLOAD_DIR en bloques de UPLOAD_CHUNK_SIZE,
+    calculando su SHA-256 sobre la marcha (y comprimiéndolo si su formato se
+    guarda comprimido). Nunca hay más de un bloque en memoria. Si supera
+    max_bytes se corta la copia y no queda nada en disco. El hash, el tamaño y
+    max_bytes se refieren al contenido original, sin comprimir.
+
+    El archivo se guarda con el nombre de stored_upload_name; si ese contenido
+    ya estaba guardado se conserva el existente (y su caché columnar).
+    """
+    limite_mb = max_bytes / (1024 * 1024)
+
+    # El tamaño ya conocido permite rechazar sin copiar nada
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLargeError(f"El archivo supera el tamaño máximo de {limite_mb:.0f} MB")
+
+    # Se escribe a un archivo temporal y se publica al final, cuando ya se
+    # conoce el hash: una carga cortada no deja nada con nombre definitivo
+    tmp_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open_for_write(tmp_path, should_compress(_upload_extension(file.filename))) as f:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(f"El archivo supera el tamaño máximo de {limite_mb:.0f} MB")
+                digest.update(chunk)
+                await run_blocking(f.write, chunk)
+
+        sha256 = digest.hexdigest()
+        file_path, existing = _publish_upload(tmp_path, sha256, file.filename)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return SavedUpload(file_path, sha256, size, existing)
+
+
+class BatchMember(NamedTuple):
+    """Archivo de un zip de carga por lotes, ya guardado en UPLOAD_DIR"""
+    original_filename: str  # Ruta dentro del zip
+    saved: SavedUpload
+
+
+def _is_batch_member(info: zipfile.ZipInfo) -> bool:
+    parts = info.filename.replace("\\", "/").split("/")
+    if info.is_dir() or "__MACOSX" in parts or parts[-1].startswith("."):
+        return False
+    return os.path.splitext(parts[-1])[1].lower() in BATCH_MEMBER_EXTENSIONS
+
+
+def extract_batch_members(zip_path: str, max_bytes: int = MAX_UPLOAD_BYTES) -> List[BatchMember]:
+    """
+    Guarda en UPLOAD_DIR cada CSV/XLSX del zip, igual que una carga individual
+    (nombre por hash, sin duplicar contenido ya guardado). Los archivos se
+    descomprimen en bloques de UPLOAD_CHUNK_SIZE y cada uno tiene el mismo
+    límite que una carga individual, contado sobre lo descomprimido (no sobre
+    lo que declara el zip).
+
+    Raises:
+        InvalidBatchError: si el zip está dañado, cifrado, vacío o trae demasiados archivos
+        UploadTooLargeError: si un archivo descomprimido supera max_bytes
+    """
+    limite_mb = max_bytes / (1024 * 1024)
+    try:
+        archive = zipfile.ZipFile(zip_path)
+    except zipfile.BadZipFile:
+        raise InvalidBatchError("El archivo no es un zip válido")
+
+    members: List[BatchMember] = []
+    with archive:
+        infos = [info for info in archive.infolist() if _is_batch_member(info)]
+        if not infos:
+            raise InvalidBatchError(f"El zip no contiene archivos {', '.join(BATCH_MEMBER_EXTENSIONS)}")
+        if len(infos) > MAX_BATCH_FILES:
+            raise InvalidBatchError(f"El zip contiene {len(infos)} archivos; el máximo es {MAX_BATCH_FILES}")
+
+        for info in infos:
+            if info.flag_bits & 0x1:
+                raise InvalidBatchError(f"'{info.filename}' está cifrado")
+            if info.file_size > max_bytes:
+                raise UploadTooLargeError(f"'{info.filename}' supera el tamaño máximo de {limite_mb:.0f} MB")
+
+            tmp_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}.part")
+            digest = hashlib.sha256()
+            size = 0
             try:
-                fecha_dt = datetime.strptime(fecha_str, '%Y-%m-%d')
-            except Exception:
-                fecha_dt = datetime(2025, 1, 1)
-            student = StudentData(
-                id_estudiante=int(row.get('estudiante_id', row.get('id', 0))),  # Cambiado a id_estudiante
-                nombre=str(row.get('nombre', '')),
-                nota_final=float(row.get('nota_final', row.get('nota', 0))),  # Agregado nota_final
-                asistencia=float(row.get('asistencia', 0)),
-                inasistencia=float(row.get('inasistencia', 0)),
-                conducta=str(row.get('conducta', '')),
-                fecha=fecha_dt.date()  # Agregar fecha al modelo
-            )
-            session.add(student)
-        session.commit()
-        session.close()
+                compressed = should_compress(_upload_extension(info.filename))
+                with archive.open(info) as source, open_for_write(tmp_path, compressed) as target:
+                    while True:
+                        chunk = source.read(UPLOAD_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        size += len(chunk)
+                        if size > max_bytes:
+                            raise UploadTooLargeError(
+                                f"'{info.filename}' supera el tamaño máximo de {limite_mb:.0f} MB"
+                            )
+                        digest.update(chunk)
+                        target.write(chunk)
+
+                sha256 = digest.hexdigest()
+                file_path, existing = _publish_upload(tmp_path, sha256, info.filename)
+            except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+                raise InvalidBatchError(f"No se pudo descomprimir '{info.filename}': {e}")
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+            members.append(BatchMember(info.filename, SavedUpload(file_path, sha256, size, existing)))
+
+    return members
+
+def load_student_data(file_path: str, sheet: Optional[str] = None, upload_id: Optional[int] = None) -> None:
+    """
+    Ingiere el archivo ya guardado (la hoja sheet si es XLSX) y carga sus
+    estudiantes en student_data con el upload_id de su carga.
 
-    return file_path
+    En la misma transacción reemplaza los estudiantes que esa carga tuviera
+    (un reintento no los duplica); las filas de otras cargas no se tocan. Las
+    cargas sin usuario (upload_id None) comparten el grupo sin carga y cada
+    una reemplaza a la anterior.
+    """
+    # Única lectura del archivo: queda normalizado, tipado y en caché columnar
+    # para el conteo, la predicción y las re-predicciones. Un archivo ya
+    # guardado antes (mismo contenido) se lee directo de su caché
+    df = load_upload_frame(file_path, sheet)
+
+    # Guardar los datos del CSV en la base de datos
+    if source_extension(file_path) == '.csv':
+        # La fecha ya viene convertida por la ingesta; las vacías o inválidas usan la fecha por defecto
+        if 'fecha' in df.columns:
+            fechas = parse_date_column(df['fecha'], FECHA_POR_DEFECTO).fechas.astype(object)
+        else:
+            fechas = np.full(len(df), FECHA_POR_DEFECTO, dtype=object)
+
+        # Con las columnas normalizadas el ID siempre llega como estudiante_id;
+        # las filas sin ID usan su posición + 1, igual que la predicción
+        ids = np.arange(1, len(df) + 1, dtype=np.int64)
+        if 'estudiante_id' in df.columns:
+            presentes = df['estudiante_id'].notna().to_numpy()
+            ids[presentes] = df['estudiante_id'][presentes].astype(np.int64).to_numpy()
+
+        def columna(nombre, por_defecto, tipo):
+            if nombre in df.columns:
+                return df[nombre].astype(tipo).to_numpy()
+            return np.full(len(df), por_defecto, dtype=tipo)
+
+        # Mismos valores que armaba el ORM fila por fila (str() de un vacío es 'nan'),
+        # con los nombres de columna de la tabla
+        students = pd.DataFrame({
+            'estudiante_id': ids,
+            'nombre': columna('nombre', '', str).astype(object),
+            'nota_final': columna('nota_final', 0.0, float),
+            'conducta': columna('conducta', '', str).astype(object),
+            'asistencia': columna('asistencia', 0.0, float),
+            'inasistencia': columna('inasistencia', 0.0, float),
+            'fecha': fechas,
+            'created_at': datetime.utcnow(),
+            'upload_id': upload_id
+        })
+
+        session = SessionLocal()
+        try:
+            replaced = UploadHistoryService.clear_upload_students(session, upload_id)
+            inserted = bulk_insert(session, StudentData.__table__, students)
+            session.commit()
+            print(f"✅ {inserted} estudiantes cargados en student_data"
+                  f"{f' (carga {upload_id})' if upload_id is not None else ''}"
+                  f"{f', {replaced} anteriores reemplazados' if replaced else ''}")
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
@@ -0,0 +1,220 @@
+# src/utils/date_parser.py
+"""
+Conversión vectorizada de columnas de fecha.
+
+Detecta el formato de la columna a partir de una muestra pequeña y convierte
+la columna completa de una sola vez. Formatos soportados:
+
+- DD/MM/YYYY (años de dos dígitos: < 50 → 20xx, el resto → 19xx)
+- ISO YYYY-MM-DD
+- Número de serie de Excel (días desde 1899-12-30)
+
+Las filas que no usan el formato detectado se prueban con los otros formatos
+(también por columna); solo las que ningún camino vectorizado acepta y tienen
+separador de fecha se revisan una a una con date()/strptime.
+"""
+from datetime import date, datetime
+from typing import NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+# Valores no vacíos que se miran para detectar el formato de la columna
+DATE_SAMPLE_SIZE = 100
+
+FORMATO_DMY = "dd/mm/yyyy"
+FORMATO_ISO = "yyyy-mm-dd"
+FORMATO_EXCEL = "excel"
+FORMATO_DATETIME = "datetime"
+
+EXCEL_EPOCH = np.datetime64("1899-12-30", "D")
+
+# Hasta 9 dígitos por parte: cabe en int64 sin desbordar; lo demás va al camino lento
+_DMY_PATTERN = r"^\s*([+-]?[0-9]{1,9})\s*/\s*([+-]?[0-9]{1,9})\s*/\s*([+-]?[0-9]{1,9})\s*$"
+_ISO_PATTERN = r"^([0-9]{4})-([0-9]{1,2})-([0-9]{1,2})$"
+
+# 2958465 días después de la época de Excel es 9999-12-31
+_EXCEL_MAX_SERIAL = 2958465
+
+
+class ParsedDates(NamedTuple):
+    """Resultado de parse_date_column"""
+    fechas: np.ndarray          # datetime64[D], con el valor por defecto en filas vacías o inválidas
+    invalidas: np.ndarray       # posiciones de las filas no vacías que no se pudieron convertir
+    formato: Optional[str]      # formato detectado en la muestra (None si la columna está vacía)
+
+
+def _from_parts(año: np.ndarray, mes: np.ndarray, dia: np.ndarray):
+    """
+    Arma fechas a partir de año, mes y día con la misma validación que date().
+
+    Returns:
+        (fechas datetime64[D], máscara de filas válidas)
+    """
+    validas = (año >= 1) & (año <= 9999) & (mes >= 1) & (mes <= 12) & (dia >= 1)
+    meses = np.where(validas, (año - 1970) * 12 + (mes - 1), 0).astype("datetime64[M]")
+    inicio = meses.astype("datetime64[D]")
+    dias_del_mes = ((meses + 1).astype("datetime64[D]") - inicio).astype(np.int64)
+    validas &= dia <= dias_del_mes
+    return inicio + np.where(validas, dia - 1, 0).astype("timedelta64[D]"), validas
+
+
+def _fixed_width_parts(texto: pd.Series, plantilla: str):
+    """
+    Camino rápido para el caso común de ancho fijo ("DD/MM/YYYY", "YYYY-MM-DD"):
+    compara los caracteres como enteros en NumPy, sin expresiones regulares.
+
+    Returns:
+        (máscara de filas con la forma exacta de la plantilla, {letra: valores})
+    """
+    ancho = len(plantilla)
+    codigos = texto.to_numpy().astype(f"U{ancho + 1}").view(np.uint32).reshape(len(texto), ancho + 1)
+    digitos = codigos.astype(np.int64) - ord("0")
+    es_digito = (digitos >= 0) & (digitos <= 9)
+
+    # Un carácter de más en la última columna significa que el valor es más largo
+    encontradas = codigos[:, ancho] == 0
+    valores = {}
+    for posicion, caracter in enumerate(plantilla):
+        if caracter.isalpha():
+            encontradas &= es_digito[:, posicion]
+            valores[caracter] = valores.get(caracter, 0) * 10 + digitos[:, posicion]
+        else:
+            encontradas &= codigos[:, posicion] == ord(caracter)
+    return encontradas, valores
+
+
+def _parse_parts(texto: pd.Series, plantilla: str, patron: str, orden: str):
+    """
+    Extrae año, mes y día: primero las filas con la forma exacta de la
+    plantilla y luego, con la expresión regular, las variantes (sin ceros a la
+    izquierda, espacios, años de dos dígitos).
+    """
+    encontradas, valores = _fixed_width_parts(texto, plantilla)
+    partes = {letra: np.where(encontradas, valores[letra], 0) for letra in orden}
+
+    resto = np.flatnonzero(~encontradas)
+    if len(resto):
+        extraidas = texto.iloc[resto].str.extract(patron)
+        completas = extraidas.notna().all(axis=1).to_numpy()
+        numeros = extraidas[completas].astype(np.int64).to_numpy()
+        for columna, letra in enumerate(orden):
+            partes[letra][resto[completas]] = numeros[:, columna]
+        encontradas[resto[completas]] = True
+    return encontradas, partes
+
+
+# Cada parser devuelve (fechas, válidas, reconocidas): reconocidas son las filas
+# con la forma del formato aunque la fecha no exista (31/02/2024); esas ya no
+# necesitan pasar por el camino lento
+
+def _parse_dmy(texto: pd.Series):
+    encontradas, partes = _parse_parts(texto, "DD/MM/YYYY", _DMY_PATTERN, "DMY")
+    año = partes["Y"]
+    año = np.where(año < 100, np.where(año < 50, 2000 + año, 1900 + año), año)
+    fechas, validas = _from_parts(año, partes["M"], partes["D"])
+    return fechas, validas & encontradas, encontradas
+
+
+def _parse_iso(texto: pd.Series):
+    encontradas, partes = _parse_parts(texto, "YYYY-MM-DD", _ISO_PATTERN, "YMD")
+    fechas, validas = _from_parts(partes["Y"], partes["M"], partes["D"])
+    return fechas, validas & encontradas, encontradas
+
+
+def _parse_excel(texto: pd.Series):
+    numeros = pd.to_numeric(texto, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    encontradas = np.isfinite(numeros) & (numeros >= 0) & (numeros < _EXCEL_MAX_SERIAL + 1)
+    dias = np.floor(np.where(encontradas, numeros, 0)).astype(np.int64)
+    return EXCEL_EPOCH + dias.astype("timedelta64[D]"), encontradas, encontradas
+
+
+_PARSERS = {
+    FORMATO_DMY: _parse_dmy,
+    FORMATO_ISO: _parse_iso,
+    FORMATO_EXCEL: _parse_excel,
+}
+
+
+def _parse_one(valor: str) -> date:
+    """Camino lento para las filas que el vectorizado rechazó (misma semántica que date()/strptime)"""
+    if "/" in valor:
+        dia, mes, año = (int(parte) for parte in valor.split("/"))
+        if año < 100:
+            año = 2000 + año if año < 50 else 1900 + año
+        return date(año, mes, dia)
+    return datetime.strptime(valor, "%Y-%m-%d").date()
+
+
+def detect_date_format(texto: pd.Series) -> Optional[str]:
+    """Formato más frecuente entre los primeros DATE_SAMPLE_SIZE valores no vacíos"""
+    muestra = texto.head(DATE_SAMPLE_SIZE)
+    if muestra.empty:
+        return None
+    conteos = {
+        FORMATO_DMY: int(muestra.str.contains("/", regex=False).sum()),
+        FORMATO_ISO: int(muestra.str.match(_ISO_PATTERN).sum()),
+        FORMATO_EXCEL: int(pd.to_numeric(muestra, errors="coerce").notna().sum()),
+    }
+    return max(conteos, key=conteos.get)
+
+
+def parse_date_column(valores, default: Optional[date]) -> ParsedDates:
+    """
+    Convierte una columna de fechas completa a datetime64[D].
+
+    Args:
+        valores: Serie o arreglo con la columna tal como se leyó (texto, números,
+                 mezcla o una columna ya convertida a datetime64)
+        default: Fecha para las filas vacías o que no se pudieron convertir
+                 (None las deja como NaT)
+
+    Returns:
+        ParsedDates con las fechas, las posiciones inválidas y el formato detectado
+    """
+    columna = pd.Series(valores).reset_index(drop=True)
+    fechas = np.full(len(columna), np.datetime64(default, "D"))
+
+    # Columna ya tipada (caché de ingesta o fechas reales de Excel): solo se rellenan los NaT
+    if pd.api.types.is_datetime64_any_dtype(columna):
+        convertidas = columna.to_numpy().astype("datetime64[D]")
+        presentes = ~np.isnat(convertidas)
+        fechas[presentes] = convertidas[presentes]
+        return ParsedDates(fechas, np.array([], dtype=np.int64), FORMATO_DATETIME)
+
+    no_vacias = columna.notna().to_numpy()
+    texto = columna[no_vacias].astype(str).str.strip()
+    # Los números leídos como float (45000.0) llegan como texto igual que en el CSV
+    texto = texto[texto != ""]
+    posiciones = texto.index.to_numpy()
+
+    formato = detect_date_format(texto)
+    if formato is None:
+        return ParsedDates(fechas, np.array([], dtype=np.int64), None)
+
+    # Primero el formato detectado sobre toda la columna; luego los demás solo
+    # sobre las filas que quedaron pendientes
+    pendientes = np.ones(len(texto), dtype=bool)
+    reconocidas = np.zeros(len(texto), dtype=bool)
+    for nombre in [formato] + [otro for otro in _PARSERS if otro != formato]:
+        if not pendientes.any():
+            break
+        indices = np.flatnonzero(pendientes)
+        convertidas, validas, con_forma = _PARSERS[nombre](texto.iloc[indices])
+        fechas[posiciones[indices[validas]]] = convertidas[validas]
+        pendientes[indices[validas]] = False
+        reconocidas[indices[con_forma]] = True
+
+    # Solo los valores con separador de fecha que ningún formato reconoció
+    # pueden resolverse en el camino lento
+    invalidas = posiciones[pendientes & reconocidas].tolist()
+    candidatas = np.flatnonzero(pendientes & ~reconocidas)
+    for indice, valor in zip(candidatas, texto.iloc[candidatas].tolist()):
+        try:
+            if "/" not in valor and "-" not in valor:
+                raise ValueError(valor)
+            fechas[posiciones[indice]] = np.datetime64(_parse_one(valor), "D")
+        except Exception:
+            invalidas.append(posiciones[indice])
+
+    return ParsedDates(fechas, np.sort(np.asarray(invalidas, dtype=np.int64)), formato)
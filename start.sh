@@ -41,6 +41,14 @@ else:
 }
 
 echo "✅ Base de datos lista"
+
+# Con MODEL_LOAD_MODE=mmap se exporta el modelo una sola vez antes de levantar
+# los workers; cada worker solo abre los archivos mapeados
+if [ "${MODEL_LOAD_MODE}" = "mmap" ]; then
+    echo "📦 Exportando modelo para memoria compartida..."
+    python -m models.model_registry export || echo "⚠️ No se pudo exportar, los workers cargarán con pickle"
+fi
+
 echo "🚀 Iniciando servidor FastAPI..."
 
 # Iniciar uvicorn
@@ -0,0 +1,316 @@
+"""
+Pruebas de concurrencia de la capa de ejecución (src/services/executor_service.py).
+
+Se mide la latencia de un endpoint liviano tipo dashboard mientras otro request
+puntúa un archivo grande con el modelo real. Con la capa de ejecución la
+latencia se mantiene plana; llamando al scoring directamente desde el handler
+async, el dashboard queda congelado hasta que termina.
+"""
+import asyncio
+import gzip
+import hashlib
+import io
+import os
+import sys
+import time
+import zipfile
+
+import httpx
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi import FastAPI, UploadFile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from services.executor_service import run_blocking, run_cpu_bound, run_cpu_bound_many, shutdown_executors
+from services.prediction_service import PredictionBatcher, predict_students
+
+LARGE_FILE_ROWS = 100_000
+POLL_INTERVAL = 0.02
+MAX_DASHBOARD_LATENCY = 0.25
+
+
+def score_large_file(n_rows: int, seed: int = 0) -> int:
+    """Puntúa un archivo sintético con el modelo activo (a nivel de módulo para el pool de procesos)"""
+    from models.predictor import score_dataframe
+
+    rng = np.random.default_rng(seed)
+    inasistencia = rng.uniform(0, 60, n_rows).round(1)
+    df = pd.DataFrame({
+        "estudiante_id": np.arange(1, n_rows + 1),
+        "nota_final": rng.integers(0, 21, n_rows).astype(float),
+        "asistencia": (100 - inasistencia).round(1),
+        "inasistencia": inasistencia,
+        "conducta": rng.choice(["positivo", "neutral", "agresivo"], n_rows),
+    })
+    resultados, _, _ = score_dataframe(df)
+    return len(resultados)
+
+
+def build_app(mode: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/dashboard-status")
+    async def dashboard_status():
+        return {"has_data": True}
+
+    @app.post("/predict")
+    async def predict(seed: int = 0):
+        if mode == "process":
+            total = await run_cpu_bound(score_large_file, LARGE_FILE_ROWS, seed)
+        else:
+            total = score_large_file(LARGE_FILE_ROWS, seed)
+        return {"total": total}
+
+    @app.post("/history")
+    async def history():
+        # Simula una escritura larga con SQLAlchemy
+        await run_blocking(time.sleep, 1.0)
+        return {"saved": True}
+
+    return app
+
+
+async def dashboard_latencies_during(app: FastAPI, path: str):
+    """Consulta el dashboard cada POLL_INTERVAL mientras corre el request pesado"""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver", timeout=120) as client:
+        await client.get("/dashboard-status")
+        latencies = []
+        stop = asyncio.Event()
+
+        async def poll():
+            # La latencia se cuenta desde que tocaba consultar: si el event loop
+            # está bloqueado, la espera para despertar también la sufre el usuario
+            due = time.perf_counter()
+            while True:
+                response = await client.get("/dashboard-status")
+                latencies.append(time.perf_counter() - due)
+                assert response.status_code == 200
+                if stop.is_set():
+                    break
+                due = time.perf_counter() + POLL_INTERVAL
+                await asyncio.sleep(POLL_INTERVAL)
+
+        poller = asyncio.create_task(poll())
+        await asyncio.sleep(0.1)
+
+        start = time.perf_counter()
+        response = await client.post(path)
+        heavy_seconds = time.perf_counter() - start
+        stop.set()
+        await poller
+
+    assert response.status_code == 200
+    return latencies, heavy_seconds
+
+
+@pytest.fixture(scope="module", autouse=True)
+def executors():
+    yield
+    shutdown_executors()
+
+
+def test_dashboard_latency_stays_flat_while_scoring_in_process_pool():
+    app = build_app("process")
+    latencies, heavy_seconds = asyncio.run(dashboard_latencies_during(app, "/predict"))
+
+    assert len(latencies) >= 10
+    assert max(latencies) < MAX_DASHBOARD_LATENCY, (max(latencies), heavy_seconds)
+
+
+def test_inline_scoring_blocks_dashboard():
+    # Control: sin la capa de ejecución el dashboard espera a que termine el scoring
+    app = build_app("inline")
+    latencies, heavy_seconds = asyncio.run(dashboard_latencies_during(app, "/predict?seed=1"))
+
+    assert max(latencies) > max(MAX_DASHBOARD_LATENCY, heavy_seconds / 2)
+
+
+def test_dashboard_latency_stays_flat_during_blocking_db_work():
+    app = build_app("process")
+    latencies, heavy_seconds = asyncio.run(dashboard_latencies_during(app, "/history"))
+
+    assert heavy_seconds >= 1.0
+    assert len(latencies) >= 10
+    assert max(latencies) < MAX_DASHBOARD_LATENCY
+
+
+def test_process_pool_returns_same_result_as_inline():
+    assert asyncio.run(run_cpu_bound(score_large_file, 500, 3)) == score_large_file(500, 3)
+
+
+def test_concurrent_single_predictions_are_batched():
+    rng = np.random.default_rng(4)
+    students = [
+        {
+            "nota_final": float(rng.integers(0, 21)),
+            "asistencia": float(rng.uniform(40, 100)),
+            "inasistencia": float(rng.uniform(0, 60)),
+            "conducta": str(rng.choice(["positivo", "neutral", "agresivo"])),
+        }
+        for _ in range(200)
+    ]
+    batcher = PredictionBatcher(window_ms=20, max_size=64)
+
+    async def predict_all():
+        return await asyncio.gather(*[batcher.predict(student) for student in students])
+
+    resultados = asyncio.run(predict_all())
+
+    assert resultados == [predict_students([student])[0] for student in students]
+    assert batcher.requests == len(students)
+    assert batcher.batches <= 4
+
+
+def test_streaming_upload_hashes_and_enforces_size_limit(tmp_path, monkeypatch):
+    import upload
+
+    monkeypatch.setattr(upload, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(upload, "UPLOAD_CHUNK_SIZE", 1024)
+    content = os.urandom(10_000)
+
+    saved = asyncio.run(upload.save_uploaded_file(
+        UploadFile(file=io.BytesIO(content), filename="notas.csv"), max_bytes=20_000
+    ))
+    assert saved.size == len(content)
+    assert saved.sha256 == hashlib.sha256(content).hexdigest()
+    # Los CSV quedan comprimidos; el hash y el tamaño son los del contenido original
+    with gzip.open(saved.path, "rb") as f:
+        assert f.read() == content
+    assert os.path.basename(saved.path) == f"{saved.sha256}.csv.gz"
+    assert not saved.existing
+
+    # El mismo contenido con otro nombre se reconoce por su hash y no se copia de nuevo
+    again = asyncio.run(upload.save_uploaded_file(
+        UploadFile(file=io.BytesIO(content), filename="copia.CSV"), max_bytes=20_000
+    ))
+    assert again.path == saved.path and again.existing
+
+    # Sin tamaño declarado, el límite se detecta durante la copia y no queda nada en disco
+    with pytest.raises(upload.UploadTooLargeError):
+        asyncio.run(upload.save_uploaded_file(
+            UploadFile(file=io.BytesIO(content), filename="grande.csv"), max_bytes=4096
+        ))
+    assert os.listdir(tmp_path) == [f"{saved.sha256}.csv.gz"]
+
+
+def test_read_plan_prunes_types_and_rejects_in_first_block(tmp_path, monkeypatch):
+    from services import ingestion_service, upload_schema
+
+    monkeypatch.setattr(ingestion_service, "READ_BLOCK_ROWS", 2)
+    path = tmp_path / "notas.csv"
+    pd.DataFrame({
+        "ID": [5, 6, 7],
+        "nota": [1.0, 2.0, 3.0],
+        " Nota_Final": [10.5, 11, 12],
+        "asistencia": [90, 80, 70],
+        "inasistencia": [1, 2, 3],
+        "conducta": ["positivo", None, "agresivo"],
+        "observaciones": ["a", "b", "c"],
+    }).to_csv(path, index=False)
+
+    # Solo las columnas del modelo, con el nombre exacto por encima del alias
+    df = ingestion_service.load_upload_frame(str(path))
+    assert list(df.columns) == ["estudiante_id", "nota_final", "asistencia", "inasistencia", "conducta"]
+    assert df["nota_final"].tolist() == [10.5, 11.0, 12.0]
+    assert df["asistencia"].dtype == np.float64
+    assert isinstance(df["conducta"].dtype, pd.CategoricalDtype)
+    assert df["conducta"].isna().tolist() == [False, True, False]
+
+    bad = tmp_path / "malo.csv"
+    bad.write_text("nota_final,asistencia,inasistencia,conducta\n10,90%,1,positivo\n" + "10,90,1,positivo\n" * 10)
+    with pytest.raises(upload_schema.MalformedUploadError, match="asistencia"):
+        ingestion_service.ingest_file(str(bad))
+
+    sin_conducta = tmp_path / "sin_conducta.csv"
+    sin_conducta.write_text("nota_final,asistencia,inasistencia\n10,90,1\n")
+    with pytest.raises(upload_schema.MalformedUploadError, match="conducta"):
+        ingestion_service.ingest_file(str(sin_conducta))
+
+
+def test_batch_zip_members_are_saved_and_scored_in_parallel(tmp_path, monkeypatch):
+    import upload
+
+    monkeypatch.setattr(upload, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(upload, "UPLOAD_CHUNK_SIZE", 1024)
+    csv = b"nota_final,asistencia,inasistencia,conducta\n" + b"10,90,1,positivo\n" * 500
+    zip_path = tmp_path / "lote.zip"
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("a.csv", csv)
+        archive.writestr("cursos/b.CSV", csv)
+        archive.writestr("__MACOSX/cursos/._b.CSV", b"x")
+        archive.writestr("leeme.txt", b"hola")
+
+    # Solo los CSV/XLSX, guardados por hash como una carga individual
+    members = upload.extract_batch_members(str(zip_path), max_bytes=len(csv))
+    assert [member.original_filename for member in members] == ["a.csv", "cursos/b.CSV"]
+    assert members[0].saved.path == members[1].saved.path
+    assert members[0].saved.sha256 == hashlib.sha256(csv).hexdigest()
+    assert not members[0].saved.existing and members[1].saved.existing
+
+    # El límite se cuenta sobre lo descomprimido
+    with pytest.raises(upload.UploadTooLargeError):
+        upload.extract_batch_members(str(zip_path), max_bytes=len(csv) - 1)
+    not_zip = tmp_path / "no_es.zip"
+    not_zip.write_bytes(csv)
+    with pytest.raises(upload.InvalidBatchError):
+        upload.extract_batch_members(str(not_zip))
+
+    # Resultados en orden; el archivo que falla no detiene a los demás
+    results = asyncio.run(run_cpu_bound_many(score_large_file, [(300, 1), (-1,), (200, 2)]))
+    assert results[0] == 300 and results[2] == 200
+    assert isinstance(results[1], ValueError)
+
+
+def test_blank_numeric_cell_is_scored_without_contributions(tmp_path):
+    from models.predictor import score_dataframe
+    from services.ingestion_service import load_upload_frame
+
+    path = tmp_path / "notas.csv"
+    path.write_text("estudiante_id,nota_final,asistencia,inasistencia,conducta\n1,,90,10,positivo\n2,15,80,20,regular\n")
+    df = load_upload_frame(str(path))
+    assert np.isnan(df["nota_final"].iloc[0])
+
+    # La fila con la nota vacía se predice igual, sin explicación
+    resultados, _, _ = score_dataframe(df)
+    assert len(resultados) == 2
+    assert 0.0 <= resultados[0]["probabilidad_desercion"] <= 1.0
+    assert resultados[0]["contributions"] is None and resultados[0]["risk_factors"] is None
+    assert resultados[1]["contributions"] is not None
+
+
+def test_student_data_is_read_only_from_the_current_run_upload(tmp_path):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from config import Base
+    from models import StudentData
+    from models.upload_history import UploadHistory
+    from services.prediction_run_service import clear_current_run, current_students, publish_run, start_run
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'student_data.db'}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        uploads = [UploadHistory(filename=f"{n}.csv", original_filename=f"{n}.csv", file_path=f"{n}.csv") for n in "ab"]
+        session.add_all(uploads)
+        session.flush()
+        # Dos cargas (de dos docentes) con el mismo estudiante
+        for upload, nota in zip(uploads, [8.0, 17.0]):
+            session.add(StudentData(upload_id=upload.id, id_estudiante=7, nombre="Ana", nota_final=nota,
+                                    conducta="positivo", asistencia=90, inasistencia=10))
+        session.commit()
+
+        run_id = start_run(session, "v1", upload_id=uploads[1].id)
+        publish_run(session, run_id, 1)
+        rows = current_students(session).filter(StudentData.id_estudiante == 7).all()
+        assert [(row.upload_id, row.nota_final) for row in rows] == [(uploads[1].id, 17.0)]
+
+        # Limpiar el dashboard también deja sin estudiantes
+        clear_current_run(session)
+        assert current_students(session).count() == 0
+    finally:
+        session.close()
+        engine.dispose()